@@ -0,0 +1,276 @@
+"""
+Benchmarks the message transformation pipeline without connecting to Twitch.
+
+Runs every stage (syllables_split, picking syllables, pluralising, casing, syllables_to_sentence) and the whole
+Bot.find_buttwords over the chat corpus, using stand-in Message objects, and prints the results as JSON so two
+commits can be compared.
+
+Usage (from the repo root):
+    python benchmarks/bench_pipeline.py [--iterations 20] [--corpus benchmarks/chat_corpus.jsonl] [--output out.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCHMARK_DIR), "src")
+sys.path.insert(0, SRC_DIR)
+
+# bot.load_config reads these, they only need to exist
+os.environ.setdefault("TMI_TOKEN", "oauth:benchmark")
+os.environ.setdefault("BOT_NICKNAME", "benchmark_bot")
+os.environ.setdefault("BOT_PREFIX", "!")
+
+# pylint: disable=wrong-import-position
+from buttify_funcs import get_message_content, load_dictionaries, match_capitalisation  # noqa: E402
+from plural_funcs import get_buttword_plural, get_word_plurals, is_plural_cache, plural_of_cache  # noqa: E402
+from selection_funcs import index_syllables, choose_syllables  # noqa: E402
+from syllable_funcs import syllables_split, syllables_to_sentence, hyphenation_cache  # noqa: E402
+
+CHANNEL = "benchmark_channel"
+
+
+def make_message(content: str, tags: dict, author: str = "benchmark_viewer"):
+    """Stand-in for twitchio's Message with just what the bot reads"""
+    async def send(_content: str):
+        pass
+
+    return SimpleNamespace(
+        content=content,
+        tags=dict(tags),
+        echo=False,
+        author=SimpleNamespace(name=author),
+        channel=SimpleNamespace(name=CHANNEL, send=send),
+    )
+
+
+def load_corpus(path: str) -> list[dict]:
+    with open(path, "r", encoding="utf8") as corpus_file:
+        return [json.loads(line) for line in corpus_file if line.strip()]
+
+
+def clear_caches():
+    for cache in (hyphenation_cache, is_plural_cache, plural_of_cache):
+        cache.clear()
+
+
+def time_stage(func, iterations: int) -> dict:
+    """Runs func() `iterations` times, returning the total and per-call times"""
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {
+        "total_seconds": sum(times),
+        "mean_seconds": sum(times) / len(times),
+        "min_seconds": times[0],
+        "median_seconds": times[len(times) // 2],
+    }
+
+
+def get_contents(corpus: list[dict]) -> list[str]:
+    # Same reply handling as the bot, so the stage timings see the same text
+    return [get_message_content(row["content"], row["tags"].get("reply-parent-display-name") is not None)
+            for row in corpus]
+
+
+def bench_stages(corpus: list[dict], iterations: int, per_sentence: int, min_spacing: int) -> dict:
+    contents = get_contents(corpus)
+    plurals = get_word_plurals(["butt"])
+    stages = {}
+
+    def split_all():
+        return [syllables_split(content) for content in contents]
+
+    # Cold: every word goes through pyphen, warm: the words are already cached
+    def split_cold():
+        hyphenation_cache.clear()
+        split_all()
+
+    stages["syllables_split_cold"] = time_stage(split_cold, iterations)
+    stages["syllables_split_warm"] = time_stage(split_all, iterations)
+
+    split = [lists for lists in split_all() if lists]
+
+    def select_all():
+        return [choose_syllables(index_syllables(lists), -(-len(lists) // per_sentence), min_spacing)
+                for lists in split]
+
+    stages["select_syllables"] = time_stage(select_all, iterations)
+
+    chosen = select_all()
+
+    def plural_all():
+        for lists, picks in zip(split, chosen):
+            for word, syllable in picks:
+                get_buttword_plural("butt", lists[word], syllable, plurals)
+
+    def casing_all():
+        for lists, picks in zip(split, chosen):
+            for word, syllable in picks:
+                match_capitalisation(lists[word][syllable], "butt")
+
+    stages["get_buttword_plural"] = time_stage(plural_all, iterations)
+    stages["match_capitalisation"] = time_stage(casing_all, iterations)
+    stages["syllables_to_sentence"] = time_stage(lambda: [syllables_to_sentence(lists) for lists in split],
+                                                 iterations)
+    return stages
+
+
+def make_bot(bot, work_dir: str):
+    """A Bot with default settings for the benchmark channel, its settings file lives in the temp dir"""
+    from channel_state import ChannelState  # pylint: disable=import-outside-toplevel
+    from settings_store import JsonSettingsStore  # pylint: disable=import-outside-toplevel
+
+    store = JsonSettingsStore(os.path.join(work_dir, "settings.json"), os.path.join(work_dir, "ignored.json"))
+    settings = store.load()
+    settings[CHANNEL] = ChannelState(CHANNEL)
+    butt_bot = bot.Bot(settings, set(), store)
+    # Normally worked out on a thread by warm_up once the bot is connected, or refresh_plurals for channels
+    # added after that
+    settings[CHANNEL].plurals = get_word_plurals(settings[CHANNEL].words)
+    return butt_bot
+
+
+def bench_find_buttwords(bot, messages: list, iterations: int) -> dict:
+    state = bot.channel_settings[CHANNEL]
+    replaced = 0
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for message in messages:
+            if bot.find_buttwords(message, state) is not False:
+                replaced += 1
+    elapsed = time.perf_counter() - start
+
+    count = len(messages) * iterations
+    return {
+        "messages": count,
+        "replaced": replaced,
+        "total_seconds": elapsed,
+        "messages_per_second": count / elapsed if elapsed else 0.0,
+        "mean_seconds_per_message": elapsed / count if count else 0.0,
+    }
+
+
+def bench_event_message(bot, messages: list, iterations: int) -> dict:
+    """
+    The whole of Bot.event_message at the channel's buttrate, including the fast path for most messages.
+    Commands are left out, twitchio can't parse them from the stand-in messages
+    """
+    messages = [message for message in messages if not message.content.startswith("!")]
+
+    async def run() -> float:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for message in messages:
+                await bot.event_message(message)
+        elapsed = time.perf_counter() - start
+        await bot.send_scheduler.close()
+        return elapsed
+
+    elapsed = asyncio.run(run())
+    count = len(messages) * iterations
+    return {
+        "messages": count,
+        "total_seconds": elapsed,
+        "messages_per_second": count / elapsed if elapsed else 0.0,
+        "fast_path_ratio": bot.fast_path_ratio,
+        "counts": dict(bot.message_stats),
+    }
+
+
+def measure_memory(bot, messages: list) -> dict:
+    """Peak Python memory allocated while buttifying the corpus once from cold caches"""
+    state = bot.channel_settings[CHANNEL]
+    clear_caches()
+    tracemalloc.start()
+    for message in messages:
+        bot.find_buttwords(message, state)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    memory = {"tracemalloc_peak_bytes": peak, "tracemalloc_retained_bytes": current}
+    try:
+        import resource  # pylint: disable=import-outside-toplevel
+        # KB on Linux, bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        memory["max_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    except ImportError:
+        pass
+    return memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(BENCHMARK_DIR, "chat_corpus.jsonl"))
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--log-level", default="WARNING",
+                        help="channel log level during the run (INFO includes the per-replacement lines)")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    random.seed(args.seed)
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    # Logs and settings go to a throwaway folder so the benchmark never touches the real ones
+    work_dir = tempfile.mkdtemp(prefix="gregbot-bench-")
+    os.chdir(work_dir)
+    os.makedirs("streamer_logs", exist_ok=True)
+
+    import bot  # pylint: disable=import-outside-toplevel
+    from logging_funcs import set_log_level  # pylint: disable=import-outside-toplevel
+    bot.load_config()
+    set_log_level(args.log_level)
+    # inflect and pyphen are loaded on first use, don't count that against the first stage
+    load_dictionaries()
+
+    stages = bench_stages(corpus, args.iterations, bot.BUTT_REPLACEMENT_PER_SENTENCE, bot.MIN_BUTT_SPACING)
+
+    butt_bot = make_bot(bot, work_dir)
+    messages = [make_message(row["content"], row["tags"]) for row in corpus]
+
+    clear_caches()
+    cold = bench_find_buttwords(butt_bot, messages, 1)
+    warm = bench_find_buttwords(butt_bot, messages, args.iterations)
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus": os.path.basename(args.corpus),
+        "corpus_messages": len(corpus),
+        "iterations": args.iterations,
+        "seed": args.seed,
+        "stages": stages,
+        "find_buttwords_cold": cold,
+        "find_buttwords": warm,
+        "event_message": bench_event_message(butt_bot, messages, args.iterations),
+        "memory": measure_memory(butt_bot, messages),
+        "caches": {
+            "hyphenation": hyphenation_cache.stats,
+            "is_plural": is_plural_cache.stats,
+            "plural_of": plural_of_cache.stats,
+        },
+    }
+
+    output = json.dumps(results, indent=4)
+    if output_path:
+        with open(output_path, "w", encoding="utf8") as output_file:
+            output_file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Benchmarks how long the bot takes to start: importing bot.py, then connecting and joining every channel against
+a local stand-in for Twitch's IRC server (see fake_irc.py), and loading inflect and pyphen in the background.
+
+Each run is a fresh Python process, so imports are timed cold, and the results are printed as JSON.
+
+Usage (from the repo root):
+    python benchmarks/bench_startup.py [--runs 5] [--channels 50] [--join-limit 1000] [--output out.json]
+"""
+import time
+
+# Everything is timed from here, as close to the start of the process as possible
+PROCESS_START = time.perf_counter()
+
+# pylint: disable=wrong-import-position
+import argparse  # noqa: E402
+import asyncio  # noqa: E402
+import json  # noqa: E402
+import os  # noqa: E402
+import platform  # noqa: E402
+import subprocess  # noqa: E402
+import sys  # noqa: E402
+import tempfile  # noqa: E402
+import threading  # noqa: E402
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCHMARK_DIR), "src")
+BOT_NICKNAME = "benchmark_bot"
+
+
+def since_start() -> float:
+    return time.perf_counter() - PROCESS_START
+
+
+def run_child(url: str, channels: int, timeout: float):
+    """One startup of the bot, run in its own process. Prints the timings as JSON"""
+    sys.path.insert(0, SRC_DIR)
+    work_dir = tempfile.mkdtemp(prefix="gregbot-startup-")
+    os.chdir(work_dir)
+    os.makedirs("streamer_logs", exist_ok=True)
+
+    marks = {"interpreter_seconds": since_start()}
+    import bot  # pylint: disable=import-outside-toplevel
+    import twitchio.websocket  # pylint: disable=import-outside-toplevel
+    from channel_state import ChannelState  # pylint: disable=import-outside-toplevel
+    from settings_store import JsonSettingsStore  # pylint: disable=import-outside-toplevel
+    marks["import_seconds"] = since_start() - marks["interpreter_seconds"]
+
+    bot.load_config()
+    twitchio.websocket.HOST = url
+    store = JsonSettingsStore("streamer_settings.json", "ignored.json")
+    settings = {f"channel_{i}": ChannelState(f"channel_{i}") for i in range(channels)}
+    settings[BOT_NICKNAME] = ChannelState(BOT_NICKNAME)
+
+    class StartupBot(bot.Bot):
+        def finish_if_done(self):
+            if "all_joined_seconds" in marks and "warmed_up_seconds" in marks:
+                asyncio.create_task(self.close())
+
+        async def event_ready(self):
+            marks["ready_seconds"] = since_start()
+            await super().event_ready()
+
+        def log_all_joined(self, joined: int, gave_up: int, seconds: float):
+            super().log_all_joined(joined, gave_up, seconds)
+            marks["all_joined_seconds"] = since_start()
+            marks["channels_joined"] = joined
+            self.finish_if_done()
+
+        async def warm_up(self):
+            await super().warm_up()
+            marks["warmed_up_seconds"] = since_start()
+            self.finish_if_done()
+
+    startup_bot = StartupBot(settings, set(), store)
+    marks["created_seconds"] = since_start()
+
+    async def start():
+        import aiohttp  # pylint: disable=import-outside-toplevel
+        # Skip validating the token with Twitch's API, the stand-in server takes any login
+        startup_bot._http.nick = BOT_NICKNAME  # pylint: disable=protected-access
+        startup_bot._http.user_id = 1  # pylint: disable=protected-access
+        startup_bot._http.session = aiohttp.ClientSession()  # pylint: disable=protected-access
+        await asyncio.wait_for(startup_bot.start(), timeout)
+
+    startup_bot.loop.run_until_complete(start())
+    print(json.dumps(marks))
+
+
+def run_server(ready: threading.Event, holder: dict):
+    from fake_irc import FakeTwitchIRC  # pylint: disable=import-outside-toplevel
+
+    async def serve():
+        server = holder["server"] = FakeTwitchIRC()
+        await server.start()
+        holder["loop"] = asyncio.get_running_loop()
+        holder["stop"] = asyncio.Event()
+        ready.set()
+        await holder["stop"].wait()
+        await server.stop()
+
+    asyncio.run(serve())
+
+
+def summarise(runs: list[dict]) -> dict:
+    summary = {}
+    for key in runs[0]:
+        values = sorted(run[key] for run in runs if key in run)
+        summary[key] = {"min": values[0], "median": values[len(values) // 2], "max": values[-1]}
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--channels", type=int, default=50)
+    parser.add_argument("--join-limit", type=int, default=1000,
+                        help="channels joined per 10 seconds (Twitch allows 20 unless the bot is verified)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds a single startup may take")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--child", metavar="URL", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.channels, args.timeout)
+        return
+
+    ready = threading.Event()
+    holder = {}
+    server_thread = threading.Thread(target=run_server, args=(ready, holder), daemon=True)
+    server_thread.start()
+    ready.wait()
+
+    env = dict(os.environ, TMI_TOKEN="oauth:benchmark", BOT_NICKNAME=BOT_NICKNAME, BOT_PREFIX="!",
+               JOIN_LIMIT=str(args.join_limit), JOIN_PERIOD="10", LOG_LEVEL="INFO", DEV="")
+    runs = []
+    for _ in range(args.runs):
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", holder["server"].url,
+                                "--channels", str(args.channels), "--timeout", str(args.timeout)],
+                               env=env, capture_output=True, text=True, check=True)
+        runs.append(json.loads(child.stdout.strip().splitlines()[-1]))
+
+    holder["loop"].call_soon_threadsafe(holder["stop"].set)
+    server_thread.join()
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "runs": args.runs,
+        "channels": args.channels,
+        "join_limit": args.join_limit,
+        "summary": summarise(runs),
+        "all_runs": runs,
+    }
+
+    output = json.dumps(results, indent=4)
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as output_file:
+            output_file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
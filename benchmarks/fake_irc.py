@@ -0,0 +1,141 @@
+"""
+A stand-in for Twitch's IRC websocket, with just enough of the protocol for twitchio to log in, join and leave
+channels, receive chat messages (see `send_message`) and send its own (see `on_privmsg`).
+
+Point twitchio at it by setting twitchio.websocket.HOST to `server.url` before the bot starts.
+"""
+import asyncio
+import itertools
+import time
+from typing import Callable
+from aiohttp import web, WSMsgType
+
+
+class FakeTwitchIRC:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.runner: web.AppRunner | None = None
+        # Channels joined, by connection, with time.time() when each was joined
+        self.joined: dict[web.WebSocketResponse, dict[str, float]] = {}
+        # Connections in each channel, to send chat messages to
+        self.channel_sockets: dict[str, set[web.WebSocketResponse]] = {}
+        self.join_count = 0
+        self.part_count = 0
+        self.connections = 0
+        # Called with (channel, content, time.perf_counter()) for every message the bot sends
+        self.on_privmsg: Callable[[str, str, float], None] | None = None
+        self.privmsg_count = 0
+        self.message_ids = itertools.count(1)
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}/"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        # Port 0 lets the OS pick a free one
+        self.port = self.runner.addresses[0][1]
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    async def handle(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.connections += 1
+        self.joined[ws] = {}
+        nick = "justinfan"
+
+        try:
+            async for message in ws:
+                if message.type != WSMsgType.TEXT:
+                    continue
+                for line in message.data.split("\r\n"):
+                    if not line:
+                        continue
+                    if line.startswith("NICK "):
+                        nick = line[5:].strip()
+                    await self.handle_line(ws, nick, line)
+        finally:
+            for channel in self.joined.pop(ws):
+                self.channel_sockets.get(channel, set()).discard(ws)
+        return ws
+
+    @property
+    def joined_channels(self) -> set[str]:
+        return {channel for channel, sockets in self.channel_sockets.items() if sockets}
+
+    async def send_message(self, channel: str, author: str, content: str, tags: dict | None = None) -> bool:
+        """
+        Send a chat message from `author` to every connection in the channel, with tags like Twitch's.
+        Returns False if no connection is in the channel
+        """
+        sockets = self.channel_sockets.get(channel)
+        if not sockets:
+            return False
+
+        all_tags = {
+            "badge-info": "", "badges": "", "color": "", "display-name": author, "emotes": "", "first-msg": "0",
+            "flags": "", "id": str(next(self.message_ids)), "mod": "0", "room-id": "1", "subscriber": "0",
+            "tmi-sent-ts": str(int(time.time() * 1000)), "turbo": "0", "user-id": "2", "user-type": "",
+        }
+        all_tags.update(tags or {})
+        line = (f"@{';'.join(f'{key}={value}' for key, value in all_tags.items())} "
+                f":{author}!{author}@{author}.tmi.twitch.tv PRIVMSG #{channel} :{content}")
+        for ws in list(sockets):
+            await ws.send_str(line)
+        return True
+
+    async def handle_line(self, ws: web.WebSocketResponse, nick: str, line: str):
+        command, _, rest = line.partition(" ")
+        if command == "NICK":
+            await ws.send_str("\r\n".join(
+                f":tmi.twitch.tv {code} {nick} :{text}"
+                for code, text in (("001", "Welcome, GLHF!"), ("002", "Your host is tmi.twitch.tv"),
+                                   ("003", "This server is rather new"), ("004", "-"), ("375", "-"),
+                                   ("372", "You are in a maze of twisty passages, all alike."), ("376", ">"))))
+        elif command == "CAP":
+            await ws.send_str(f":tmi.twitch.tv CAP * ACK :{rest.partition(':')[2]}")
+        elif command == "PING":
+            await ws.send_str(f"PONG :{rest.lstrip(':')}")
+        elif command == "JOIN":
+            for channel in rest.strip().lstrip("#").split(",#"):
+                self.joined[ws][channel] = time.time()
+                self.channel_sockets.setdefault(channel, set()).add(ws)
+                self.join_count += 1
+                await ws.send_str(
+                    f":{nick}!{nick}@{nick}.tmi.twitch.tv JOIN #{channel}\r\n"
+                    f":{nick}.tmi.twitch.tv 353 {nick} = #{channel} :{nick}\r\n"
+                    f":{nick}.tmi.twitch.tv 366 {nick} #{channel} :End of /NAMES list")
+        elif command == "PART":
+            channel = rest.strip().lstrip("#")
+            self.joined[ws].pop(channel, None)
+            self.channel_sockets.get(channel, set()).discard(ws)
+            self.part_count += 1
+            await ws.send_str(f":{nick}!{nick}@{nick}.tmi.twitch.tv PART #{channel}")
+        elif command == "PRIVMSG":
+            channel, _, content = rest.partition(" ")
+            self.privmsg_count += 1
+            if self.on_privmsg is not None:
+                self.on_privmsg(channel.lstrip("#"), content[1:] if content.startswith(":") else content,
+                                time.perf_counter())
+
+
+async def serve_forever(host: str = "127.0.0.1", port: int = 6667):
+    server = FakeTwitchIRC(host, port)
+    await server.start()
+    print(f"Fake Twitch IRC listening on {server.url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve_forever())
@@ -0,0 +1,305 @@
+"""
+Load tests the bot end to end against a local stand-in for Twitch's IRC server (see fake_irc.py).
+
+The bot runs in its own process with --channels channels. Once it has warmed up and joined them all, chat is
+sent to random channels at --rate messages per second per channel for --duration seconds: lines from the chat
+corpus, some as replies, some commands, and (with --churn-interval) channels joining and leaving through
+!join/!leave.
+
+Every chat message ends in an id, which buttifying never touches, so each buttified message the bot sends is
+matched to the message it came from for the latency. Prints, as JSON: messages sent and seen by the bot,
+butts and other replies, latency percentiles, what the bot dropped, and the bot process's CPU and memory.
+
+Usage (from the repo root):
+    python benchmarks/load_test.py [--channels 100] [--rate 0.5] [--duration 30] [--output out.json]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCHMARK_DIR), "src")
+BOT_NICKNAME = "loadtest_bot"
+# Commands sent as part of the chat, replies to them aren't timed
+COMMANDS = ("!hello", "!buttrate", "!buttword", "!factory 3")
+# Seconds a chat message is kept waiting for a butt before it's counted as not buttified
+MATCH_WINDOW = 60.0
+
+sys.path.insert(0, SRC_DIR)
+# pylint: disable=wrong-import-position
+from send_funcs import DEFAULT_GLOBAL_LIMIT, DEFAULT_GLOBAL_PERIOD, DEFAULT_CHANNEL_LIMIT, \
+    DEFAULT_CHANNEL_PERIOD  # noqa: E402
+
+
+def channel_name(index: int) -> str:
+    return f"load_channel_{index}"
+
+
+def run_child(url: str, channels: int, buttrate: int):
+    """The bot under test, run in its own process until it gets SIGTERM. Prints its counters as JSON"""
+    work_dir = tempfile.mkdtemp(prefix="gregbot-load-")
+    os.chdir(work_dir)
+    os.makedirs("streamer_logs", exist_ok=True)
+
+    import bot  # pylint: disable=import-outside-toplevel
+    import twitchio.websocket  # pylint: disable=import-outside-toplevel
+    from channel_state import ChannelState  # pylint: disable=import-outside-toplevel
+    from settings_store import JsonSettingsStore  # pylint: disable=import-outside-toplevel
+
+    bot.load_config()
+    twitchio.websocket.HOST = url
+    store = JsonSettingsStore("streamer_settings.json", "ignored.json")
+    settings = {channel_name(i): ChannelState(channel_name(i), rate=buttrate) for i in range(channels)}
+    settings[BOT_NICKNAME] = ChannelState(BOT_NICKNAME)
+
+    class LoadTestBot(bot.Bot):
+        async def warm_up(self):
+            await super().warm_up()
+            # Tells the load test it can start, loading inflect and pyphen would otherwise be counted against it
+            print("warmed up", flush=True)
+
+    load_bot = LoadTestBot(settings, set(), store)
+
+    async def start():
+        import aiohttp  # pylint: disable=import-outside-toplevel
+        # Skip validating the token with Twitch's API, the stand-in server takes any login
+        load_bot._http.nick = BOT_NICKNAME  # pylint: disable=protected-access
+        load_bot._http.user_id = 1  # pylint: disable=protected-access
+        load_bot._http.session = aiohttp.ClientSession()  # pylint: disable=protected-access
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(load_bot.close()))
+        await load_bot.start()
+
+    load_bot.loop.run_until_complete(start())
+    print(json.dumps({
+        "message_stats": load_bot.message_stats,
+        "send": load_bot.send_scheduler.stats,
+        "worker_pool": load_bot.worker_pool.stats if load_bot.worker_pool is not None else None,
+        "join": load_bot.join_scheduler.stats,
+    }))
+
+
+def cpu_seconds(pid: int) -> float | None:
+    """CPU time used so far by a process, None where /proc isn't available"""
+    try:
+        with open(f"/proc/{pid}/stat", "r", encoding="utf8") as stat_file:
+            fields = stat_file.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    # utime and stime, in clock ticks
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {}
+    values = sorted(values)
+    pick = lambda fraction: values[min(int(len(values) * fraction), len(values) - 1)]  # noqa: E731
+    return {"p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": values[-1],
+            "mean": sum(values) / len(values)}
+
+
+async def wait_for_joins(server, channels: set[str], timeout: float):
+    deadline = time.monotonic() + timeout
+    while not channels <= server.joined_channels:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"The bot only joined {len(server.joined_channels)} of {len(channels)} channels")
+        await asyncio.sleep(0.05)
+
+
+async def generate_load(server, args, corpus: list[str]) -> dict:
+    """Send chat for args.duration seconds, then wait args.drain seconds for the last replies"""
+    rng = random.Random(args.seed)
+    channels = [channel_name(i) for i in range(args.channels)]
+    message_ids = itertools.count(1)
+    # When each timed message was sent, by id, oldest first
+    sent_at: dict[int, float] = {}
+    latencies: list[float] = []
+    counts = {"chat_sent": 0, "commands_sent": 0, "replies_sent": 0, "churn_joins": 0, "churn_leaves": 0,
+              "butts_received": 0, "other_received": 0}
+
+    def on_privmsg(_channel: str, content: str, now: float):
+        last_word = content.rsplit(" ", 1)[-1]
+        if last_word.isdigit() and int(last_word) in sent_at:
+            latencies.append(now - sent_at.pop(int(last_word)))
+            counts["butts_received"] += 1
+        else:
+            counts["other_received"] += 1
+
+    server.on_privmsg = on_privmsg
+    total_rate = args.rate * args.channels
+    churned: list[str] = []
+    churn_ids = itertools.count(1)
+    start = time.perf_counter()
+    next_churn = start + args.churn_interval
+    sent = 0
+
+    while (now := time.perf_counter()) - start < args.duration:
+        # Catch up to where the rate says we should be, so slow sends don't lower the rate
+        due = int((now - start) * total_rate) - sent
+        for _ in range(due):
+            sent += 1
+            roll = rng.random()
+            author = f"viewer_{rng.randrange(1000)}"
+            if roll < args.command_ratio:
+                await server.send_message(rng.choice(channels), author, rng.choice(COMMANDS))
+                counts["commands_sent"] += 1
+                continue
+
+            message_id = next(message_ids)
+            content = f"{rng.choice(corpus)} {message_id}"
+            tags = {}
+            if roll < args.command_ratio + args.reply_ratio:
+                tags = {"reply-parent-display-name": "Someone", "reply-parent-msg-body": "hi",
+                        "reply-parent-msg-id": "1", "reply-parent-user-id": "3", "reply-parent-user-login": "someone"}
+                content = f"@Someone {content}"
+                counts["replies_sent"] += 1
+            sent_at[message_id] = time.perf_counter()
+            await server.send_message(rng.choice(channels), author, content, tags)
+            counts["chat_sent"] += 1
+
+        if args.churn_interval and now >= next_churn:
+            # A new streamer joins from the bot's channel, and the one before the last leaves
+            streamer = f"churn_{next(churn_ids)}"
+            await server.send_message(BOT_NICKNAME, streamer, "!join")
+            churned.append(streamer)
+            counts["churn_joins"] += 1
+            if len(churned) > 1:
+                await server.send_message(BOT_NICKNAME, churned.pop(0), "!leave")
+                counts["churn_leaves"] += 1
+            next_churn += args.churn_interval
+
+        # Messages that weren't buttified in time never will be, don't keep them forever
+        while sent_at and now - next(iter(sent_at.values())) > MATCH_WINDOW:
+            sent_at.pop(next(iter(sent_at)))
+
+        await asyncio.sleep(0.01)
+
+    await asyncio.sleep(args.drain)
+    server.on_privmsg = None
+    counts["offered_messages_per_second"] = sent / args.duration
+    counts["butt_latency_seconds"] = percentiles(latencies)
+    return counts
+
+
+def run_server(ready: threading.Event, holder: dict):
+    from fake_irc import FakeTwitchIRC  # pylint: disable=import-outside-toplevel
+
+    async def serve():
+        server = holder["server"] = FakeTwitchIRC()
+        await server.start()
+        holder["loop"] = asyncio.get_running_loop()
+        holder["stop"] = asyncio.Event()
+        ready.set()
+        await holder["stop"].wait()
+        await server.stop()
+
+    asyncio.run(serve())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=0.5, help="chat messages per second in each channel")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to send chat for")
+    parser.add_argument("--drain", type=float, default=5.0, help="seconds to wait for replies after the chat stops")
+    parser.add_argument("--buttrate", type=int, default=30, help="every channel's buttrate")
+    parser.add_argument("--reply-ratio", type=float, default=0.1, help="fraction of messages sent as replies")
+    parser.add_argument("--command-ratio", type=float, default=0.02, help="fraction of messages that are commands")
+    parser.add_argument("--churn-interval", type=float, default=5.0,
+                        help="seconds between a channel joining and another leaving (0 turns it off)")
+    parser.add_argument("--send-global-limit", type=int, default=DEFAULT_GLOBAL_LIMIT)
+    parser.add_argument("--send-global-period", type=float, default=DEFAULT_GLOBAL_PERIOD)
+    parser.add_argument("--send-channel-limit", type=int, default=DEFAULT_CHANNEL_LIMIT)
+    parser.add_argument("--send-channel-period", type=float, default=DEFAULT_CHANNEL_PERIOD)
+    parser.add_argument("--join-limit", type=int, default=1000,
+                        help="channels joined per 10 seconds (Twitch allows 20 unless the bot is verified)")
+    parser.add_argument("--worker-mode", default="", help="BUTT_WORKER_MODE for the bot (thread or process)")
+    parser.add_argument("--join-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--child", metavar="URL", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.channels, args.buttrate)
+        return
+
+    with open(os.path.join(BENCHMARK_DIR, "chat_corpus.jsonl"), "r", encoding="utf8") as corpus_file:
+        corpus = [json.loads(line)["content"] for line in corpus_file if line.strip()]
+    corpus = [content for content in corpus if not content.startswith("!")]
+
+    ready = threading.Event()
+    holder = {}
+    server_thread = threading.Thread(target=run_server, args=(ready, holder), daemon=True)
+    server_thread.start()
+    ready.wait()
+    server = holder["server"]
+
+    def on_server(coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, holder["loop"]).result()
+
+    env = dict(os.environ, TMI_TOKEN="oauth:loadtest", BOT_NICKNAME=BOT_NICKNAME, BOT_PREFIX="!", DEV="",
+               LOG_LEVEL="INFO", JOIN_LIMIT=str(args.join_limit), JOIN_PERIOD="10",
+               SEND_GLOBAL_LIMIT=str(args.send_global_limit), SEND_GLOBAL_PERIOD=str(args.send_global_period),
+               SEND_CHANNEL_LIMIT=str(args.send_channel_limit), SEND_CHANNEL_PERIOD=str(args.send_channel_period),
+               BUTT_WORKER_MODE=args.worker_mode)
+    child = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child", server.url,  # pylint: disable=consider-using-with
+                              "--channels", str(args.channels), "--buttrate", str(args.buttrate)],
+                             env=env, stdout=subprocess.PIPE, text=True)
+
+    try:
+        if child.stdout.readline().strip() != "warmed up":
+            raise RuntimeError("The bot stopped before it was ready")
+        on_server(wait_for_joins(server, {channel_name(i) for i in range(args.channels)} | {BOT_NICKNAME},
+                                 args.join_timeout))
+        cpu_before = cpu_seconds(child.pid)
+        load = on_server(generate_load(server, args, corpus))
+        cpu_after = cpu_seconds(child.pid)
+    finally:
+        child.send_signal(signal.SIGTERM)
+        stdout, _ = child.communicate(timeout=60)
+        holder["loop"].call_soon_threadsafe(holder["stop"].set)
+        server_thread.join()
+
+    bot_stats = json.loads(stdout.strip().splitlines()[-1])
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    bot_process = {
+        # Linux gives ru_maxrss in KiB, macOS in bytes
+        "peak_rss_bytes": usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024),
+        "total_cpu_seconds": usage.ru_utime + usage.ru_stime,
+    }
+    if cpu_before is not None and cpu_after is not None:
+        bot_process["load_cpu_seconds"] = cpu_after - cpu_before
+        bot_process["load_cpu_percent"] = (cpu_after - cpu_before) / (args.duration + args.drain) * 100
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("child", "output")},
+        "load": load,
+        "bot_seen_messages": bot_stats["message_stats"]["messages"],
+        "bot": bot_stats,
+        "bot_process": bot_process,
+    }
+
+    output = json.dumps(results, indent=4)
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as output_file:
+            output_file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,40 @@
-import math
+import asyncio
+import logging
 import os
-import random
-import json
+import sqlite3
+import time
 from typing import Dict
 from dotenv import load_dotenv
 from twitchio import Message
 from twitchio.ext import commands  # type: ignore
-from json_funcs import modify_streamer_settings, modify_streamer_values, add_ignore_list, remove_ignore_list, open_file
-from ignore_these_words import IGNORE_WORDS
-from logging_funcs import get_logger_for_channel
-from other_bot_funcs import in_bot_channel
-from plural_funcs import get_buttword_plural,  get_syllables_no_punctuation
-from regex_funcs import is_punctuation
-from syllable_funcs import syllables_split, syllables_to_sentence
-
-# Create a folder for logs if it doesn't exist
-if not os.path.exists("streamer_logs"):
-    os.makedirs("streamer_logs")
-
-# Load up the .env files
-load_dotenv()
-bot_access_token = os.environ.get('TMI_TOKEN')
-bot_nickname = os.environ.get('BOT_NICKNAME').lower()
-bot_prefix = os.environ.get('BOT_PREFIX')
-DEVMODE = os.environ.get("DEV")
-IS_BOT_DEV = DEVMODE is not None and DEVMODE != ""
+import buttify_funcs
+from buttify_funcs import ButtJob, ButtResult, get_emote_names, get_message_content, load_dictionaries, run_job
+from join_funcs import JoinScheduler, DEFAULT_JOIN_LIMIT, DEFAULT_JOIN_PERIOD
+from logging_funcs import LOG_DIR, get_logger_for_channel, last_logged, set_log_level, start_background_logging, \
+    stop_background_logging, set_log_file_limits, LOG_ROTATE_MODES, DEFAULT_LOG_ROTATE, DEFAULT_LOG_MAX_BYTES, \
+    DEFAULT_MAX_OPEN_LOGS, DEFAULT_LOG_CHANNEL_QUOTA, DEFAULT_LOG_TOTAL_QUOTA
+from channel_state import ChannelState
+from copypasta_funcs import RepeatWindow, COPYPASTA_POLICIES, DEFAULT_COPYPASTA_POLICY, DEFAULT_COPYPASTA_WINDOW, \
+    DEFAULT_COPYPASTA_SECONDS, DEFAULT_COPYPASTA_THRESHOLD
+from ignore_these_words import KNOWN_BOTS
+from metrics_funcs import Histogram, MetricsServer, DEFAULT_METRICS_HOST
+from other_bot_funcs import in_bot_channel, messages_until_butt
+from profile_funcs import Profiler, parse_profile_modes, time_stages, DEFAULT_PROFILE_SECONDS
+from plural_funcs import get_word_plurals
+from settings_store import SettingsStore, create_settings_store, DEFAULT_RELOAD_INTERVAL
+from shard_funcs import ShardRouter, ConnectionShardRouter, ProcessShardRouter, run_shard_processes
+from syllable_funcs import syllables_to_sentence, hyphenation_cache, HYPHENATION_CACHE_SIZE
+from send_funcs import SendScheduler, COMMAND_PRIORITY, BUTT_PRIORITY, DEFAULT_GLOBAL_LIMIT, \
+    DEFAULT_GLOBAL_PERIOD, DEFAULT_CHANNEL_LIMIT, DEFAULT_CHANNEL_PERIOD, DEFAULT_BUTT_DEADLINE
+from worker_funcs import ButtWorkerPool, DEFAULT_MAX_PENDING
+from word_list_funcs import MAX_RANDOM_WORDS, MAX_WORD_LENGTH, MAX_WORD_WEIGHT
 
 # JSON containing settings for each streamer
 JSON_DATA_PATH = "streamer_settings.json"
 # JSON containing list of ignored users
 IGNORED_LIST_PATH = "ignored.json"
+# SQLite database used instead of the JSON files when SETTINGS_BACKEND=sqlite
+SETTINGS_DB_PATH = "streamer_settings.db"
 
 # butts per __ words in a message
 BUTT_REPLACEMENT_PER_SENTENCE = 10
@@ -37,18 +42,180 @@ BUTT_REPLACEMENT_PER_SENTENCE = 10
 UPPER_LIMIT_BUTTRATE = 1000
 # lowest possible buttrate
 LOWER_LIMIT_BUTTRATE = 10
-# attempts to find a replacement in a message before fail
-MAX_WORD_ATTEMPTS = 10
-# default streamer settings
-DEFAULT_BUTT_INFO = {"rate": 30, "word": "butt", "random_words_enabled": False, "random_words_list": []}
+# minimum distance in words between two butts in a message (1 allows neighbouring words, 2 leaves a word between)
+MIN_BUTT_SPACING = 2
+
+# Read from the environment by load_config(), which has to be called before the bot is created
+bot_access_token = None
+bot_nickname = None
+bot_prefix = None
+DEVMODE = None
+IS_BOT_DEV = None
+SETTINGS_BACKEND = None
+HYPHENATION_CACHE = None
+BUTT_WORKER_MODE = None
+BUTT_WORKERS = None
+BUTT_QUEUE_SIZE = None
+SEND_GLOBAL_LIMIT = None
+SEND_GLOBAL_PERIOD = None
+SEND_CHANNEL_LIMIT = None
+SEND_CHANNEL_PERIOD = None
+BUTT_SEND_DEADLINE = None
+LOG_LEVEL = None
+LOG_MODE = None
+JOIN_LIMIT = None
+JOIN_PERIOD = None
+SHARD_COUNT = None
+SHARD_MODE = None
+METRICS_PORT = None
+METRICS_HOST = None
+BOT_PROFILE = None
+PROFILE_SECONDS = None
+SETTINGS_RELOAD_INTERVAL = None
+COPYPASTA_POLICY = None
+COPYPASTA_WINDOW = None
+COPYPASTA_SECONDS = None
+COPYPASTA_THRESHOLD = None
+LOG_FILE_LIMITS = None
+
+
+def load_config():
+    """Read the bot's settings from the environment, after loading the .env file into it"""
+    # pylint: disable=global-statement
+    global bot_access_token, bot_nickname, bot_prefix, DEVMODE, IS_BOT_DEV, SETTINGS_BACKEND, HYPHENATION_CACHE, \
+        BUTT_WORKER_MODE, BUTT_WORKERS, BUTT_QUEUE_SIZE, SEND_GLOBAL_LIMIT, SEND_GLOBAL_PERIOD, SEND_CHANNEL_LIMIT, \
+        SEND_CHANNEL_PERIOD, BUTT_SEND_DEADLINE, LOG_LEVEL, LOG_MODE, JOIN_LIMIT, JOIN_PERIOD, SHARD_COUNT, \
+        SHARD_MODE, METRICS_PORT, METRICS_HOST, BOT_PROFILE, PROFILE_SECONDS, SETTINGS_RELOAD_INTERVAL, \
+        COPYPASTA_POLICY, COPYPASTA_WINDOW, COPYPASTA_SECONDS, COPYPASTA_THRESHOLD, LOG_FILE_LIMITS
+    # Load up the .env files
+    load_dotenv()
+    bot_access_token = os.environ.get('TMI_TOKEN')
+    bot_nickname = os.environ.get('BOT_NICKNAME').lower()
+    bot_prefix = os.environ.get('BOT_PREFIX')
+    DEVMODE = os.environ.get("DEV")
+    IS_BOT_DEV = DEVMODE is not None and DEVMODE != ""
+
+    # Where settings are kept, "json" (default) or "sqlite"
+    SETTINGS_BACKEND = os.environ.get("SETTINGS_BACKEND") or "json"
+    # Number of words to keep the syllables of in memory (0 turns the cache off)
+    HYPHENATION_CACHE = int(os.environ.get("HYPHENATION_CACHE_SIZE") or HYPHENATION_CACHE_SIZE)
+    # Buttify messages on a "thread" or "process" pool instead of the event loop (off when empty)
+    BUTT_WORKER_MODE = os.environ.get("BUTT_WORKER_MODE") or ""
+    # Number of workers in the pool (empty for the default: 1 thread, or a process per core)
+    BUTT_WORKERS = int(os.environ.get("BUTT_WORKERS") or 0) or None
+    # Messages allowed to wait for the pool before new ones are dropped
+    BUTT_QUEUE_SIZE = int(os.environ.get("BUTT_QUEUE_SIZE") or DEFAULT_MAX_PENDING)
+    # Messages the bot can send over all channels per period (seconds), 100 per 30 if the bot is a mod everywhere
+    SEND_GLOBAL_LIMIT = int(os.environ.get("SEND_GLOBAL_LIMIT") or DEFAULT_GLOBAL_LIMIT)
+    SEND_GLOBAL_PERIOD = float(os.environ.get("SEND_GLOBAL_PERIOD") or DEFAULT_GLOBAL_PERIOD)
+    # Messages the bot can send in one channel per period (seconds)
+    SEND_CHANNEL_LIMIT = int(os.environ.get("SEND_CHANNEL_LIMIT") or DEFAULT_CHANNEL_LIMIT)
+    SEND_CHANNEL_PERIOD = float(os.environ.get("SEND_CHANNEL_PERIOD") or DEFAULT_CHANNEL_PERIOD)
+    # Seconds a buttified message can wait to be sent before it's dropped
+    BUTT_SEND_DEADLINE = float(os.environ.get("BUTT_SEND_DEADLINE") or DEFAULT_BUTT_DEADLINE)
+    # Lowest level written to the channel logs, INFO or WARNING turns off the per-replacement lines
+    LOG_LEVEL = os.environ.get("LOG_LEVEL") or "DEBUG"
+    # Write the log files from a background thread ("queue", default) or straight from the bot ("direct")
+    LOG_MODE = os.environ.get("LOG_MODE") or "queue"
+    # Limits on the channel log files: how many are open at once, when they're rotated ("size", "daily" or "off"),
+    # whether rotated files are gzipped, and how many bytes of rotated files to keep per channel and in total
+    # (0 = no limit), see logging_funcs.ChannelFileHandler
+    log_rotate = os.environ.get("LOG_ROTATE") or DEFAULT_LOG_ROTATE
+    if log_rotate not in LOG_ROTATE_MODES:
+        raise ValueError(f"Unknown log rotation '{log_rotate}', use {', '.join(LOG_ROTATE_MODES)}")
+    LOG_FILE_LIMITS = {
+        "max_open": int(os.environ.get("LOG_MAX_OPEN_FILES") or DEFAULT_MAX_OPEN_LOGS),
+        "rotate": log_rotate,
+        "max_bytes": int(os.environ.get("LOG_MAX_BYTES") or DEFAULT_LOG_MAX_BYTES),
+        "compress": os.environ.get("LOG_COMPRESS", "1") not in ("", "0"),
+        "channel_quota": int(os.environ.get("LOG_CHANNEL_QUOTA") or DEFAULT_LOG_CHANNEL_QUOTA),
+        "total_quota": int(os.environ.get("LOG_TOTAL_QUOTA") or DEFAULT_LOG_TOTAL_QUOTA),
+    }
+    # Channels the bot can join per period (seconds), 2000 per 10 for a verified bot
+    JOIN_LIMIT = int(os.environ.get("JOIN_LIMIT") or DEFAULT_JOIN_LIMIT)
+    JOIN_PERIOD = float(os.environ.get("JOIN_PERIOD") or DEFAULT_JOIN_PERIOD)
+    # Split the channels over this many IRC connections (1, the default, keeps them all on one)
+    SHARD_COUNT = int(os.environ.get("SHARD_COUNT") or 1)
+    # Run the shards as connections in this process ("connection", default) or a process each ("process",
+    # needs SETTINGS_BACKEND=sqlite so they can all save at once)
+    SHARD_MODE = os.environ.get("SHARD_MODE") or "connection"
+    # Serve Prometheus metrics on http://METRICS_HOST:METRICS_PORT/metrics (off when empty), process shards
+    # use the ports after it as well, one each
+    METRICS_PORT = int(os.environ.get("METRICS_PORT") or 0)
+    METRICS_HOST = os.environ.get("METRICS_HOST") or DEFAULT_METRICS_HOST
+    # Profile the bot once connected (off when empty, separate from DEV): any of "stages" (time each stage of
+    # handling a message), "cprofile" and "sample" (a stack sampler), comma separated
+    BOT_PROFILE = parse_profile_modes(os.environ.get("BOT_PROFILE") or "")
+    # Seconds to profile for before writing the results to the profiles folder
+    PROFILE_SECONDS = float(os.environ.get("PROFILE_SECONDS") or DEFAULT_PROFILE_SECONDS)
+    # Seconds between checks for changes made to the saved settings while the bot runs (0 turns it off)
+    SETTINGS_RELOAD_INTERVAL = float(os.environ.get("SETTINGS_RELOAD_INTERVAL") or DEFAULT_RELOAD_INTERVAL)
+    # What to do with messages repeated during a copypasta wave: "skip" (default), "cache" or "off"
+    COPYPASTA_POLICY = (os.environ.get("COPYPASTA_POLICY") or DEFAULT_COPYPASTA_POLICY).lower()
+    if COPYPASTA_POLICY not in COPYPASTA_POLICIES:
+        raise ValueError(f"Unknown copypasta policy '{COPYPASTA_POLICY}', use {', '.join(COPYPASTA_POLICIES)}")
+    # A message seen COPYPASTA_THRESHOLD times in a channel's last COPYPASTA_WINDOW messages (within
+    # COPYPASTA_SECONDS) starts a wave
+    COPYPASTA_WINDOW = int(os.environ.get("COPYPASTA_WINDOW") or DEFAULT_COPYPASTA_WINDOW)
+    COPYPASTA_SECONDS = float(os.environ.get("COPYPASTA_SECONDS") or DEFAULT_COPYPASTA_SECONDS)
+    COPYPASTA_THRESHOLD = int(os.environ.get("COPYPASTA_THRESHOLD") or DEFAULT_COPYPASTA_THRESHOLD)
 
 
 class Bot(commands.Bot):
-    def __init__(self, data: dict):
-        super().__init__(token=bot_access_token, prefix=bot_prefix,
-                         initial_channels=list(data.keys()))
-        self.channel_settings: dict = data
-        self.missed_messages: Dict[str, int] = {}
+    def __init__(self, data: Dict[str, ChannelState], ignored: set[str], settings_store: SettingsStore,
+                 router: ShardRouter | None = None, shard_id: int = 0, send_scheduler: SendScheduler | None = None,
+                 worker_pool: ButtWorkerPool | None = None, buttify_seconds: Histogram | None = None):
+        # No initial channels, the join scheduler joins them once connected so the join rate limit isn't hit
+        super().__init__(token=bot_access_token, prefix=bot_prefix, initial_channels=[])
+        # Settings, plurals, missed message counts... of each channel
+        self.channel_settings: Dict[str, ChannelState] = data
+        # When sharded, this connection only joins the channels the router says belong to shard_id
+        self.router = router
+        self.shard_id = shard_id
+        # Writes changes to channel_settings back to storage in the background
+        self.settings_store = settings_store
+        self.message_stats = {
+            "messages": 0,
+            "fast_path": 0,
+            "buttify_attempts": 0,
+            "skipped_ignored": 0,
+            "skipped_bots": 0,
+            # Messages that were part of a copypasta wave, skipped unless COPYPASTA_POLICY=cache
+            "repeats": 0,
+            "commands": 0,
+            "replaced": 0,
+            "too_short": 0,
+            "no_syllable": 0,
+            "emote_only": 0,
+            # Emote words left out of hyphenating and picking syllables
+            "emotes_skipped": 0,
+        }
+        # Seconds taken to buttify each message, on the event loop or a worker
+        self.buttify_seconds = buttify_seconds or Histogram()
+        self.metrics_server: MetricsServer | None = None
+        self.profiler: Profiler | None = None
+        # Picks up changes made to the saved settings while running (see watch_settings)
+        self.settings_watcher: asyncio.Task | None = None
+        # Works out the plurals of every channel's words once connected, so inflect isn't loaded before then
+        self.warm_up_task: asyncio.Task | None = None
+        # Plurals being worked out for channels added or changed after that (see refresh_plurals)
+        self.plural_tasks: set[asyncio.Task] = set()
+        # Users who don't want to be butted, kept in memory so messages never wait on the file
+        self.ignored_users: set[str] = ignored
+        # Shards in the same process are handed the scheduler and pool they share (see run_connection_shards),
+        # which closes them along with the settings store and router once every shard has disconnected
+        self.owns_shared = send_scheduler is None
+        if send_scheduler is None:
+            send_scheduler = create_send_scheduler(router)
+            worker_pool = create_worker_pool()
+        # Every message goes out through here so all channels stay under Twitch's rate limits together
+        self.send_scheduler = send_scheduler
+        # Pool to buttify messages on, if turned on
+        self.worker_pool = worker_pool
+        # The join limit is for the whole account too, and every shard has its own connection to join on
+        join_limit = JOIN_LIMIT if router is None else max(JOIN_LIMIT // router.shard_count, 1)
+        self.join_scheduler = JoinScheduler(self.join_channels, join_limit, JOIN_PERIOD,
+                                            on_all_joined=self.log_all_joined)
 
     async def event_ready(self):
         # Get logger for the bot's channel
@@ -56,277 +223,582 @@ class Bot(commands.Bot):
         logger.info(f'Logged in as | {self.nick}')
         logger.info(f'User id is | {self.user_id}')
 
-        if self.nick not in self.channel_settings:
+        if self.warm_up_task is None:
+            self.warm_up_task = asyncio.create_task(self.warm_up())
+        if METRICS_PORT and self.metrics_server is None:
+            await self.start_metrics_server()
+        if BOT_PROFILE and self.profiler is None and self.runs_process_wide:
+            self.profiler = Profiler(BOT_PROFILE, PROFILE_SECONDS)
+            self.profiler.start()
+            logger.info('Profiling (%s) for %.0fs', ", ".join(sorted(BOT_PROFILE)), PROFILE_SECONDS)
+        if SETTINGS_RELOAD_INTERVAL and self.settings_watcher is None and self.runs_process_wide:
+            self.settings_watcher = asyncio.create_task(self.watch_settings())
+
+        if self.router is not None:
+            logger.info('Shard %d of %d is ready', self.shard_id, self.router.shard_count)
+            self.router.start(self)
+
+        # Only the shard that owns the bot's channel keeps its settings
+        if self.owns_channel(self.nick) and self.nick not in self.channel_settings:
             logger.info(
                 f'Adding bot {self.nick} to settings with default values...')
-            self.channel_settings[self.nick] = DEFAULT_BUTT_INFO
+            self.channel_settings[self.nick] = ChannelState(self.nick)
+            self.refresh_plurals(self.channel_settings[self.nick])
+            self.settings_store.mark_dirty(self.nick)
+
+        # Called again after every reconnect, when the new connection isn't in any channels yet
+        channels = [name for name in self.channel_settings if self.owns_channel(name)]
+        # For channels without a message since starting up, go by when their log was last written to
+        quiet = [name for name in channels if not self.channel_settings[name].last_message_at]
+        for name, logged_at in (await asyncio.to_thread(last_logged, quiet)).items():
+            if name in self.channel_settings:
+                self.channel_settings[name].last_message_at = logged_at
+        # The bot's own channel goes first so commands work straight away
+        channels = [name for name in channels if name in self.channel_settings]
+        channels.sort(key=lambda name: float("inf") if name == self.nick
+                      else self.channel_settings[name].last_message_at, reverse=True)
+        self.join_scheduler.start_round(channels)
+        logger.info('joining %d channels, most recently active first', len(channels))
+
+    async def warm_up(self):
+        # Load inflect and pyphen and work out every channel's plurals on a thread, while the channels are joined
+        start = time.perf_counter()
+        words = {name: state.words for name, state in self.channel_settings.items() if state.plurals is None}
+
+        def work_out_plurals() -> dict[str, dict[str, str]]:
+            load_dictionaries()
+            return {name: get_word_plurals(channel_words) for name, channel_words in words.items()}
+
+        plurals = await asyncio.to_thread(work_out_plurals)
+        for name, channel_plurals in plurals.items():
+            # Channels changed or left while this was running already have the right plurals
+            state = self.channel_settings.get(name)
+            if state is not None and state.plurals is None:
+                state.plurals = channel_plurals
 
-            modify_streamer_settings(JSON_DATA_PATH, "add", {
-                                     self.nick: self.channel_settings[self.nick]})
+        logger = get_logger_for_channel(self.nick)
+        logger.info('warmed up in %.2fs', time.perf_counter() - start)
+
+    async def watch_settings(self):
+        # Check every so often whether something else changed the saved settings (edited by hand, a backup put back,
+        # another tool) and apply just what changed, instead of restarting and joining every channel again
+        while True:
+            await asyncio.sleep(SETTINGS_RELOAD_INTERVAL)
+            # Wait for the bot's own changes to be written, until then the saved settings are behind
+            if self.settings_store.writing:
+                continue
+
+            try:
+                reloaded = await asyncio.to_thread(self.settings_store.reload)
+            except (OSError, ValueError, sqlite3.Error) as e:
+                # Probably caught halfway through being written, try again next time
+                get_logger_for_channel(self.nick).warning("Couldn't reload settings: %s", e)
+                continue
+            if reloaded is not None:
+                await self.apply_reloaded_settings(*reloaded)
+
+    def shard_for(self, channel_name: str) -> "Bot | None":
+        # The bot in this process that joins the channel, None if a shard in another process does
+        if isinstance(self.router, ConnectionShardRouter):
+            return self.router.bots[self.router.owner_of(channel_name)]
+        return self if self.owns_channel(channel_name) else None
+
+    async def apply_reloaded_settings(self, changed: dict[str, dict], removed: list[str]):
+        """Join, leave and update only the channels that changed on disk. Channels with changes of their own
+        still waiting to be written keep them"""
+        added = updated = left = 0
+        dirty = self.settings_store.dirty
+        for name, values in changed.items():
+            bot = self.shard_for(name)
+            if bot is None or name in dirty:
+                continue
+
+            state = self.channel_settings.get(name)
+            if state is None:
+                state = self.channel_settings[name] = ChannelState.from_dict(name, values)
+                self.refresh_plurals(state)
+                bot.join_scheduler.request(name)
+                added += 1
+                continue
+
+            words = state.words
+            if state.update(values):
+                updated += 1
+                if state.words != words:
+                    self.refresh_plurals(state)
+
+        for name in removed:
+            bot = self.shard_for(name)
+            # The bot's own channel is never left, commands would stop working
+            if bot is None or name in dirty or name == self.nick or name not in self.channel_settings:
+                continue
+
+            del self.channel_settings[name]
+            bot.join_scheduler.forget(name)
+            await bot.part_channels([name])
+            left += 1
+
+        logger = get_logger_for_channel(self.nick)
+        logger.info('Reloaded settings: %d channels added, %d changed, %d removed', added, updated, left)
+
+    def refresh_plurals(self, state: ChannelState):
+        """
+        Work out the channel's plurals again on a thread, after it was added or its words changed. Until then
+        missing plurals are looked up as they're needed. Before connecting there's nothing to do, warm_up does
+        every channel
+        """
+        if self.warm_up_task is None:
+            return
+
+        words = state.words
+
+        async def work_out_plurals():
+            plurals = await asyncio.to_thread(get_word_plurals, words)
+            # A new dict rather than changing the old one, jobs on a worker can still be reading it.
+            # Skipped if the words changed again meanwhile, that change has its own refresh coming
+            if state.words == words:
+                state.plurals = plurals
+
+        task = asyncio.create_task(work_out_plurals())
+        # Kept so the task isn't garbage collected before it's done
+        self.plural_tasks.add(task)
+        task.add_done_callback(self.plural_tasks.discard)
+
+    @property
+    def runs_process_wide(self) -> bool:
+        """Whether this bot runs what there's one of per process (metrics, profiling), the first shard if they share"""
+        return not isinstance(self.router, ConnectionShardRouter) or self.shard_id == 0
+
+    async def start_metrics_server(self):
+        # Shards in this process share one page, served by the first. Process shards each serve their own,
+        # on the port after the one before
+        if not self.runs_process_wide:
+            return
+        if isinstance(self.router, ConnectionShardRouter):
+            bots, port = self.router.bots, METRICS_PORT
+        else:
+            bots, port = [self], METRICS_PORT + self.shard_id
+
+        logger = get_logger_for_channel(self.nick)
+        server = MetricsServer(bots, METRICS_HOST, port)
+        try:
+            await server.start()
+        except OSError as e:
+            logger.error("Couldn't serve metrics on %s:%d: %s", METRICS_HOST, port, e)
+            return
+        self.metrics_server = server
+        logger.info('Serving metrics on http://%s:%d/metrics', METRICS_HOST, port)
+
+    def log_all_joined(self, joined: int, gave_up: int, seconds: float):
+        logger = get_logger_for_channel(self.nick)
+        logger.info('joined %d channels in %.1fs (gave up on %d)', joined, seconds, gave_up)
+
+    async def event_channel_joined(self, channel):
+        self.join_scheduler.joined(channel.name)
 
-        logger.info(
-            f'channels connected to: {list(self.channel_settings.keys())}')
+    async def event_channel_join_failure(self, channel: str):
+        logger = get_logger_for_channel(self.nick)
+        logger.warning('Failed to join %s, trying again later', channel)
+        self.join_scheduler.failed(channel)
+
+    async def close(self):
+        # Make sure any settings changes still waiting to be written are saved before disconnecting
+        if self.settings_watcher is not None:
+            self.settings_watcher.cancel()
+        for task in list(self.plural_tasks):
+            task.cancel()
+        if self.metrics_server is not None:
+            await self.metrics_server.close()
+        if self.profiler is not None:
+            # Stopped early, write out what was profiled so far
+            for path in self.profiler.stop():
+                get_logger_for_channel(self.nick).info('Wrote %s', path)
+        await self.join_scheduler.close()
+        if self.owns_shared:
+            await close_shared(self.settings_store, self.send_scheduler, self.worker_pool, self.router)
+        logger = get_logger_for_channel("bot")
+        logger.info('%.1f%% of messages took the fast path: %s', self.fast_path_ratio * 100, self.message_stats)
+        await super().close()
+        if self.owns_shared:
+            stop_background_logging()
+
+    def send_reply(self, channel, content: str) -> asyncio.Future:
+        # Command replies go out before any buttified messages, await the result to wait until it's sent
+        return self.send_scheduler.enqueue(channel, content, COMMAND_PRIORITY)
+
+    def send_buttified(self, channel, content: str) -> asyncio.Future:
+        # Buttified messages are dropped if they can't be sent in time, a late butt makes no sense in chat
+        return self.send_scheduler.enqueue(channel, content, BUTT_PRIORITY, BUTT_SEND_DEADLINE)
 
     async def event_command_error(self, context, error: Exception) -> None:
         # Get logger for the current channel
         logger = get_logger_for_channel(context.channel.name)
         if isinstance(error, commands.CommandOnCooldown):
-            await context.channel.send(
+            self.send_reply(
+                context.channel,
                 f'Wait a couple of seconds before sending something else, {context.author.name}!')
             logger.warning(
                 f'Command on cooldown: {context.command.name} from {context.author.name}')
 
-    def increase_missed_messages(self, name):
-        self.missed_messages[name] += 1
+    async def reload_ignore_list(self) -> int:
+        # Re-read the ignore list from disk (e.g. after it was edited by hand) without blocking the bot
+        ignored = await asyncio.to_thread(self.settings_store.load_ignored)
+        # Change the set in place, shards in the same process share it
+        self.ignored_users.clear()
+        self.ignored_users.update(ignored)
+        return len(self.ignored_users)
 
-    def find_valid_syllable(self, message: Message, syllable_lists: list[str]) -> list[int] | bool:
-        # Get logger for the current channel
-        logger = get_logger_for_channel(message.channel.name)
-
-        random_word = 0
-        for _ in range(10):  # 10 attempts to find a new word
-            random_word = random.randint(0, len(syllable_lists) - 1)
-            # If an ignored word, find another word
-            if "".join(get_syllables_no_punctuation(
-                    syllable_lists[random_word])).lower() in IGNORE_WORDS:
-                continue
+    def owns_channel(self, channel_name: str) -> bool:
+        # Without sharding this connection has every channel
+        return self.router is None or self.router.owner_of(channel_name) == self.shard_id
 
-            # Try to avoid links being replaced
-            if "https" in "".join(get_syllables_no_punctuation(
-                    syllable_lists[random_word])).lower():
-                continue
+    def settings_elsewhere(self, channel_name: str) -> bool:
+        # The channel's settings are kept by a shard in another process, so they can't be changed from here
+        return self.router is not None and not self.router.shares_state and not self.owns_channel(channel_name)
 
-                # Word is fine, continue forward
-            break
-        else:
-            logger.warning(
-                'Could not find a word to replace, skipping message...')
+    async def add_channel(self, channel_name: str) -> bool:
+        """Join the channel with default settings, returns False if it was already joined"""
+        if channel_name in self.channel_settings:
             return False
 
-        random_syllable = 0
-        for _ in range(5):  # 5 attempts to find a new syllable
-            random_syllable = random.randint(
-                0, len(syllable_lists[random_word]) - 1)
-            # If the syllable is only 1 letter, don't use
-            if len(syllable_lists[random_word][random_syllable]) == 1:
-                continue
+        self.channel_settings[channel_name] = ChannelState(channel_name)
+        self.refresh_plurals(self.channel_settings[channel_name])
+        self.settings_store.mark_dirty(channel_name)
+        self.join_scheduler.request(channel_name)
+        return True
 
-            # If the syllable contains punctuation, don't use
-            if is_punctuation(syllable_lists[random_word][random_syllable]):
-                continue
-
-            # Syllable is fine, continue forward
-            break
-        else:
-            logger.warning(
-                'Could not find a syllable to replace, skipping message...')
+    async def remove_channel(self, channel_name: str) -> bool:
+        """Leave the channel and forget its settings, returns False if it wasn't joined"""
+        if channel_name not in self.channel_settings:
             return False
 
-        return [random_word, random_syllable]
+        del self.channel_settings[channel_name]
+        self.settings_store.mark_removed(channel_name)
+        self.join_scheduler.forget(channel_name)
+        await self.part_channels([channel_name])
+        return True
+
+    async def handle_shard_request(self, op: str, name: str) -> bool:
+        """Run a request routed here from another shard"""
+        if op == "join":
+            return await self.add_channel(name)
+        if op == "leave":
+            return await self.remove_channel(name)
+        if op == "ignore":
+            self.ignored_users.add(name)
+            return True
+        if op == "unignore":
+            self.ignored_users.discard(name)
+            return True
+        if op == "reloadignored":
+            await self.reload_ignore_list()
+            return True
+        raise ValueError(f"Unknown shard request '{op}'")
+
+    def channel_state(self, channel_name: str) -> ChannelState:
+        # The channel's state, starting from the defaults if it has none yet
+        state = self.channel_settings.get(channel_name)
+        if state is None:
+            state = self.channel_settings[channel_name] = ChannelState(channel_name)
+            self.refresh_plurals(state)
+        return state
+
+    @staticmethod
+    def draw_butt_countdown(state: ChannelState) -> int:
+        if IS_BOT_DEV:
+            return 0
+        return messages_until_butt(state.rate, state.missed)
+
+    def butt_sent(self, state: ChannelState):
+        # set missed messages for channel back to 0, and draw when the next butt is from there
+        state.missed = 0
+        state.countdown = self.draw_butt_countdown(state)
+        state.butts += 1
+
+    @property
+    def fast_path_ratio(self) -> float:
+        """Fraction of messages that were only counted down, without any buttifying or command parsing"""
+        messages = self.message_stats["messages"]
+        return self.message_stats["fast_path"] / messages if messages else 0.0
 
     def log_word_list(self, channel_name, word, is_adding, was_successful):
-        logger = get_logger_for_channel(channel_name)
-        settings = self.channel_settings.setdefault(
-            channel_name, DEFAULT_BUTT_INFO)
-        logger.info(
-            f'{channel_name} tried to {"add" if is_adding else "remove"} \'{word}\' from their word list ' +
-            f'{"" if was_successful else "un"}successfully. Current word list: {settings["random_words_list"]}')
+        state = self.channel_state(channel_name)
+        state.logger.info("%s tried to %s '%s' from their word list %ssuccessfully. Current word list: %s",
+                          channel_name, "add" if is_adding else "remove", word, "" if was_successful else "un",
+                          state.random_words.describe())
 
-    async def change_word_list(self, ctx: commands.Context, word: str, is_adding: bool):
+    async def change_word_list(self, ctx: commands.Context, word: str, is_adding: bool, weight: str | None = None):
         is_in_bot_channel, channel_name = in_bot_channel(bot_nickname, ctx.author.name, ctx.channel.name)
         # Get logger for the current channel
         logger = get_logger_for_channel(channel_name)
 
+        if is_in_bot_channel and self.settings_elsewhere(channel_name):
+            self.send_reply(ctx.channel,
+                            'Your channel is handled by another shard, use this command in your own channel.')
+            return
+
         # Check where the command is being sent and if the bot has already joined the sender's stream
         if is_in_bot_channel and channel_name not in self.channel_settings:
-            await ctx.channel.send(f'The bot has not joined your channel, do {bot_prefix}join to have it join.')
+            self.send_reply(ctx.channel, f'The bot has not joined your channel, do {bot_prefix}join to have it join.')
             return
 
         if not word or word.strip() == "" or word == "\U000e0000":
-            await ctx.channel.send(f'Make sure to include a word: {bot_prefix}{"add" if is_adding else "remove"}word <word>')
+            self.send_reply(ctx.channel,
+                            f'Make sure to include a word: {bot_prefix}{"add" if is_adding else "remove"}word <word>')
             return
 
         # Check if the user has permission to change the word
         if channel_name != ctx.author.name:
-            await ctx.channel.send('You can only modify words for your own channel.')
+            self.send_reply(ctx.channel, 'You can only modify words for your own channel.')
             logger.warning(f"{ctx.author.name} tried to modify the word '{word}' in {channel_name}'s list.")
             return
 
-        settings = self.channel_settings.setdefault(channel_name, DEFAULT_BUTT_INFO)
+        state = self.channel_state(channel_name)
 
         if is_adding:
-            # Add the word to the list if it's not already there
-            if word not in settings["random_words_list"]:
-                settings["random_words_list"].append(word)
-                modify_streamer_values(JSON_DATA_PATH, channel_name, "random_words_list", settings["random_words_list"])
-                await ctx.channel.send(f'Added word \'{word}\'.')
+            if len(word) > MAX_WORD_LENGTH:
+                self.send_reply(ctx.channel, f'Words can be at most {MAX_WORD_LENGTH} characters long.')
+                return
+            if weight is not None and (not weight.isdigit() or not 1 <= int(weight) <= MAX_WORD_WEIGHT):
+                self.send_reply(ctx.channel, f'The weight has to be a number between 1 and {MAX_WORD_WEIGHT}: '
+                                             f'{bot_prefix}addword <word> <weight>')
+                return
+            if word not in state.random_words and len(state.random_words) >= MAX_RANDOM_WORDS:
+                self.send_reply(ctx.channel, f'The word list is full ({MAX_RANDOM_WORDS} words), remove a word first.')
+                self.log_word_list(channel_name, word, is_adding=True, was_successful=False)
+                return
+
+            is_new = word not in state.random_words
+            # Add the word to the list if it's not already there, or change its weight if one was given
+            if state.random_words.add(word, int(weight) if weight is not None else
+                                      (1 if is_new else state.random_words.weight(word))):
+                self.settings_store.mark_dirty(channel_name, "random_words_list")
+                if is_new:
+                    self.refresh_plurals(state)
+                    self.send_reply(ctx.channel, f'Added word \'{word}\'' +
+                                    (f' with weight {weight}.' if weight is not None else '.'))
+                else:
+                    self.send_reply(ctx.channel, f'Changed the weight of \'{word}\' to {weight}.')
                 self.log_word_list(channel_name, word, is_adding=True, was_successful=True)
             else:
-                await ctx.channel.send(f'\'{word}\' is already in the list.')
+                self.send_reply(ctx.channel, f'\'{word}\' is already in the list.')
                 self.log_word_list(channel_name, word, is_adding=True, was_successful=False)
         else:
             # Remove the word from the list if it's there
-            if word in settings["random_words_list"]:
-                settings["random_words_list"].remove(word)
-                modify_streamer_values(JSON_DATA_PATH, channel_name, "random_words_list", settings["random_words_list"])
-                await ctx.channel.send(f'Removed word, \'{word}\'.')
+            if state.random_words.remove(word):
+                self.settings_store.mark_dirty(channel_name, "random_words_list")
+                self.send_reply(ctx.channel, f'Removed word, \'{word}\'.')
                 self.log_word_list(channel_name, word, is_adding=False, was_successful=True)
             else:
-                await ctx.channel.send(f'\'{word}\' is not in the word list.')
+                self.send_reply(ctx.channel, f'\'{word}\' is not in the word list.')
                 self.log_word_list(channel_name, word, is_adding=False, was_successful=False)
 
     async def change_settings(self, ctx: commands.Context, value_type, value):
         # Do command for the user's channel instead of channel done in if it's the bot's channel
         is_in_bot_channel, channel_name = in_bot_channel(bot_nickname, ctx.author.name, ctx.channel.name)
 
+        if is_in_bot_channel and self.settings_elsewhere(channel_name):
+            self.send_reply(ctx.channel,
+                            'Your channel is handled by another shard, use this command in your own channel.')
+            return
+
         # If the user is in the bot's channel and checking for their own but has not joined the channel,
         # let the user know of that instead
         if is_in_bot_channel and channel_name not in self.channel_settings:
-            await ctx.channel.send(f'The bot has not joined your channel, do {bot_prefix}join to have it join.')
+            self.send_reply(ctx.channel, f'The bot has not joined your channel, do {bot_prefix}join to have it join.')
         else:
             # Get logger for the current channel
             logger = get_logger_for_channel(channel_name)
 
-            settings = self.channel_settings.setdefault(
-                channel_name, DEFAULT_BUTT_INFO)
+            state = self.channel_state(channel_name)
+            current = getattr(state, value_type)
 
             if value is None:
-                await ctx.channel.send(
+                self.send_reply(
+                    ctx.channel,
                     f'The current {value_type} for {channel_name}\'s channel is ' +
-                    f'{f"1/{settings[value_type]}" if value_type == "rate" else settings[value_type]}.')
-                logger.info(f"Checked {value_type}: {settings[value_type]}")
+                    f'{f"1/{current}" if value_type == "rate" else current}.')
+                logger.info(f"Checked {value_type}: {current}")
             else:
                 if ctx.author.name != channel_name:
                     logger.warning(
                         f'{ctx.author.name} tried to change the {value_type} of {channel_name}')
                     return
 
-                settings[value_type] = value
-                modify_streamer_values(
-                    JSON_DATA_PATH, ctx.author.name, value_type, value)
-                await ctx.channel.send(
+                setattr(state, value_type, value)
+                self.settings_store.mark_dirty(channel_name, value_type)
+                if value_type == "word":
+                    self.refresh_plurals(state)
+                elif value_type == "rate":
+                    # Drawn again with the new rate on the next message
+                    state.countdown = None
+                self.send_reply(
+                    ctx.channel,
                     f'{value_type}{f" for the channel {channel_name}" if is_in_bot_channel else ""} ' +
                     f'changed to {value}.')
 
-    def find_buttwords(self, message: Message) -> list[list[str]] | bool:
+    def make_butt_job(self, message: Message, state: ChannelState, wave: int | None = None) -> ButtJob:
+        # Copy what's needed out of the message and settings, so the job can be buttified anywhere
+        is_reply = message.tags.get("reply-parent-display-name") is not None
+        content = get_message_content(message.content, is_reply)
+        emotes = get_emote_names(message.content, message.tags.get("emotes"))
+        syllables = None
+        if wave is not None:
+            # The copies in a wave are only split into syllables once
+            syllables = state.repeat_window.syllables_for(wave, content, emotes)
+
+        return ButtJob(
+            channel=state.name,
+            content=content,
+            word=state.word,
+            random_words_enabled=state.random_words_enabled,
+            random_words=state.random_words.table,
+            plurals=state.plurals or {},
+            per_sentence=BUTT_REPLACEMENT_PER_SENTENCE,
+            min_spacing=MIN_BUTT_SPACING,
+            submitted_at=time.time(),
+            emotes=emotes,
+            syllables=syllables)
+
+    def count_butt_result(self, result: ButtResult):
+        self.message_stats["replaced" if result.failure is None else result.failure.replace(" ", "_")] += 1
+        self.message_stats["emotes_skipped"] += result.emotes_skipped
+        self.buttify_seconds.observe(result.compute_seconds)
+
+    def log_butt_result(self, result: ButtResult, content: str, author_name: str):
         # Get logger for the current channel
-        channel_name = message.channel.name
-        logger = get_logger_for_channel(channel_name)
+        logger = get_logger_for_channel(result.channel)
 
-        settings = self.channel_settings.get(channel_name)
+        if result.failure == "no syllable":
+            logger.warning('Could not find a syllable to replace, skipping message...')
 
-        content = message.content
+        # Skip building the messages when INFO lines are turned off
+        if not logger.isEnabledFor(logging.INFO):
+            return
 
-        # Remove @ from start of message if it is a reply
-        if message.tags.setdefault("reply-parent-display-name", None) is not None:
-            content = " ".join(message.content.split(" ")[1:])
-            # print(content)
+        if result.failure == "too short":
+            logger.info("Message of %s too short", content)
+        elif result.failure == "emote only":
+            logger.info("Message of %s only emotes", content)
 
-        syllable_lists = syllables_split(content)
+        # Only log the word replacement once, not as word and syllable separately
+        for syll, word, buttword in result.replacements:
+            logger.info("replaced syllable '%s' in word '%s' with '%s' in the message '%s' sent by %s",
+                        syll, word, buttword, content, author_name)
 
-        # Ignore messages with single words that have less than 3 syllables (not including punctuation)
-        filtered_syllables = len([x for x in get_syllables_no_punctuation(syllable_lists[0]) if x != ''])
-        if len(syllable_lists) <= 1 and filtered_syllables < 3:
-            logger.info(f"Message of {message.content} too short")
-            return False
+    def find_buttwords(self, message: Message, state: ChannelState,
+                       wave: int | None = None) -> list[list[str]] | bool:
+        result = run_job(self.make_butt_job(message, state, wave))
+        self.count_butt_result(result)
+        self.log_butt_result(result, message.content, message.author.name)
 
-        # calc the number of replacements in the sentence
-        butt_num = math.ceil(
-            len(syllable_lists) / BUTT_REPLACEMENT_PER_SENTENCE)
-
-        valid_butts = 0
-        for _ in range(butt_num):
-            out = self.find_valid_syllable(message, syllable_lists)
-
-            if out is not False:
-                random_word = out[0]
-                random_syllable = out[1]
-
-                # grab length of the random_words list
-                rand_words_len = len(settings["random_words_list"])
-
-                # decide which streamer word to use:
-                # if random_words are enabled, choose from there, otherwise take the single set word
-                streamer_word_final = settings["word"]
-                if settings["random_words_enabled"] or rand_words_len > 0:
-                    streamer_word_final = settings["random_words_list"][random.randint(0, rand_words_len - 1)]
-
-                # Check if the given syllable should be plural
-                buttword = get_buttword_plural(
-                    streamer_word_final, syllable_lists[random_word], random_syllable)
-
-                # Check the capitalisation
-                syll = syllable_lists[random_word][random_syllable]
-                if syll == syll.upper():
-                    syll = buttword.upper()
-                elif syll == syll[0].upper() + syll[1:].lower():
-                    syll = buttword[0].upper() + buttword[1:]
-                else:
-                    syll = buttword.lower()
-
-                syllable_lists[random_word][random_syllable] = syll
+        if result.syllable_lists is None:
+            return False
 
-                # Only log the word replacement once, not as word and syllable separately
-                logger.info(
-                    f"replaced syllable \'{syll}\' in word \'{syllable_lists[random_word]}\' with \'{buttword}\' " +
-                    f"in the message \'{message.content}\' sent by {message.author.name}")
+        return result.syllable_lists
 
-                valid_butts += 1
+    def submit_to_worker_pool(self, message: Message, state: ChannelState, wave: int | None = None):
+        # Keep hold of the channel to reply in, the message itself never goes to the pool
+        channel = message.channel
+        content = message.content
+        author_name = message.author.name
+
+        async def on_result(result: ButtResult):
+            self.count_butt_result(result)
+            self.log_butt_result(result, content, author_name)
+            if result.syllable_lists is not None:
+                self.send_buttified(channel, f'{syllables_to_sentence(result.syllable_lists)}')
+                self.butt_sent(state)
+
+        if not self.worker_pool.submit(self.make_butt_job(message, state, wave), on_result):
+            # The pool is full, skip this message rather than fall behind
+            state.logger.debug("Worker pool full, dropped message from %s", author_name)
+
+    def try_buttify(self, message: Message, state: ChannelState, wave: int | None = None):
+        self.message_stats["buttify_attempts"] += 1
+        state.buttify_attempts += 1
+        # Draw again from the same missed count in case nothing gets replaced, butt_sent draws from 0 if it works
+        state.countdown = self.draw_butt_countdown(state)
+
+        if self.worker_pool is not None:
+            self.submit_to_worker_pool(message, state, wave)
+            return
 
-        if valid_butts == 0:
+        butt_sentence = self.find_buttwords(message, state, wave)
+        # Make sure that it didn't return false i.e. didn't replace anything
+        if butt_sentence is not False:
+            self.send_buttified(message.channel, f'{syllables_to_sentence(butt_sentence)}')
+            self.butt_sent(state)
+
+    def should_ignore(self, message: Message) -> bool:
+        # Ignored users and other bots don't count towards the buttrate either
+        author_name = message.author.name
+        if author_name in self.ignored_users:
+            self.message_stats["skipped_ignored"] += 1
+            return True
+        if author_name in KNOWN_BOTS or "bot-badge/" in message.tags.get("badges", ""):
+            self.message_stats["skipped_bots"] += 1
+            return True
+        return False
+
+    def roll_rate(self, state: ChannelState, is_command: bool) -> bool:
+        """Count the message towards the channel's buttrate, True if it's the one to buttify"""
+        countdown = state.countdown
+        if countdown is None:
+            countdown = self.draw_butt_countdown(state)
+
+        if countdown > 0:
+            # Not this one, just count it (the pity timer in messages_until_butt already accounts for it)
+            state.countdown = countdown - 1
+            state.missed += 1
+            if not is_command:
+                self.message_stats["fast_path"] += 1
             return False
-
-        return syllable_lists
+        return True
 
     async def event_message(self, message):
         if message.echo:
             return
 
+        stats = self.message_stats
+        stats["messages"] += 1
         channel_name = message.channel.name
-
-        # Make sure to not butt in the bot's channel
-        if not channel_name == bot_nickname:
-            # check if missed_messages has the channel name as a key
-            if channel_name not in self.missed_messages:
-                # add the channel name as a key and set the value to 0
-                self.missed_messages[channel_name] = 0
-
-            # Check if the user is ignored
-            if message.author.name not in open_file(IGNORED_LIST_PATH, []):
-                # grab the channel's settings
-                settings = self.channel_settings.get(channel_name)
-
-                # grab the butt rate for the channel
-                butt_rate = settings["rate"]
-
-                # calculate the final butt rate for the channel
-                # once the missed message count exceeds the butt rate, the bot will have an increased chance of responding
-                # ensure final_butt_rate is at least 1 otherwise random.randint will throw an error
-                final_butt_rate = max(butt_rate - max(self.missed_messages[channel_name] - butt_rate, 0), 1)
-                random_int = random.randint(1, final_butt_rate)
-                if IS_BOT_DEV:
-                    random_int = 1
-
-                if settings and random_int == 1:
-                    butt_sentence = self.find_buttwords(message)
-
-                    # Make sure that it didn't return false i.e. didn't replace anything
-                    if butt_sentence is not False:
-                        await message.channel.send(f'{syllables_to_sentence(butt_sentence)}')
-                        # set missed messages for channel back to 0
-                        self.missed_messages[channel_name] = 0
-                else:
-                    # increment the missed messages for the channel
-                    self.increase_missed_messages(channel_name)
-
-        await self.handle_commands(message)
+        state = self.channel_settings.get(channel_name)
+        is_command = message.content.startswith(bot_prefix)
+
+        # Make sure to not butt in the bot's channel (or in one that's just been left)
+        if state is not None and channel_name != bot_nickname:
+            now = state.last_message_at = time.time()
+            state.messages += 1
+
+            # Is it another copy of a message flooding the channel? (see copypasta_funcs)
+            wave = None
+            if COPYPASTA_POLICY != "off":
+                window = state.repeat_window
+                if window is None:
+                    window = state.repeat_window = RepeatWindow(COPYPASTA_WINDOW, COPYPASTA_SECONDS,
+                                                                COPYPASTA_THRESHOLD)
+                wave = window.seen(message.content, now)
+                if wave is not None:
+                    state.repeats += 1
+                    stats["repeats"] += 1
+
+            # Copies in a wave don't count towards the buttrate, so the work stays the same however big it gets
+            skip_copy = wave is not None and COPYPASTA_POLICY == "skip"
+            if not skip_copy and not self.should_ignore(message) and self.roll_rate(state, is_command):
+                self.try_buttify(message, state, wave)
+
+        # Only messages starting with the prefix can be commands, don't make twitchio parse the rest
+        if is_command:
+            stats["commands"] += 1
+            await self.handle_commands(message)
 
     @commands.command()
     @commands.cooldown(3, 45, commands.Bucket.user)
     async def hello(self, ctx: commands.Context):
         # Get logger for the current channel
         logger = get_logger_for_channel(ctx.channel.name)
-        await ctx.channel.send(f'hiii {ctx.author.name}!')
+        self.send_reply(ctx.channel, f'hiii {ctx.author.name}!')
         logger.info(f"Hello command invoked by {ctx.author.name}")
 
     @commands.command()
@@ -335,16 +807,17 @@ class Bot(commands.Bot):
         logger = get_logger_for_channel(ctx.channel.name)
         channel_name = ctx.author.name.lower()
 
-        if channel_name not in self.channel_settings:
-            self.channel_settings[channel_name] = DEFAULT_BUTT_INFO
-            modify_streamer_settings(JSON_DATA_PATH, "add", {
-                                     channel_name: self.channel_settings.get(channel_name)})
+        # When sharded, the channel is joined by the connection that owns it, which may not be this one
+        if self.owns_channel(channel_name):
+            joined = await self.add_channel(channel_name)
+        else:
+            joined = await self.router.request("join", channel_name)
 
-            await ctx.send(f'Joining {channel_name}\'s channel')
-            await self.join_channels([channel_name])
+        if joined:
+            self.send_reply(ctx.channel, f'Joining {channel_name}\'s channel')
             logger.info(f"Joining channel: {channel_name}")
         else:
-            await ctx.send(f'Already in {channel_name}\'s channel.')
+            self.send_reply(ctx.channel, f'Already in {channel_name}\'s channel.')
 
     @commands.command()
     async def leave(self, ctx: commands.Context):
@@ -355,93 +828,109 @@ class Bot(commands.Bot):
         logger = get_logger_for_channel(channel_name)
 
         if not is_in_bot_channel and channel_name != ctx.author.name:
-            await ctx.send(f'Please use the {bot_prefix}leave command in your own channel.')
+            self.send_reply(ctx.channel, f'Please use the {bot_prefix}leave command in your own channel.')
             logger.warning(
                 f'Non-host trying to remove me from the channel {channel_name}.')
             return
 
-        if channel_name in self.channel_settings:
-            modify_streamer_settings(JSON_DATA_PATH, "rm", {
-                                     channel_name: self.channel_settings[channel_name]})
-            del self.channel_settings[channel_name]
+        if not self.owns_channel(channel_name):
+            # Another shard is connected to the channel, it leaves and the reply goes out from here
+            if await self.router.request("leave", channel_name):
+                self.send_reply(ctx.channel, f'Leaving {channel_name}\'s channel.')
+                logger.info(f"Leaving channel: {channel_name}")
+            else:
+                self.send_reply(ctx.channel, f'The bot is not currently in {channel_name}\'s channel.')
+            return
 
-            await ctx.send(f'Leaving {channel_name}\'s channel.')
-            await self.part_channels([channel_name])
+        if channel_name in self.channel_settings:
+            # Make sure the goodbye goes out before leaving
+            await self.send_reply(ctx.channel, f'Leaving {channel_name}\'s channel.')
+            await self.remove_channel(channel_name)
             logger.info(f"Leaving channel: {channel_name}")
         else:
-            await ctx.send(f'The bot is not currently in {channel_name}\'s channel.')
+            self.send_reply(ctx.channel, f'The bot is not currently in {channel_name}\'s channel.')
 
     @commands.command(name="randomwords")
     async def show_random_word_list(self, ctx: commands.Context):
         is_in_bot_channel, channel_name = in_bot_channel(bot_nickname, ctx.author.name, ctx.channel.name)
 
+        if is_in_bot_channel and self.settings_elsewhere(channel_name):
+            self.send_reply(ctx.channel,
+                            'Your channel is handled by another shard, use this command in your own channel.')
+            return
+
         # check where the command is being sent and if the bot has already joined the sender's stream
         if is_in_bot_channel and channel_name not in self.channel_settings:
-            await ctx.channel.send(f'The bot has not joined your channel, do {bot_prefix}join to have it join.')
+            self.send_reply(ctx.channel, f'The bot has not joined your channel, do {bot_prefix}join to have it join.')
         else:
-            settings = self.channel_settings.setdefault(
-                channel_name, DEFAULT_BUTT_INFO)
+            state = self.channel_state(channel_name)
 
-            if len(settings["random_words_list"]) == 0:
-                await ctx.channel.send('Word list is empty.')
+            if len(state.random_words) == 0:
+                self.send_reply(ctx.channel, 'Word list is empty.')
             else:
-                await ctx.channel.send(f'Random Word List: {settings["random_words_list"]}')
+                self.send_reply(ctx.channel, f'Random Word List: {state.random_words.describe()}')
 
     @commands.command(name="removeword", aliases=["deleteword"])
     async def remove_word(self, ctx: commands.Context, word: str):
         await self.change_word_list(ctx, word, is_adding=False)
 
     @commands.command(name="addword")
-    async def add_word(self, ctx: commands.Context, word: str):
-        await self.change_word_list(ctx, word, is_adding=True)
+    async def add_word(self, ctx: commands.Context, word: str, weight: str = None):
+        await self.change_word_list(ctx, word, is_adding=True, weight=weight)
 
     @commands.command(name="togglerandomwords", aliases=["togglewords", "togglerandom"])
     async def toggle_random_words(self, ctx: commands.Context):
         # Do command for the user's channel instead of channel done in if it's the bot's channel
         is_in_bot_channel, channel_name = in_bot_channel(bot_nickname, ctx.author.name, ctx.channel.name)
 
+        if is_in_bot_channel and self.settings_elsewhere(channel_name):
+            self.send_reply(ctx.channel,
+                            'Your channel is handled by another shard, use this command in your own channel.')
+            return
+
         # If the user is in the bot's channel and checking for their own but has not joined the channel,
         # let the user know of that instead
         if is_in_bot_channel and channel_name not in self.channel_settings:
-            await ctx.channel.send(
+            self.send_reply(
+                ctx.channel,
                 f'The bot has not joined your channel, do {bot_prefix}join to have it join.')
         else:
             # Get logger for the current channel
             logger = get_logger_for_channel(channel_name)
             # check if the user has permission to change the word
             if channel_name != ctx.author.name:
-                await ctx.channel.send('You can only enable/disable random words for your own channel.')
+                self.send_reply(ctx.channel, 'You can only enable/disable random words for your own channel.')
                 logger.warning(
                     f"{ctx.author.name} tried to enable/disable random words for {channel_name}")
                 return
 
-            settings = self.channel_settings.setdefault(
-                channel_name, DEFAULT_BUTT_INFO)
+            state = self.channel_state(channel_name)
 
             # enable if disabled
-            if not settings["random_words_enabled"]:
-                settings["random_words_enabled"] = True
-                modify_streamer_values(JSON_DATA_PATH, channel_name, "random_words_enabled", True)
-                await ctx.channel.send(
+            if not state.random_words_enabled:
+                state.random_words_enabled = True
+                self.settings_store.mark_dirty(channel_name, "random_words_enabled")
+                self.send_reply(
+                    ctx.channel,
                     f'You have enabled random words{f" for @{channel_name}" if is_in_bot_channel else ""}. ' +
                     f'Add words using {bot_prefix}addword <word> OR remove words using {bot_prefix}removeword <word>.')
             # disable if enabled
             else:
-                settings["random_words_enabled"] = False
-                modify_streamer_values(JSON_DATA_PATH, channel_name, "random_words_enabled", False)
-                await ctx.channel.send(
+                state.random_words_enabled = False
+                self.settings_store.mark_dirty(channel_name, "random_words_enabled")
+                self.send_reply(
+                    ctx.channel,
                     f'You have disabled random words{f" for @{channel_name}" if is_in_bot_channel else ""}.')
 
-            logger.info(
-                f'Random words are now {"enabled" if settings["random_words_enabled"] else 'disabled'} ' +
-                f'for {channel_name}.')
+            logger.info('Random words are now %s for %s.',
+                        "enabled" if state.random_words_enabled else "disabled", channel_name)
 
     @commands.command(name="buttrate", aliases=["rate", "setrate"])
     async def buttrate(self, ctx: commands.Context, new_rate: int = None):
         if new_rate is None or LOWER_LIMIT_BUTTRATE <= new_rate <= UPPER_LIMIT_BUTTRATE:
             await self.change_settings(ctx, "rate", new_rate)
         else:
-            await ctx.channel.send(f'{new_rate} is not a valid rate. Please choose a number between 10 and 1000.')
+            self.send_reply(ctx.channel, f'{new_rate} is not a valid rate. Please choose a number between 10 and 1000.')
 
     @commands.command(name="buttword", aliases=["setword"])
     async def buttword(self, ctx: commands.Context, new_word: str = None):
@@ -454,12 +943,14 @@ class Bot(commands.Bot):
         user_to_ignore = ctx.author.name
 
         # Adds user to the ignore list
-        worked = add_ignore_list(IGNORED_LIST_PATH, user_to_ignore)
+        worked = self.settings_store.add_ignored(self.ignored_users, user_to_ignore)
         if worked:
-            await ctx.channel.send(f'User {user_to_ignore} has been successfully ignored.')
+            if self.router is not None:
+                self.router.broadcast("ignore", user_to_ignore)
+            self.send_reply(ctx.channel, f'User {user_to_ignore} has been successfully ignored.')
             logger.info(f"User {user_to_ignore} ignored")
         else:
-            await ctx.channel.send(f'User {user_to_ignore} has already been ignored.')
+            self.send_reply(ctx.channel, f'User {user_to_ignore} has already been ignored.')
 
     @commands.command()
     async def unignoreme(self, ctx: commands.Context):
@@ -468,12 +959,27 @@ class Bot(commands.Bot):
         user_to_ignore = ctx.author.name
 
         # Removes user from the ignore list
-        worked = remove_ignore_list(IGNORED_LIST_PATH, user_to_ignore)
+        worked = self.settings_store.remove_ignored(self.ignored_users, user_to_ignore)
         if worked:
-            await ctx.channel.send(f'User {user_to_ignore} has been successfully unignored.')
+            if self.router is not None:
+                self.router.broadcast("unignore", user_to_ignore)
+            self.send_reply(ctx.channel, f'User {user_to_ignore} has been successfully unignored.')
             logger.info(f"User {user_to_ignore} unignored")
         else:
-            await ctx.channel.send(f'User {user_to_ignore} is currently not ignored.')
+            self.send_reply(ctx.channel, f'User {user_to_ignore} is currently not ignored.')
+
+    @commands.command(name="reloadignored")
+    async def reload_ignored(self, ctx: commands.Context):
+        # Only the bot's own account can reload the ignore list
+        if ctx.author.name != bot_nickname:
+            return
+
+        logger = get_logger_for_channel(ctx.channel.name)
+        count = await self.reload_ignore_list()
+        if self.router is not None:
+            self.router.broadcast("reloadignored", bot_nickname)
+        self.send_reply(ctx.channel, f'Reloaded the ignore list, {count} users are ignored.')
+        logger.info(f"Ignore list reloaded with {count} users")
 
     @commands.command()
     @commands.cooldown(1, 60, commands.Bucket.channel)
@@ -481,27 +987,158 @@ class Bot(commands.Bot):
         if amount is None:
             return
         if 1 <= amount <= 20:
-            await ctx.channel.send(f'🏭 Generating {amount} gregs...')
-            await ctx.channel.send('greg ' * amount)
+            self.send_reply(ctx.channel, f'🏭 Generating {amount} gregs...')
+            self.send_reply(ctx.channel, 'greg ' * amount)
         elif amount <= 0:
-            await ctx.channel.send(f"Can't generate gregs less than 1!")
+            self.send_reply(ctx.channel, f"Can't generate gregs less than 1!")
         else:
-            await ctx.channel.send(f"Generated too many gregs... the factory exploded!! greg EXPLOSION")
-
-
-def main():
-    if os.path.exists(JSON_DATA_PATH):
-        with open(JSON_DATA_PATH, "r", encoding="utf8") as json_file:
-            settings = json.load(json_file)
-    else:
-        settings = {}
-        settings[bot_nickname] = DEFAULT_BUTT_INFO
+            self.send_reply(ctx.channel, f"Generated too many gregs... the factory exploded!! greg EXPLOSION")
+
+
+def create_send_scheduler(router: ShardRouter | None = None) -> SendScheduler:
+    # Shards in other processes can't share the scheduler, so each gets its part of the global limit
+    global_limit = SEND_GLOBAL_LIMIT
+    if router is not None and not router.shares_state:
+        global_limit = max(SEND_GLOBAL_LIMIT // router.shard_count, 1)
+    return SendScheduler(global_limit, SEND_GLOBAL_PERIOD, SEND_CHANNEL_LIMIT, SEND_CHANNEL_PERIOD)
+
+
+def create_worker_pool() -> ButtWorkerPool | None:
+    # None when BUTT_WORKER_MODE is off, messages are buttified on the event loop then
+    if not BUTT_WORKER_MODE:
+        return None
+    return ButtWorkerPool(BUTT_WORKER_MODE, BUTT_WORKERS, BUTT_QUEUE_SIZE)
+
+
+async def close_shared(settings_store: SettingsStore, send_scheduler: SendScheduler,
+                       worker_pool: ButtWorkerPool | None, router: ShardRouter | None):
+    """Close what every shard in the process uses, once they've all disconnected (or the only bot has)"""
+    if worker_pool is not None:
+        await worker_pool.close()
+    if router is not None:
+        await router.close()
+    await send_scheduler.close()
+    await settings_store.close()
+
+
+def time_message_stages():
+    """Time each stage of handling a message (BOT_PROFILE=stages), the buttify stages only on the event loop
+    or worker threads since worker processes keep their own copy"""
+    time_stages([
+        (Bot, "event_message", "event_message"),
+        (Bot, "should_ignore", "ignore_check"),
+        (Bot, "roll_rate", "rate_roll"),
+        # Drawing how many messages until the next butt, part of rate_roll or after a butt attempt
+        (Bot, "draw_butt_countdown", "rate_draw"),
+        (buttify_funcs, "buttify", "buttify"),
+        (buttify_funcs, "syllables_split", "syllables_split"),
+        (buttify_funcs, "index_syllables", "slot_selection"),
+        (buttify_funcs, "choose_syllables", "slot_selection"),
+        (buttify_funcs, "get_buttword_plural", "pluralization"),
+        (buttify_funcs, "match_capitalisation", "casing"),
+        (Bot, "send_buttified", "send"),
+        (Bot, "send_reply", "send"),
+        (Bot, "log_butt_result", "log"),
+        (SettingsStore, "_timed_write", "settings_write"),
+    ])
+
+
+def load_settings() -> tuple[SettingsStore, Dict[str, ChannelState], set[str]]:
+    settings_store = create_settings_store(SETTINGS_BACKEND, JSON_DATA_PATH, IGNORED_LIST_PATH, SETTINGS_DB_PATH)
+    settings = settings_store.load()
+    if not settings:
+        settings[bot_nickname] = ChannelState(bot_nickname)
 
     # You can set up a general logger for the bot if needed
     logger = get_logger_for_channel("bot")
-    logger.info(f'current settings: {settings}')
-    logger.info('successfully loaded settings...')
-    bot = Bot(settings)
+    logger.debug('current settings: %s', settings)
+    logger.info(f'successfully loaded settings from {SETTINGS_BACKEND} in ' +
+                f'{settings_store.stats["load_seconds"] * 1000:.1f}ms...')
+    ignored = settings_store.load_ignored()
+    logger.info(f'loaded {len(ignored)} ignored users...')
+    return settings_store, settings, ignored
+
+
+def run_connection_shards(settings: Dict[str, ChannelState], ignored: set[str], settings_store: SettingsStore):
+    # Every shard is its own IRC connection, all running on this process's event loop
+    router = ConnectionShardRouter(SHARD_COUNT)
+    # Built once and shared by every shard along with the settings and ignore list, closed here once they've all
+    # disconnected rather than by each shard
+    send_scheduler = create_send_scheduler(router)
+    worker_pool = create_worker_pool()
+    buttify_seconds = Histogram()
+    for shard_id in range(SHARD_COUNT):
+        router.bots.append(Bot(settings, ignored, settings_store, router, shard_id,
+                               send_scheduler=send_scheduler, worker_pool=worker_pool,
+                               buttify_seconds=buttify_seconds))
+
+    loop = router.bots[0].loop
+    try:
+        loop.run_until_complete(asyncio.gather(*(bot.start() for bot in router.bots)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for bot in router.bots:
+            loop.run_until_complete(bot.close())
+        loop.run_until_complete(close_shared(settings_store, send_scheduler, worker_pool, router))
+        loop.close()
+        stop_background_logging()
+
+
+def run_process_shard(shard_id: int, shard_count: int, inbox, outbox):
+    # Runs in each shard's process, started by run_shard_processes. Set everything up again in case the process
+    # started from a fresh import (the spawn start method) instead of a copy of this one
+    load_config()
+    hyphenation_cache.resize(HYPHENATION_CACHE)
+    set_log_level(LOG_LEVEL)
+    set_log_file_limits(**LOG_FILE_LIMITS)
+    if LOG_MODE == "queue":
+        start_background_logging()
+    if "stages" in BOT_PROFILE:
+        time_message_stages()
+
+    settings_store, settings, ignored = load_settings()
+    router = ProcessShardRouter(shard_id, shard_count, inbox, outbox)
+    # Only keep this shard's channels, the other processes save theirs to the same database. Dropped from the
+    # store's own dict, so channels joined later are in what the store saves
+    for name in [name for name in settings if router.owner_of(name) != shard_id]:
+        del settings[name]
+    bot = Bot(settings, ignored, settings_store, router=router, shard_id=shard_id)
+    bot.run()
+
+
+def main():
+    load_config()
+    # Create a folder for logs if it doesn't exist
+    if not os.path.exists(LOG_DIR):
+        os.makedirs(LOG_DIR)
+
+    hyphenation_cache.resize(HYPHENATION_CACHE)
+    set_log_level(LOG_LEVEL)
+    set_log_file_limits(**LOG_FILE_LIMITS)
+
+    if SHARD_COUNT > 1 and SHARD_MODE == "process":
+        if SETTINGS_BACKEND != "sqlite":
+            raise ValueError("SHARD_MODE=process needs SETTINGS_BACKEND=sqlite")
+        # Create (or migrate to) the database once here, so the shards don't all try at the same time
+        asyncio.run(create_settings_store(SETTINGS_BACKEND, JSON_DATA_PATH, IGNORED_LIST_PATH,
+                                          SETTINGS_DB_PATH).close())
+        run_shard_processes(SHARD_COUNT, run_process_shard)
+        return
+    if SHARD_COUNT > 1 and SHARD_MODE != "connection":
+        raise ValueError(f"Unknown shard mode '{SHARD_MODE}', use 'connection' or 'process'")
+
+    if LOG_MODE == "queue":
+        start_background_logging()
+    if "stages" in BOT_PROFILE:
+        time_message_stages()
+
+    settings_store, settings, ignored = load_settings()
+    if SHARD_COUNT > 1:
+        run_connection_shards(settings, ignored, settings_store)
+        return
+
+    bot = Bot(settings, ignored, settings_store)
     bot.run()
 
 
@@ -0,0 +1,193 @@
+"""
+Buttifies messages without connecting to Twitch, using the same pipeline as the bot (see buttify_funcs.buttify).
+
+Reads stdin or files, either plain text with a message per line or JSONL with one object per line:
+    {"content": "...", "channel": "...", "word": "butt", "random_words_enabled": false, "random_words_list": [],
+     "random_words_weights": {}, "reply": false, "emotes": "25:0-4"}
+where everything but "content" is optional and falls back to the command line options. "emotes" is the message's
+Twitch emotes tag, the emotes in it are never replaced. Blank lines are skipped.
+
+Every message is buttified (the buttrate isn't rolled), spread over a process pool, and the results are written
+in input order as JSONL (or as plain text with --text). The input is read and written a chunk at a time, so
+files larger than memory are fine.
+
+Usage (from the repo root):
+    python src/buttify_cli.py [files...] [--output out.jsonl] [--workers 4] [--per-sentence 10] [--seed 1]
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterable, Iterator
+from buttify_funcs import ButtJob, buttify, get_emote_names, get_message_content, load_dictionaries
+from syllable_funcs import syllables_to_sentence
+from word_list_funcs import WeightedWordList
+
+# Lines handed to a worker at once, big enough that passing them around costs little next to buttifying them
+DEFAULT_CHUNK_SIZE = 500
+# Chunks in flight per worker, so workers always have the next one ready without reading the whole input
+CHUNKS_PER_WORKER = 2
+
+
+def read_lines(paths: list[str]) -> Iterator[str]:
+    """Every line of the files in order ("-" is stdin), without reading any of them in whole"""
+    for path in paths or ["-"]:
+        if path == "-":
+            yield from sys.stdin
+            continue
+        with open(path, "r", encoding="utf8") as input_file:
+            yield from input_file
+
+
+def make_job(line: str, defaults: dict) -> ButtJob | None:
+    """The job for one input line, None for blank lines"""
+    line = line.rstrip("\r\n")
+    if not line.strip():
+        return None
+
+    values = dict(defaults)
+    if line.lstrip().startswith("{"):
+        values.update(json.loads(line))
+    else:
+        values["content"] = line
+    # Anything else would only fail once it's being buttified, reported as an error for this line instead
+    for field in ("channel", "content", "word"):
+        if not isinstance(values[field], str):
+            raise ValueError(f"'{field}' has to be a string, not {type(values[field]).__name__}")
+
+    return ButtJob(
+        channel=values["channel"],
+        content=get_message_content(values["content"], values.get("reply", False)),
+        word=values["word"],
+        random_words_enabled=values["random_words_enabled"],
+        random_words=WeightedWordList(values["random_words_list"], values.get("random_words_weights")).table,
+        # Worked out (and cached) as they're needed, channels in the input aren't known ahead of time
+        plurals={},
+        per_sentence=values["per_sentence"],
+        min_spacing=values["min_spacing"],
+        emotes=get_emote_names(values["content"], values.get("emotes")))
+
+
+def buttify_chunk(chunk: list[tuple[int, str]], defaults: dict, seed: int | None) -> list[dict]:
+    """Buttify a chunk of (line number, line) in a worker, returns a result for each non-blank line"""
+    if seed is not None:
+        # Seeded per chunk, so the output is the same however the chunks are spread over the workers
+        random.seed(seed + chunk[0][0])
+
+    results = []
+    for line_number, line in chunk:
+        try:
+            job = make_job(line, defaults)
+        except (ValueError, KeyError, TypeError) as e:
+            results.append({"line": line_number, "error": f"Couldn't read the line: {e}"})
+            continue
+        if job is None:
+            continue
+
+        result = buttify(job)
+        results.append({
+            "line": line_number,
+            "channel": job.channel,
+            "input": job.content,
+            "output": syllables_to_sentence(result.syllable_lists) if result.syllable_lists is not None else None,
+            "failure": result.failure,
+            "butts": len(result.replacements),
+            "emotes_skipped": result.emotes_skipped,
+        })
+    return results
+
+
+def chunked(lines: Iterable[str], size: int) -> Iterator[list[tuple[int, str]]]:
+    numbered = enumerate(lines, start=1)
+    while True:
+        chunk = list(itertools.islice(numbered, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run_in_order(chunks: Iterator[list[tuple[int, str]]], defaults: dict, seed: int | None,
+                 workers: int) -> Iterator[list[dict]]:
+    """The results of each chunk in input order, with at most a couple of chunks per worker read ahead"""
+    if workers <= 1:
+        load_dictionaries()
+        for chunk in chunks:
+            yield buttify_chunk(chunk, defaults, seed)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=load_dictionaries) as executor:
+        in_flight: deque[Future] = deque()
+        for chunk in chunks:
+            in_flight.append(executor.submit(buttify_chunk, chunk, defaults, seed))
+            if len(in_flight) >= workers * CHUNKS_PER_WORKER:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def main():
+    from bot import BUTT_REPLACEMENT_PER_SENTENCE, MIN_BUTT_SPACING  # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="files to read, stdin if none (or -)")
+    parser.add_argument("--output", help="write the results here instead of stdout")
+    parser.add_argument("--text", action="store_true",
+                        help="write just the buttified message per line (the input as it was if nothing was replaced)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="processes to buttify on, 1 runs everything in this process")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--seed", type=int, help="seed the random choices so the output can be compared between runs")
+    parser.add_argument("--channel", default="cli")
+    parser.add_argument("--word", default="butt")
+    parser.add_argument("--random-words", nargs="*", default=[],
+                        help="random words to use instead of the word (like !addword and !togglerandomwords)")
+    parser.add_argument("--per-sentence", type=int, default=BUTT_REPLACEMENT_PER_SENTENCE,
+                        help="a butt per this many words")
+    parser.add_argument("--min-spacing", type=int, default=MIN_BUTT_SPACING,
+                        help="minimum words between two butts")
+    args = parser.parse_args()
+
+    defaults = {
+        "channel": args.channel,
+        "word": args.word,
+        "random_words_enabled": bool(args.random_words),
+        "random_words_list": args.random_words,
+        "per_sentence": args.per_sentence,
+        "min_spacing": args.min_spacing,
+    }
+
+    counts = {"messages": 0, "replaced": 0, "too short": 0, "no syllable": 0, "emote only": 0, "errors": 0}
+    start = time.perf_counter()
+    output = open(args.output, "w", encoding="utf8") if args.output else sys.stdout  # pylint: disable=consider-using-with
+    try:
+        chunks = chunked(read_lines(args.files), max(args.chunk_size, 1))
+        for results in run_in_order(chunks, defaults, args.seed, args.workers):
+            for result in results:
+                if "error" in result:
+                    counts["errors"] += 1
+                    print(f"Line {result['line']}: {result['error']}", file=sys.stderr)
+                    continue
+
+                counts["messages"] += 1
+                counts[result["failure"] or "replaced"] += 1
+                if args.text:
+                    output.write((result["output"] if result["output"] is not None else result["input"]) + "\n")
+                else:
+                    output.write(json.dumps(result) + "\n")
+    finally:
+        if args.output:
+            output.close()
+
+    seconds = time.perf_counter() - start
+    counts["seconds"] = round(seconds, 3)
+    counts["messages_per_second"] = round(counts["messages"] / seconds if seconds else 0.0, 1)
+    print(json.dumps(counts), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import math
+import time
+from typing import NamedTuple
+from plural_funcs import get_buttword_plural, get_inflect_engine, get_syllables_no_punctuation
+from selection_funcs import index_syllables, choose_syllables
+from syllable_funcs import get_pyphen, syllables_split
+from word_list_funcs import AliasTable
+
+
+class ButtJob(NamedTuple):
+    """
+    Everything needed to buttify one message, as plain data so it can be handed to another thread or process
+    (twitchio's Message objects never leave the bot)
+    """
+    channel: str
+    content: str
+    word: str
+    random_words_enabled: bool
+    # The channel's random words, weighted (shared between jobs, it's never changed)
+    random_words: AliasTable
+    plurals: dict[str, str]
+    # butts per __ words in the message
+    per_sentence: int
+    # minimum distance in words between two butts
+    min_spacing: int
+    # time.time() when the job was made, to measure how long it waited for a worker
+    submitted_at: float = 0.0
+    # Words in the message that are Twitch emotes (see get_emote_names), never hyphenated or replaced
+    emotes: frozenset[str] = frozenset()
+    # The content already split into syllables (shared by a copypasta wave's messages), None to split it here
+    syllables: tuple[tuple[str, ...], ...] | None = None
+
+
+class ButtResult(NamedTuple):
+    channel: str
+    # The message split into words and syllables with the butts in, None if nothing was replaced
+    syllable_lists: list[list[str]] | None
+    # (new syllable, word it was put in, buttword) for each butt, for logging
+    replacements: list[tuple[str, list[str], str]]
+    # Why nothing was replaced ("too short", "no syllable" or "emote only"), None if something was
+    failure: str | None
+    queue_seconds: float = 0.0
+    compute_seconds: float = 0.0
+    # Emote words that were left alone
+    emotes_skipped: int = 0
+
+
+def get_message_content(content: str, is_reply: bool) -> str:
+    """Remove @ from start of message if it is a reply"""
+    if is_reply:
+        return " ".join(content.split(" ")[1:])
+    return content
+
+
+def get_emote_names(content: str, emotes_tag: str | None) -> frozenset[str]:
+    """
+    The emotes in a message, from its "emotes" tag, e.g. "25:0-4,12-16/1902:6-10" is emote 25 at characters 0-4
+    and 12-16 and emote 1902 at 6-10 of the message as sent (before get_message_content takes off a reply's @).
+    Every use of an emote is the same word, so only the first range of each is read.
+    """
+    if not emotes_tag:
+        return frozenset()
+
+    names = set()
+    for emote in emotes_tag.split("/"):
+        _, _, ranges = emote.partition(":")
+        start, _, end = ranges.split(",", 1)[0].partition("-")
+        try:
+            start, end = int(start), int(end)
+        except ValueError:
+            # Malformed tag, skip that emote rather than the whole message
+            continue
+        # A range past the end of the message doesn't belong to it, slicing would take whatever is there
+        if 0 <= start <= end < len(content):
+            names.add(content[start:end + 1])
+    return frozenset(names)
+
+
+def match_capitalisation(syllable: str, buttword: str) -> str:
+    """Gives the buttword the same capitalisation as the syllable it replaces"""
+    if syllable == syllable.upper():
+        return buttword.upper()
+    if syllable == syllable[0].upper() + syllable[1:].lower():
+        return buttword[0].upper() + buttword[1:]
+    return buttword.lower()
+
+
+def choose_streamer_word(job: ButtJob) -> str:
+    # decide which streamer word to use:
+    # if random_words are enabled (and there are any), choose from there, otherwise take the single set word
+    if job.random_words_enabled and len(job.random_words) > 0:
+        return job.random_words.choose()
+    return job.word
+
+
+def buttify(job: ButtJob) -> ButtResult:
+    """Replaces syllables in the message with the streamer's buttword(s)"""
+    emotes_skipped = 0
+    if job.emotes:
+        words = job.content.split()
+        emotes_skipped = sum(1 for word in words if word in job.emotes)
+        # Nothing to butt in a message of only emotes, don't hyphenate any of it
+        if emotes_skipped == len(words):
+            return ButtResult(job.channel, None, [], "emote only", emotes_skipped=emotes_skipped)
+
+    if job.syllables is not None:
+        # Copied since the syllables get replaced with butts
+        syllable_lists = [list(word) for word in job.syllables]
+    else:
+        syllable_lists = syllables_split(job.content, job.emotes)
+    if not syllable_lists:
+        return ButtResult(job.channel, None, [], "too short", emotes_skipped=emotes_skipped)
+
+    # Ignore messages with single words that have less than 3 syllables (not including punctuation)
+    filtered_syllables = len([x for x in get_syllables_no_punctuation(syllable_lists[0]) if x != ''])
+    if len(syllable_lists) <= 1 and filtered_syllables < 3:
+        return ButtResult(job.channel, None, [], "too short", emotes_skipped=emotes_skipped)
+
+    # calc the number of replacements in the sentence
+    butt_num = math.ceil(len(syllable_lists) / job.per_sentence)
+
+    # Find everything that could be replaced in one go, then pick from it
+    chosen = choose_syllables(index_syllables(syllable_lists, job.emotes), butt_num, job.min_spacing)
+    if not chosen:
+        return ButtResult(job.channel, None, [], "no syllable", emotes_skipped=emotes_skipped)
+
+    replacements = []
+    for random_word, random_syllable in chosen:
+        # Check if the given syllable should be plural
+        buttword = get_buttword_plural(
+            choose_streamer_word(job), syllable_lists[random_word], random_syllable, job.plurals)
+
+        # Check the capitalisation
+        syll = match_capitalisation(syllable_lists[random_word][random_syllable], buttword)
+        syllable_lists[random_word][random_syllable] = syll
+        replacements.append((syll, syllable_lists[random_word], buttword))
+
+    return ButtResult(job.channel, syllable_lists, replacements, None, emotes_skipped=emotes_skipped)
+
+
+def run_job(job: ButtJob) -> ButtResult:
+    """Runs a job in a worker, timing how long it waited and how long it took"""
+    queue_seconds = time.time() - job.submitted_at if job.submitted_at else 0.0
+    start = time.perf_counter()
+    result = buttify(job)
+    return result._replace(queue_seconds=max(queue_seconds, 0.0), compute_seconds=time.perf_counter() - start)
+
+
+def load_dictionaries():
+    """Create the inflect engine and pyphen dictionary now, instead of on the first message that needs them"""
+    get_inflect_engine()
+    get_pyphen()
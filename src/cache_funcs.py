@@ -0,0 +1,76 @@
+import threading
+from collections import OrderedDict
+
+# Returned by LRUCache.get when the key isn't cached, so None can still be cached as a value
+MISSING = object()
+
+
+class LRUCache:
+    """
+    A size bounded cache that throws out the least recently used entry once it is full.
+    Keeps hit/miss/eviction counts so the capacity can be tuned against the hit rate.
+    A capacity of 0 turns the cache off (nothing is stored, every lookup is a miss).
+    Safe to share between threads (e.g. the buttify worker threads).
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(capacity, 0)
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            try:
+                value = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.capacity == 0:
+            return
+
+        with self._lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def resize(self, capacity: int):
+        """Change the capacity, dropping the least recently used entries if it shrinks"""
+        with self._lock:
+            self.capacity = max(capacity, 0)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "size": len(self.entries),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate,
+        }
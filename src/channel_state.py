@@ -0,0 +1,105 @@
+import logging
+from copypasta_funcs import RepeatWindow
+from logging_funcs import get_logger_for_channel
+from word_list_funcs import WeightedWordList
+
+# default streamer settings
+DEFAULT_BUTT_INFO = {"rate": 30, "word": "butt", "random_words_enabled": False, "random_words_list": []}
+# Settings saved for each channel, the rest of ChannelState only lives while the bot runs.
+# Weights other than 1 are saved next to the word list, so the list itself reads the same as before
+SAVED_FIELDS = (*DEFAULT_BUTT_INFO, "random_words_weights")
+
+
+class ChannelState:
+    """
+    Everything the bot keeps about one channel: its saved settings plus what's worked out or counted while running.
+
+    Uses __slots__ since there's one per channel and thousands of channels, and every new channel gets its own copy
+    of the defaults (nothing is shared between channels).
+    """
+    __slots__ = ("name", "rate", "word", "random_words_enabled", "random_words", "extra",
+                 "plurals", "missed", "countdown", "last_message_at", "messages", "buttify_attempts", "butts",
+                 "repeats", "repeat_window", "_logger")
+
+    def __init__(self, name: str, rate: int = DEFAULT_BUTT_INFO["rate"], word: str = DEFAULT_BUTT_INFO["word"],
+                 random_words_enabled: bool = DEFAULT_BUTT_INFO["random_words_enabled"],
+                 random_words_list: list[str] | None = None, random_words_weights: dict[str, int] | None = None,
+                 extra: dict | None = None):
+        self.name = name
+        self.rate = rate
+        self.word = word
+        self.random_words_enabled = random_words_enabled
+        self.random_words = WeightedWordList(random_words_list or (), random_words_weights)
+        # Saved fields this version of the bot doesn't know about, kept so they're written back as they were
+        self.extra = extra
+
+        # Plurals of the buttword and random words (None until worked out, see Bot.refresh_plurals)
+        self.plurals: dict[str, str] | None = None
+        # Messages since the last butt
+        self.missed = 0
+        # Messages left to go by before the next butt, None until drawn
+        self.countdown: int | None = None
+        # time.time() of the last message in the channel, 0 if there hasn't been one
+        self.last_message_at = 0.0
+        # Counted since starting up, for the metrics page
+        self.messages = 0
+        self.buttify_attempts = 0
+        self.butts = 0
+        # Messages that were part of a copypasta wave
+        self.repeats = 0
+        # Recent messages, to spot copypasta waves (created with the first message)
+        self.repeat_window: RepeatWindow | None = None
+        self._logger: logging.Logger | None = None
+
+    @classmethod
+    def from_dict(cls, name: str, values: dict) -> "ChannelState":
+        """A channel's state from its saved settings (as in streamer_settings.json)"""
+        extra = {field: value for field, value in values.items() if field not in SAVED_FIELDS}
+        return cls(name, values.get("rate", DEFAULT_BUTT_INFO["rate"]), values.get("word", DEFAULT_BUTT_INFO["word"]),
+                   values.get("random_words_enabled", DEFAULT_BUTT_INFO["random_words_enabled"]),
+                   values.get("random_words_list"), values.get("random_words_weights"), extra or None)
+
+    def to_dict(self) -> dict:
+        """The channel's saved settings, copied so they can be written on another thread"""
+        values = {
+            "rate": self.rate,
+            "word": self.word,
+            "random_words_enabled": self.random_words_enabled,
+            "random_words_list": list(self.random_words.words),
+        }
+        weights = self.random_words.weight_dict()
+        if weights:
+            values["random_words_weights"] = weights
+        if self.extra:
+            values.update(self.extra)
+        return values
+
+    def update(self, values: dict) -> bool:
+        """
+        Change the saved settings to `values` (e.g. after the settings file was edited), keeping everything
+        counted while running. Returns False if they were already the same
+        """
+        new = ChannelState.from_dict(self.name, values)
+        if new.to_dict() == self.to_dict():
+            return False
+
+        if new.rate != self.rate:
+            # Drawn again with the new rate on the next message
+            self.countdown = None
+        self.rate = new.rate
+        self.word = new.word
+        self.random_words_enabled = new.random_words_enabled
+        self.random_words = new.random_words
+        self.extra = new.extra
+        return True
+
+    @property
+    def words(self) -> list[str]:
+        """The buttword and every random word"""
+        return [self.word, *self.random_words.words]
+
+    @property
+    def logger(self) -> logging.Logger:
+        if self._logger is None:
+            self._logger = get_logger_for_channel(self.name)
+        return self._logger
@@ -0,0 +1,81 @@
+from collections import deque
+from syllable_funcs import syllables_split
+
+# What happens to a message repeated during a wave: "skip" it (no ignore check, rate roll or buttify),
+# "cache" it (buttified as normal, but the wave's messages are only split into syllables once) or "off"
+COPYPASTA_POLICIES = ("skip", "cache", "off")
+DEFAULT_COPYPASTA_POLICY = "skip"
+# Most recent messages of a channel kept to compare with
+DEFAULT_COPYPASTA_WINDOW = 50
+# Messages older than this many seconds don't count towards a wave
+DEFAULT_COPYPASTA_SECONDS = 30.0
+# Times a message has to be in the window to start a wave, the copies before that are handled as normal
+DEFAULT_COPYPASTA_THRESHOLD = 3
+
+# Added by chat clients (7TV, Chatterino) so Twitch lets the same message be sent twice in a row
+REPEAT_BYPASS_CHARACTER = '\U000e0000'
+
+
+def normalize_message(content: str) -> str:
+    """
+    The message as it's compared to others: without the repeat bypass character, the spaces around it or case.
+    Spacing inside the message is left alone, splitting every message on spaces would cost more than the rest
+    of the check
+    """
+    if REPEAT_BYPASS_CHARACTER in content:
+        content = content.replace(REPEAT_BYPASS_CHARACTER, "")
+    return content.strip().casefold()
+
+
+class RepeatWindow:
+    """
+    A channel's last `size` messages from the last `seconds`, kept as hashes of their normalized content with a
+    count of each, so seeing a message costs the same however fast chat is going.
+
+    Uses __slots__ since every channel with messages has one.
+    """
+    __slots__ = ("size", "seconds", "threshold", "entries", "counts", "syllables")
+
+    def __init__(self, size: int = DEFAULT_COPYPASTA_WINDOW, seconds: float = DEFAULT_COPYPASTA_SECONDS,
+                 threshold: int = DEFAULT_COPYPASTA_THRESHOLD):
+        self.size = max(size, 1)
+        self.seconds = seconds
+        self.threshold = threshold
+        # (time.time(), hash) of each message in the window, oldest first
+        self.entries: deque[tuple[float, int]] = deque()
+        # Messages in the window by hash
+        self.counts: dict[int, int] = {}
+        # Hash -> (content, syllables) of the waves' messages, for the "cache" policy
+        self.syllables: dict[int, tuple[str, tuple[tuple[str, ...], ...]]] = {}
+
+    def seen(self, content: str, now: float) -> int | None:
+        """Add a message to the window. Returns its hash if it's part of a wave, None if not"""
+        key = hash(normalize_message(content))
+        entries = self.entries
+        counts = self.counts
+        # Full, the oldest message makes way for this one. Then drop anything too old to count
+        if len(entries) >= self.size:
+            self._forget(entries.popleft()[1])
+        oldest = now - self.seconds
+        while entries and entries[0][0] < oldest:
+            self._forget(entries.popleft()[1])
+
+        entries.append((now, key))
+        count = counts[key] = counts.get(key, 0) + 1
+        return key if count >= self.threshold else None
+
+    def _forget(self, key: int):
+        count = self.counts[key] - 1
+        if count:
+            self.counts[key] = count
+        else:
+            # The wave (if it was one) is over
+            del self.counts[key]
+            self.syllables.pop(key, None)
+
+    def syllables_for(self, key: int, content: str, emotes: frozenset[str]) -> tuple[tuple[str, ...], ...]:
+        """The message split into syllables, worked out once per wave (again if a copy differs, e.g. in case)"""
+        cached = self.syllables.get(key)
+        if cached is None or cached[0] != content:
+            cached = self.syllables[key] = (content, tuple(tuple(word) for word in syllables_split(content, emotes)))
+        return cached[1]
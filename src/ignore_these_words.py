@@ -1,5 +1,10 @@
-IGNORE_WORDS = ["is", "are", "was", "were", "be", "being", "been", "has",
+IGNORE_WORDS = {"is", "are", "was", "were", "be", "being", "been", "has",
                 "have", "had", "a", "an", "the", "this", "that", "these",
                 "those", "my", "your", "his", "her", "and", "i", "or", "for",
                 "nor", "so", "yet", "in", "on", "at", "with", "about", "under",
-                "over", "through"]
+                "over", "through"}
+
+# Chat bots whose messages are never butted (or counted towards the buttrate)
+KNOWN_BOTS = {"nightbot", "streamelements", "streamlabs", "moobot", "fossabot", "wizebot", "botisimo",
+              "deepbot", "coebot", "phantombot", "sery_bot", "kofistreambot", "soundalerts", "streamstickers",
+              "commanderroot", "pokemoncommunitygame", "blerp", "frostytoolsdotcom", "own3d", "creatisbot"}
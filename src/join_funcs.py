@@ -0,0 +1,227 @@
+import asyncio
+import random
+import time
+from collections import Counter, deque
+from typing import Awaitable, Callable
+from logging_funcs import get_logger_for_channel
+from send_funcs import TokenBucket
+
+# Twitch lets an account that isn't verified join 20 channels per 10 seconds
+DEFAULT_JOIN_LIMIT = 20
+DEFAULT_JOIN_PERIOD = 10.0
+# Most channels handed to twitchio at once, it waits 11 seconds between every 20 when given more
+MAX_BATCH = 20
+# Seconds before retrying a failed join, doubled on each failure up to the max
+DEFAULT_RETRY_DELAY = 15.0
+DEFAULT_MAX_RETRY_DELAY = 600.0
+# Joins tried per channel before giving up on it until the next reconnect or !join
+DEFAULT_MAX_ATTEMPTS = 6
+
+# Where a channel is at
+PENDING = "pending"
+JOINING = "joining"
+JOINED = "joined"
+RETRYING = "retrying"
+GAVE_UP = "gave_up"
+
+
+class JoinStatus:
+    def __init__(self):
+        self.state = PENDING
+        self.attempts = 0
+        # time.monotonic() before which a failed join isn't tried again
+        self.retry_at = 0.0
+
+
+class JoinScheduler:
+    """
+    Joins channels in batches no faster than Twitch's join rate limit, in the order they were given.
+
+    Keeps the state of every channel, retries failed joins with backoff, and times how long it takes
+    to get through all the channels after (re)connecting.
+    """
+
+    def __init__(self, join: Callable[[list[str]], Awaitable], limit: int = DEFAULT_JOIN_LIMIT,
+                 period: float = DEFAULT_JOIN_PERIOD, retry_delay: float = DEFAULT_RETRY_DELAY,
+                 max_retry_delay: float = DEFAULT_MAX_RETRY_DELAY, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 on_all_joined: Callable[[int, int, float], None] | None = None):
+        self.join = join
+        self.bucket = TokenBucket(limit, period)
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_attempts = max_attempts
+        # Called with (joined, gave up, seconds) once every channel from start_round is joined or given up on
+        self.on_all_joined = on_all_joined
+
+        self.channels: dict[str, JoinStatus] = {}
+        # Channels waiting to be joined, next first
+        self.queue: deque[str] = deque()
+        # Channels not joined or given up on yet
+        self.outstanding = 0
+        self.round_started: float | None = None
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+        self.stats = {
+            "join_attempts": 0,
+            "joined": 0,
+            "failures": 0,
+            "gave_up": 0,
+            "last_round_channels": 0,
+            "last_round_seconds": 0.0,
+        }
+
+    @property
+    def state_counts(self) -> dict[str, int]:
+        return dict(Counter(status.state for status in self.channels.values()))
+
+    def start_round(self, channels: list[str]):
+        """
+        Join all these channels, in this order (e.g. after connecting). Channels joined before count as
+        not joined, since a new connection starts out in no channels
+        """
+        self.channels = {channel_name: JoinStatus() for channel_name in channels}
+        self.queue = deque(self.channels)
+        self.outstanding = len(self.channels)
+        self.round_started = time.monotonic()
+        self._start()
+        self._check_done()
+
+    def request(self, channel_name: str):
+        """Join one more channel ahead of the ones still waiting, e.g. for !join"""
+        status = self.channels.get(channel_name)
+        if status is not None and status.state in (JOINING, JOINED):
+            return
+
+        if status is None or status.state == GAVE_UP:
+            self.outstanding += 1
+        if channel_name in self.queue:
+            self.queue.remove(channel_name)
+
+        self.channels[channel_name] = JoinStatus()
+        self.queue.appendleft(channel_name)
+        self._start()
+
+    def forget(self, channel_name: str):
+        """Stop trying to join the channel, e.g. after !leave"""
+        status = self.channels.pop(channel_name, None)
+        if status is None:
+            return
+
+        if status.state not in (JOINED, GAVE_UP):
+            self.outstanding -= 1
+        if channel_name in self.queue:
+            self.queue.remove(channel_name)
+        self._check_done()
+
+    def joined(self, channel_name: str):
+        status = self.channels.get(channel_name)
+        if status is None or status.state == JOINED:
+            return
+
+        # A join can still come through after twitchio timed it out
+        if status.state != GAVE_UP:
+            self.outstanding -= 1
+        status.state = JOINED
+        self.stats["joined"] += 1
+        self._check_done()
+
+    def failed(self, channel_name: str):
+        status = self.channels.get(channel_name)
+        if status is None or status.state != JOINING:
+            return
+
+        self.stats["failures"] += 1
+        if status.attempts >= self.max_attempts:
+            status.state = GAVE_UP
+            self.outstanding -= 1
+            self.stats["gave_up"] += 1
+            self._check_done()
+            return
+
+        # A bit of jitter so channels that failed together don't all retry together
+        delay = min(self.retry_delay * 2 ** (status.attempts - 1), self.max_retry_delay)
+        status.state = RETRYING
+        status.retry_at = time.monotonic() + delay * random.uniform(0.8, 1.2)
+        self.queue.append(channel_name)
+        self._wakeup.set()
+
+    def _check_done(self):
+        if self.round_started is None or self.outstanding > 0:
+            return
+
+        seconds = time.monotonic() - self.round_started
+        counts = self.state_counts
+        self.round_started = None
+        self.stats["last_round_channels"] = len(self.channels)
+        self.stats["last_round_seconds"] = seconds
+        if self.on_all_joined is not None:
+            self.on_all_joined(counts.get(JOINED, 0), counts.get(GAVE_UP, 0), seconds)
+
+    def _start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+
+    def _next_batch(self, now: float) -> tuple[list[str], float | None]:
+        """The channels to join now, or an empty list and how long to wait before checking again"""
+        batch = []
+        wait = None
+        waiting: deque[str] = deque()
+        while self.queue and len(batch) < MAX_BATCH:
+            channel_name = self.queue.popleft()
+            status = self.channels.get(channel_name)
+            if status is None or status.state not in (PENDING, RETRYING):
+                continue
+
+            if status.retry_at > now:
+                waiting.append(channel_name)
+                wait = status.retry_at - now if wait is None else min(wait, status.retry_at - now)
+                continue
+
+            if not self.bucket.has_token(now):
+                waiting.append(channel_name)
+                token_wait = self.bucket.wait_time(now)
+                wait = token_wait if wait is None else min(wait, token_wait)
+                break
+
+            self.bucket.take()
+            batch.append(channel_name)
+
+        # Keep the channels that can't go yet in the same order, in front of the ones not looked at
+        waiting.extend(self.queue)
+        self.queue = waiting
+        return batch, wait
+
+    async def _run(self):
+        while True:
+            batch, wait = self._next_batch(time.monotonic())
+            if batch:
+                for channel_name in batch:
+                    status = self.channels[channel_name]
+                    status.state = JOINING
+                    status.attempts += 1
+                self.stats["join_attempts"] += len(batch)
+
+                try:
+                    await self.join(batch)
+                except Exception as e:
+                    get_logger_for_channel("bot").error("Errored joining %d channels: %s", len(batch), e)
+                    for channel_name in batch:
+                        self.failed(channel_name)
+                continue
+
+            # Sleep until a token is free or a retry is due, or until more channels are requested
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def close(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
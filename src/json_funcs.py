@@ -1,11 +1,10 @@
 import os
 import json
-from enum import StrEnum
+import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
 
-
-class StreamerMode(StrEnum):
-    ADD = "add"
-    REMOVE = "rm"
+# A single worker keeps background saves landing on disk in the order they were made
+_save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="json_save")
 
 
 def open_file(path: str, empty: dict | list):
@@ -23,44 +22,38 @@ def save_to_file(path: str, info: dict | list):
     with open(path, "w", encoding="utf8") as json_file:
         json.dump(info, json_file, indent=4)
 
-# type: ignore
 
+def atomic_write(path: str, data: bytes):
+    """Writes to a temp file next to `path` and renames it over the top, so the file is never half written"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as temp_file:
+            temp_file.write(data)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        # Don't leave temp files lying around if the write failed
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
 
-def modify_streamer_settings(path: str, mode: StreamerMode, new_entry: dict[str, dict]):
-    # Open the settings file and get contents
-    settings = open_file(path, {})
 
-    if mode == StreamerMode.ADD:
-        # Add the new entry to the dictionary
-        settings.update(new_entry)
-    elif mode == StreamerMode.REMOVE:
-        # Ensure new_entry contains a single key (which is what we want to remove)
-        if isinstance(new_entry, dict):
-            for key in new_entry.keys():
-                # Use None to avoid KeyError if the key doesn't exist
-                settings.pop(key, None)
+def save_to_file_atomically(path: str, info: dict | list):
+    # Like save_to_file, but a crash part way through leaves the old file instead of a truncated one
+    atomic_write(path, json.dumps(info, indent=4).encode("utf8"))
 
-    # Save the updated dictionary back to the JSON file
-    save_to_file(path, settings)
 
+def run_in_background(func, *args) -> Future:
+    # Runs a save on the background thread, saves run one at a time in the order they were made
+    return _save_executor.submit(func, *args)
 
-def modify_streamer_values(path: str, channel_name: str, field: str, new_value: int | str | list):
-    # Open the settings file and get contents
-    settings = open_file(path, {})
 
-    # Check if the channel exists in settings, then update the specified field
-    if channel_name in settings:
-        if field in settings[channel_name]:
-            settings[channel_name][field] = new_value  # Update the field value
-        else:
-            print(
-                f"Field '{field}' does not exist in the channel '{channel_name}'.")
-    else:
-        print(f"Channel '{channel_name}' does not exist in the settings.")
-
-    # Save the updated dictionary back to the JSON file
-    save_to_file(path, settings)
-    print(f"Updated '{field}' for channel '{channel_name}' to {new_value}")
+def save_to_file_in_background(path: str, info: dict | list) -> Future:
+    # Saves the information on a background thread so the caller never waits on the disk
+    # Note: pass a snapshot, the object must not be modified while it is being written
+    return run_in_background(save_to_file_atomically, path, info)
 
 
 # adding new settings parameter to a streamer channel
@@ -101,31 +94,32 @@ def check_user_exists(path: str, user: str) -> bool:
         return False
 
 
-def add_ignore_list(path: str, user: str):
-    ignored = open_file(path, [])
+def load_ignore_list(path: str) -> set[str]:
+    # Loads the ignore list into a set so checking a user doesn't need the file
+    return set(open_file(path, []))
 
+
+def add_ignore_list(path: str, ignored: set[str], user: str):
     # Check if the user is already in the list
     if user in ignored:
         return False
 
     # Add the user to the list
-    ignored.append(user)
+    ignored.add(user)
 
-    # Save the updated list back to the JSON file
-    save_to_file(path, ignored)
+    # Save the updated list back to the JSON file without blocking
+    save_to_file_in_background(path, sorted(ignored))
     return True
 
 
-def remove_ignore_list(path: str, user: str):
-    ignored = open_file(path, [])
-
+def remove_ignore_list(path: str, ignored: set[str], user: str):
     # Check if the user is in the list
-    if user in ignored:
-        # Remove the user from the list
-        ignored.remove(user)
-    else:
+    if user not in ignored:
         return False
 
-    # Save the updated list back to the JSON file
-    save_to_file(path, ignored)
+    # Remove the user from the list
+    ignored.discard(user)
+
+    # Save the updated list back to the JSON file without blocking
+    save_to_file_in_background(path, sorted(ignored))
     return True
@@ -1,33 +1,342 @@
 # Function to set up a logger for a specific channel, saving logs in streamer_logs folder
+import atexit
+import gzip
 import logging
 import os
+import queue
+import shutil
+import time
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener
+
+# Folder the channel log files are written to
+LOG_DIR = "streamer_logs"
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Channel log files kept open at once, the least recently written to is closed to make room
+DEFAULT_MAX_OPEN_LOGS = 256
+# Log files not written to for this many seconds are closed, they're opened again on the next line
+DEFAULT_LOG_IDLE_SECONDS = 300.0
+# When to start a new log file: "size" (once it's LOG_MAX_BYTES), "daily" (the first line of a new day) or "off"
+LOG_ROTATE_MODES = ("size", "daily", "off")
+DEFAULT_LOG_ROTATE = "size"
+DEFAULT_LOG_MAX_BYTES = 10_000_000
+# Most bytes of old (rotated) log files kept per channel and in total, the oldest are deleted first (0 = no limit)
+DEFAULT_LOG_CHANNEL_QUOTA = 50_000_000
+DEFAULT_LOG_TOTAL_QUOTA = 0
+# Seconds between looking for idle log files to close
+IDLE_CHECK_SECONDS = 60.0
+
+# Level for every channel logger, e.g. INFO or WARNING to drop the per-replacement lines
+log_level = logging.DEBUG
+# Loggers already set up, so a lookup is a single dict get
+channel_loggers: dict[str, logging.Logger] = {}
+
+# Set when logging in the background: records go on the queue and the listener thread writes them
+log_queue: queue.SimpleQueue | None = None
+log_listener: QueueListener | None = None
+# Writes every channel's log lines (see get_channel_file_handler), created with the first logger
+channel_file_handler: "ChannelFileHandler | None" = None
+# Passed to the ChannelFileHandler when it's created, see set_log_file_limits
+log_file_limits: dict = {}
+
+
+class LogFile:
+    """A channel's log file, while it's open"""
+    __slots__ = ("stream", "day", "last_used")
+
+    def __init__(self, stream, day: str, last_used: float):
+        self.stream = stream
+        # Day (YYYYMMDD) of the first line in the file, for daily rotation
+        self.day = day
+        self.last_used = last_used
+
+
+class ChannelFileHandler(logging.Handler):
+    """
+    Writes each record to the log file of the channel it came from (the logger's name is the channel name).
+
+    Only the `max_open` most recently written files are kept open, and files idle for `idle_seconds` are closed,
+    so thousands of channels don't run out of file descriptors. Files are rotated to `<channel>.log.<time>`
+    (gzipped if `compress`) by size or by day, and old rotated files are deleted once a channel's add up to more
+    than `channel_quota` bytes or everyone's to more than `total_quota`.
+    """
+
+    def __init__(self, directory: str = LOG_DIR, max_open: int = DEFAULT_MAX_OPEN_LOGS,
+                 idle_seconds: float = DEFAULT_LOG_IDLE_SECONDS, rotate: str = DEFAULT_LOG_ROTATE,
+                 max_bytes: int = DEFAULT_LOG_MAX_BYTES, compress: bool = True,
+                 channel_quota: int = DEFAULT_LOG_CHANNEL_QUOTA, total_quota: int = DEFAULT_LOG_TOTAL_QUOTA):
+        super().__init__()
+        if rotate not in LOG_ROTATE_MODES:
+            raise ValueError(f"Unknown log rotation '{rotate}', use {', '.join(LOG_ROTATE_MODES)}")
+        self.directory = directory
+        self.max_open = max(max_open, 1)
+        self.idle_seconds = idle_seconds
+        self.rotate = rotate
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.channel_quota = channel_quota
+        self.total_quota = total_quota
+        self.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=DATE_FORMAT))
+
+        # Open files, least recently written to first
+        self.files: OrderedDict[str, LogFile] = OrderedDict()
+        # Size of each channel's current log file, open or not
+        self.sizes: dict[str, int] = {}
+        # Each channel's rotated files as (path, size), oldest first
+        self.rotated: dict[str, list[tuple[str, int]]] = {}
+        self.total_bytes = 0
+        self.last_idle_check = time.time()
+        self.stats = {"opened": 0, "closed": 0, "rotated": 0, "deleted": 0}
+        self._scan()
+
+    def _scan(self):
+        # Sizes of the log files already there, so the quotas count them
+        os.makedirs(self.directory, exist_ok=True)
+        with os.scandir(self.directory) as entries:
+            for entry in sorted(entries, key=lambda entry: rotated_order(entry.name)):
+                channel_name, log, stamp = entry.name.partition(".log")
+                if not log or not entry.is_file():
+                    continue
+                size = entry.stat().st_size
+                if not stamp:
+                    self.sizes[channel_name] = size
+                elif stamp.startswith("."):
+                    self.rotated.setdefault(channel_name, []).append((entry.path, size))
+                else:
+                    continue
+                self.total_bytes += size
+
+    def path_of(self, channel_name: str) -> str:
+        return os.path.join(self.directory, f"{channel_name}.log")
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            data = (self.format(record) + "\n").encode("utf-8")
+            log_file = self._open(record.name, record.created)
+
+            size = self.sizes[record.name]
+            if self.rotate == "size" and self.max_bytes and size and size + len(data) > self.max_bytes:
+                log_file = self._rotate(record.name, record.created)
+            elif self.rotate == "daily" and log_file.day != day_of(record.created):
+                log_file = self._rotate(record.name, record.created)
+
+            log_file.stream.write(data)
+            log_file.stream.flush()
+            self.sizes[record.name] += len(data)
+            self.total_bytes += len(data)
+        except Exception:  # pylint: disable=broad-except
+            self.handleError(record)
+
+    def _open(self, channel_name: str, now: float) -> LogFile:
+        log_file = self.files.get(channel_name)
+        if log_file is not None:
+            self.files.move_to_end(channel_name)
+            log_file.last_used = now
+            return log_file
+
+        if now - self.last_idle_check > IDLE_CHECK_SECONDS:
+            self.close_idle(now)
+        while len(self.files) >= self.max_open:
+            self._close(next(iter(self.files)))
+
+        path = self.path_of(channel_name)
+        stream = open(path, "ab")  # pylint: disable=consider-using-with
+        try:
+            # Lines already in the file are from the day it was last written to
+            day = day_of(os.path.getmtime(path)) if stream.tell() else day_of(now)
+        except OSError:
+            day = day_of(now)
+        log_file = self.files[channel_name] = LogFile(stream, day, now)
+        # Appending, so whatever is there already counts towards the size
+        size = stream.tell()
+        self.total_bytes += size - self.sizes.get(channel_name, 0)
+        self.sizes[channel_name] = size
+        self.stats["opened"] += 1
+        return log_file
+
+    def _close(self, channel_name: str):
+        log_file = self.files.pop(channel_name, None)
+        if log_file is not None:
+            log_file.stream.close()
+            self.stats["closed"] += 1
+
+    def close_idle(self, now: float | None = None):
+        """Close the files nothing has been written to for idle_seconds"""
+        now = time.time() if now is None else now
+        self.last_idle_check = now
+        # Least recently used first, so stop at the first one that's still in use
+        while self.files:
+            channel_name, log_file = next(iter(self.files.items()))
+            if now - log_file.last_used < self.idle_seconds:
+                break
+            self._close(channel_name)
+
+    def _rotate(self, channel_name: str, now: float) -> LogFile:
+        """Move the channel's log file out of the way and start a new one"""
+        self._close(channel_name)
+        path = self.path_of(channel_name)
+        rotated_path = f"{path}.{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}"
+        number = 1
+        while os.path.exists(rotated_path) or os.path.exists(f"{rotated_path}.gz"):
+            rotated_path = f"{path}.{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{number}"
+            number += 1
+        os.replace(path, rotated_path)
+        size = self.sizes[channel_name]
+        self.sizes[channel_name] = 0
+
+        if self.compress:
+            with open(rotated_path, "rb") as source, gzip.open(f"{rotated_path}.gz", "wb") as target:
+                shutil.copyfileobj(source, target)
+            os.remove(rotated_path)
+            rotated_path += ".gz"
+            self.total_bytes += os.path.getsize(rotated_path) - size
+            size = os.path.getsize(rotated_path)
+
+        self.rotated.setdefault(channel_name, []).append((rotated_path, size))
+        self.stats["rotated"] += 1
+        self._enforce_quotas(channel_name)
+        return self._open(channel_name, now)
+
+    def _enforce_quotas(self, channel_name: str):
+        rotated = self.rotated.get(channel_name, [])
+        if self.channel_quota:
+            while rotated and sum(size for _, size in rotated) > self.channel_quota:
+                self._delete_oldest(channel_name)
+
+        if self.total_quota and self.total_bytes > self.total_quota:
+            # Oldest first across every channel, rotated files are named by when they were rotated
+            oldest = sorted((rotated_order(os.path.basename(path).partition(".log.")[2]), name)
+                            for name, files in self.rotated.items() for path, _ in files)
+            for _, name in oldest:
+                if self.total_bytes <= self.total_quota:
+                    break
+                self._delete_oldest(name)
+
+    def _delete_oldest(self, channel_name: str):
+        path, size = self.rotated[channel_name].pop(0)
+        if not self.rotated[channel_name]:
+            del self.rotated[channel_name]
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        self.total_bytes -= size
+        self.stats["deleted"] += 1
+
+    def close(self):
+        self.acquire()
+        try:
+            for channel_name in list(self.files):
+                self._close(channel_name)
+        finally:
+            self.release()
+        super().close()
+
+
+def rotated_order(name: str) -> str:
+    # Rotated files sort oldest first by name, as long as gzipping doesn't put ".gz" before a "-1" for the same second
+    return name.removesuffix(".gz")
+
+
+def day_of(timestamp: float) -> str:
+    return time.strftime("%Y%m%d", time.localtime(timestamp))
+
+
+def set_log_file_limits(**limits):
+    """Options for the ChannelFileHandler (see its arguments), has to be called before the first logger is set up"""
+    log_file_limits.update(limits)
+
+
+def get_channel_file_handler() -> ChannelFileHandler:
+    """The one handler every channel's log lines are written through, in the background or not"""
+    global channel_file_handler  # pylint: disable=global-statement
+    if channel_file_handler is None:
+        channel_file_handler = ChannelFileHandler(**log_file_limits)
+    return channel_file_handler
+
+
+def start_background_logging():
+    """Log file writes happen on a background thread from now on, instead of wherever the log call was made"""
+    global log_queue, log_listener  # pylint: disable=global-statement
+    if log_listener is not None:
+        return
+
+    log_queue = queue.SimpleQueue()
+    log_listener = QueueListener(log_queue, get_channel_file_handler())
+    log_listener.start()
+    use_handler(QueueHandler(log_queue))
+    atexit.register(stop_background_logging)
+
+
+def stop_background_logging():
+    """
+    Write out everything still on the queue and stop the background thread. Anything logged after this is
+    written straight to the files, instead of going on a queue nothing reads any more
+    """
+    global log_queue, log_listener  # pylint: disable=global-statement
+    if log_listener is None:
+        return
+
+    log_listener.stop()
+    log_listener = None
+    log_queue = None
+    # Files are opened again if anything else is logged
+    handler = get_channel_file_handler()
+    handler.close()
+    use_handler(handler)
+
+
+def use_handler(handler: logging.Handler):
+    # Loggers set up before logging moved to or from the background write through the new handler from now on
+    for logger in channel_loggers.values():
+        for old in list(logger.handlers):
+            if old is channel_file_handler or isinstance(old, QueueHandler):
+                logger.removeHandler(old)
+        logger.addHandler(handler)
+
+
+def set_log_level(level: int | str):
+    """Change the level of every channel logger, including the ones already set up"""
+    global log_level  # pylint: disable=global-statement
+    log_level = logging.getLevelName(level.upper()) if isinstance(level, str) else level
+    for logger in channel_loggers.values():
+        logger.setLevel(log_level)
 
 
 def setup_channel_logger(channel_name: str):
-    # Log file in streamer_logs folder
-    log_filename = os.path.join("streamer_logs", f"{channel_name}.log")
     logger = logging.getLogger(channel_name)
 
     # Check if the logger already has handlers to avoid duplicates
     if not logger.hasHandlers():
-        # You can adjust the level (e.g., INFO, WARNING, etc.)
-        logger.setLevel(logging.DEBUG)
-
-        # Create a file handler to write to the channel's log file
-        file_handler = logging.FileHandler(log_filename, encoding='utf-8')
-        file_handler.setLevel(logging.DEBUG)
-
-        # Create a log formatter and attach it to the file handler
-        formatter = logging.Formatter(
-            '%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
-        file_handler.setFormatter(formatter)
+        # You can adjust the level (e.g., INFO, WARNING, etc.) with set_log_level
+        logger.setLevel(log_level)
 
-        # Add the handler to the logger
-        logger.addHandler(file_handler)
+        if log_queue is not None:
+            # Only puts the record on the queue, the listener thread writes it to the file
+            logger.addHandler(QueueHandler(log_queue))
+        else:
+            # Every channel shares the one handler, which keeps only so many files open
+            logger.addHandler(get_channel_file_handler())
 
     return logger
 
 
 # This function will return a logger for the specific channel
 def get_logger_for_channel(channel_name: str):
-    return setup_channel_logger(channel_name)
+    logger = channel_loggers.get(channel_name)
+    if logger is None:
+        logger = channel_loggers[channel_name] = setup_channel_logger(channel_name)
+    return logger
+
+
+def last_logged(channel_names) -> dict[str, float]:
+    """When each channel's log file was last written to (as time.time()), skipping channels without one"""
+    times = {}
+    for channel_name in channel_names:
+        try:
+            times[channel_name] = os.path.getmtime(os.path.join(LOG_DIR, f"{channel_name}.log"))
+        except OSError:
+            pass
+    return times
@@ -0,0 +1,195 @@
+from bisect import bisect_left
+from aiohttp import web
+import profile_funcs
+from plural_funcs import is_plural_cache, plural_of_cache
+from syllable_funcs import hyphenation_cache
+
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Only serve metrics on this machine unless told otherwise
+DEFAULT_METRICS_HOST = "127.0.0.1"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Counts of observed values (e.g. seconds) under each bucket's upper bound, like a Prometheus histogram"""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        # Observations per bucket, not added up yet (anything above the last bound is only in `count`)
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: dict | None) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in labels.items()) + "}"
+
+
+class MetricsWriter:
+    """Builds a page in the Prometheus text format, one metric (with all its samples) at a time"""
+
+    def __init__(self, prefix: str = "gregbot_"):
+        self.prefix = prefix
+        self.lines: list[str] = []
+
+    def metric(self, name: str, kind: str, help_text: str, samples: list[tuple[dict | None, float]]):
+        name = self.prefix + name
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            self.lines.append(f"{name}{format_labels(labels)} {value}")
+
+    def counter(self, name: str, help_text: str, value: float, labels: dict | None = None):
+        self.metric(name, "counter", help_text, [(labels, value)])
+
+    def gauge(self, name: str, help_text: str, value: float, labels: dict | None = None):
+        self.metric(name, "gauge", help_text, [(labels, value)])
+
+    def histogram(self, name: str, help_text: str, histogram: Histogram):
+        name = self.prefix + name
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} histogram")
+        total = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            total += count
+            self.lines.append(f'{name}_bucket{{le="{bound}"}} {total}')
+        self.lines.append(f'{name}_bucket{{le="+Inf"}} {histogram.count}')
+        self.lines.append(f"{name}_sum {histogram.sum}")
+        self.lines.append(f"{name}_count {histogram.count}")
+
+    def text(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+def unique(objects: list) -> list:
+    # Shards in the same process share most of their state, so only count each thing once
+    seen = {}
+    for thing in objects:
+        if thing is not None:
+            seen.setdefault(id(thing), thing)
+    return list(seen.values())
+
+
+def bot_metrics(bots: list) -> str:
+    """Everything the bots count, as a Prometheus metrics page. `bots` are the shards running in this process"""
+    writer = MetricsWriter()
+
+    channels = {}
+    for channel_settings in unique([bot.channel_settings for bot in bots]):
+        channels.update(channel_settings)
+    writer.gauge("channels", "Channels the bot is in", len(channels))
+    writer.metric("channel_messages_total", "counter", "Chat messages seen per channel",
+                  [({"channel": name}, state.messages) for name, state in channels.items()])
+    writer.metric("channel_buttify_attempts_total", "counter", "Messages picked by the buttrate per channel",
+                  [({"channel": name}, state.buttify_attempts) for name, state in channels.items()])
+    writer.metric("channel_butts_total", "counter", "Buttified messages per channel",
+                  [({"channel": name}, state.butts) for name, state in channels.items()])
+    writer.metric("channel_repeats_total", "counter", "Messages that were part of a copypasta wave per channel",
+                  [({"channel": name}, state.repeats) for name, state in channels.items()])
+
+    message_stats = {}
+    for bot in bots:
+        for key, value in bot.message_stats.items():
+            message_stats[key] = message_stats.get(key, 0) + value
+    writer.counter("messages_total", "Chat messages seen", message_stats["messages"])
+    writer.metric("messages_handled_total", "counter", "Chat messages by how they were handled",
+                  [({"how": how}, message_stats[how])
+                   for how in ("fast_path", "skipped_ignored", "skipped_bots", "repeats", "commands")])
+    writer.counter("buttify_attempts_total", "Messages picked by the buttrate", message_stats["buttify_attempts"])
+    writer.metric("buttify_results_total", "counter", "Buttify attempts by result",
+                  [({"result": result}, message_stats[result])
+                   for result in ("replaced", "too_short", "no_syllable", "emote_only")])
+    writer.counter("emotes_skipped_total", "Emotes left out of buttifying", message_stats["emotes_skipped"])
+    for histogram in unique([bot.buttify_seconds for bot in bots]):
+        writer.histogram("buttify_seconds", "Time taken to buttify a message", histogram)
+
+    for pool in unique([bot.worker_pool for bot in bots]):
+        writer.metric("worker_jobs_total", "counter", "Buttify jobs sent to the worker pool by outcome",
+                      [({"outcome": outcome}, pool.stats[outcome])
+                       for outcome in ("submitted", "completed", "dropped", "errors")])
+        writer.gauge("worker_jobs_pending", "Jobs waiting for or running on the worker pool", pool.pending)
+        writer.counter("worker_queue_seconds_total", "Time jobs spent waiting for a worker",
+                       pool.stats["queue_seconds_total"])
+
+    for scheduler in unique([bot.send_scheduler for bot in bots]):
+        writer.metric("sends_total", "counter", "Messages queued to be sent by outcome",
+                      [({"outcome": outcome}, scheduler.stats[outcome])
+                       for outcome in ("queued", "sent", "dropped_stale", "dropped_full", "cancelled", "errors")])
+        writer.gauge("send_queue_depth", "Messages waiting to be sent", scheduler.depth)
+        writer.histogram("send_latency_seconds", "Time from queueing a message to sending it", scheduler.latency)
+
+    join_stats = {}
+    join_states = {}
+    for bot in bots:
+        for key, value in bot.join_scheduler.stats.items():
+            join_stats[key] = join_stats.get(key, 0) + value
+        for state, count in bot.join_scheduler.state_counts.items():
+            join_states[state] = join_states.get(state, 0) + count
+    writer.metric("joins_total", "counter", "Channel joins by outcome",
+                  [({"outcome": outcome}, join_stats[outcome])
+                   for outcome in ("join_attempts", "joined", "failures", "gave_up")])
+    writer.metric("join_channels", "gauge", "Channels by join state",
+                  [({"state": state}, count) for state, count in join_states.items()])
+
+    for store in unique([bot.settings_store for bot in bots]):
+        for key, kind in (("changes", "counter"), ("flushes", "counter"), ("channels_flushed", "counter"),
+                          ("bytes_written", "counter"), ("last_flush_seconds", "gauge"),
+                          ("reloads", "counter")):
+            name = f"settings_{key}_total" if kind == "counter" else f"settings_{key}"
+            writer.metric(name, kind, f"Settings store {key.replace('_', ' ')}", [(None, store.stats[key])])
+
+    if profile_funcs.stage_timer is not None:
+        stages = profile_funcs.stage_timer.summary()
+        writer.metric("stage_calls_total", "counter", "Calls to each stage of handling a message (BOT_PROFILE=stages)",
+                      [({"stage": stage}, timing["calls"]) for stage, timing in stages.items()])
+        writer.metric("stage_seconds_total", "counter", "Time spent in each stage of handling a message",
+                      [({"stage": stage}, timing["total_seconds"]) for stage, timing in stages.items()])
+
+    caches = {"hyphenation": hyphenation_cache, "is_plural": is_plural_cache, "plural_of": plural_of_cache}
+    for key, kind in (("hits", "counter"), ("misses", "counter"), ("evictions", "counter"),
+                      ("size", "gauge"), ("hit_rate", "gauge")):
+        name = f"cache_{key}_total" if kind == "counter" else f"cache_{key}"
+        writer.metric(name, kind, f"Cache {key.replace('_', ' ')}",
+                      [({"cache": cache_name}, cache.stats[key]) for cache_name, cache in caches.items()])
+
+    return writer.text()
+
+
+class MetricsServer:
+    """Serves bot_metrics on http://host:port/metrics for Prometheus (or curl) to read"""
+
+    def __init__(self, bots: list, host: str = DEFAULT_METRICS_HOST, port: int = 9100):
+        self.bots = bots
+        self.host = host
+        self.port = port
+        self.runner: web.AppRunner | None = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        # Built on the event loop so nothing changes while it's being read
+        return web.Response(body=bot_metrics(self.bots).encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+    async def close(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
@@ -1,3 +1,7 @@
+import math
+import random
+
+
 def in_bot_channel(bot_nickname: str, message_username: str, channel_name: str) -> tuple[bool, str]:
     """
     This function takes in three arguments: `botNickname`, `messageUserName`, and `channelName`.
@@ -19,3 +23,28 @@ def in_bot_channel(bot_nickname: str, message_username: str, channel_name: str)
     channel_name = message_username if is_in_bot_channel else channel_name
 
     return is_in_bot_channel, channel_name
+
+
+def messages_until_butt(rate: int, missed: int) -> int:
+    """
+    Draws how many more messages go by before one is buttified, with the same odds as rolling
+    1 in max(rate - max(missed - rate, 0), 1) on every message and adding 1 to `missed` when it doesn't hit.
+
+    Up to `rate` missed messages the chance is a flat 1/rate, so the wait is geometric. After that the
+    chance goes up to 1/(2*rate - missed) each message, which works out to every remaining message being
+    equally likely to be the one.
+    """
+    if rate <= 1:
+        return 0
+
+    skipped = 0
+    if missed < rate:
+        flat = rate - missed
+        # Failures before the first 1/rate hit, 1 - random() so log never gets 0
+        failures = int(math.log(1.0 - random.random()) / math.log(1.0 - 1.0 / rate))
+        if failures < flat:
+            return failures
+        skipped = flat
+        missed = rate
+
+    return skipped + random.randrange(max(2 * rate - missed, 1))
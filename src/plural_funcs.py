@@ -1,23 +1,56 @@
-import re
-import inflect
-from regex_funcs import LETTERS_REGEX
+import threading
+from cache_funcs import MISSING, LRUCache
+from regex_funcs import LETTERS_PATTERN
 
-inf = inflect.engine()
+# Created on first use by get_inflect_engine, importing inflect alone takes seconds
+inf = None
+inflect_lock = threading.Lock()
+
+# Number of words to remember the plural checks of, inflect is slow and the same words come up over and over
+PLURAL_CACHE_SIZE = 2048
+is_plural_cache = LRUCache(PLURAL_CACHE_SIZE)
+plural_of_cache = LRUCache(PLURAL_CACHE_SIZE)
+
+
+def get_inflect_engine():
+    global inf  # pylint: disable=global-statement
+    if inf is None:
+        # Worker threads and the warm up can both get here first
+        with inflect_lock:
+            if inf is None:
+                import inflect  # pylint: disable=import-outside-toplevel
+                inf = inflect.engine()
+    return inf
 
 
 def check_if_plural(word: str):
     """Check if the given word is a plural or not"""
+    pl = is_plural_cache.get(word)
+    if pl is not MISSING:
+        return pl
+
     try:
-        pl = inf.singular_noun(word) is not False
+        pl = get_inflect_engine().singular_noun(word) is not False
     except Exception as e:
         print(f"Errored in check_if_plural: {e}")
         pl = False
+
+    is_plural_cache.put(word, pl)
     return pl
 
 
 def get_plural_of_word(word: str):
     """Gets the plural form of a specific word"""
-    return inf.plural(word)
+    plural = plural_of_cache.get(word)
+    if plural is MISSING:
+        plural = get_inflect_engine().plural(word)
+        plural_of_cache.put(word, plural)
+    return plural
+
+
+def get_word_plurals(words: list[str]) -> dict[str, str]:
+    """Works out the plural of each word ahead of time, e.g. for a streamer's buttword and word list"""
+    return {word: get_plural_of_word(word) for word in words if word}
 
 
 def get_syllables_no_punctuation(syllables: list[str]):
@@ -33,7 +66,7 @@ def get_syllables_no_punctuation(syllables: list[str]):
             syllables_no_punctuation.append(syllable)
 
         else:
-            if re.match(LETTERS_REGEX + r"+", syllable):
+            if LETTERS_PATTERN.match(syllable):
                 syllables_no_punctuation.append(syllable)
             else:
                 syllables_no_punctuation.append("")
@@ -71,7 +104,14 @@ def check_if_should_be_plural(syllables: list[str], index: int):
     return False
 
 
-def get_buttword_plural(word: str, li: list[str], index: int):
-    plural = get_plural_of_word(word) if check_if_should_be_plural(
-        get_syllables_no_punctuation(li), index) else word
-    return plural
+def get_buttword_plural(word: str, li: list[str], index: int, plurals: dict[str, str] | None = None):
+    """
+    Gets the buttword to use in place of the syllable, pluralised if the word it replaces is a plural.
+    `plurals` can hold plurals worked out ahead of time (see get_word_plurals)
+    """
+    if not check_if_should_be_plural(get_syllables_no_punctuation(li), index):
+        return word
+
+    if plurals is not None and word in plurals:
+        return plurals[word]
+    return get_plural_of_word(word)
@@ -4,11 +4,13 @@ ALPHABET = r"a-zA-Z"
 LETTERS_REGEX = r"[" + ALPHABET + r"]"
 PUNCTUATION_REGEX = r"[^" + ALPHABET + r"\s]+"
 
+LETTERS_PATTERN = re.compile(LETTERS_REGEX + r"+")
+PUNCTUATION_PATTERN = re.compile(PUNCTUATION_REGEX)
 
-def fix_re_escape(string: str):
-    """Fixes the \\ being messed up from re.escape"""
-    return re.sub(r'\\(.)', r'\1', string)
+# Splits a hyphenated word (from pyphen) into letter runs and punctuation runs in one pass.
+# Hyphens mark the syllable breaks so they are never matched, spaces stand in for the word's own dashes.
+SYLLABLE_TOKEN_REGEX = re.compile(LETTERS_REGEX + r"+|(?:[^" + ALPHABET + r"\s-]| )+")
 
 
 def is_punctuation(string: str):
-    return bool(re.search(PUNCTUATION_REGEX, string))
+    return bool(PUNCTUATION_PATTERN.search(string))
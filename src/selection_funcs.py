@@ -0,0 +1,62 @@
+import random
+from ignore_these_words import IGNORE_WORDS
+from plural_funcs import get_syllables_no_punctuation
+
+
+def is_replaceable_syllable(syllable: str) -> bool:
+    """Only syllables of 2+ letters and no punctuation can be replaced"""
+    return len(syllable) > 1 and syllable.isascii() and syllable.isalpha()
+
+
+def index_syllables(syllable_lists: list[list[str]],
+                    emotes: frozenset[str] = frozenset()) -> list[tuple[int, list[int]]]:
+    """
+    Goes through the message once and finds every syllable that could be replaced.
+    Returns a list of (word index, [syllable indexes]) for each word that has at least one,
+    skipping ignored words, links and emotes (so butts never break an emote).
+    """
+    index = []
+    for word_index, syllables in enumerate(syllable_lists):
+        # Emotes are left as one syllable by syllables_split
+        if emotes and len(syllables) == 1 and syllables[0] in emotes:
+            continue
+
+        word = "".join(get_syllables_no_punctuation(syllables)).lower()
+
+        # If an ignored word, or a link, never replace it
+        if word in IGNORE_WORDS or "https" in word:
+            continue
+
+        replaceable = [i for i, syllable in enumerate(syllables) if is_replaceable_syllable(syllable)]
+        if replaceable:
+            index.append((word_index, replaceable))
+
+    return index
+
+
+def choose_syllables(index: list[tuple[int, list[int]]], count: int, min_spacing: int = 1) -> list[tuple[int, int]]:
+    """
+    Picks up to `count` (word index, syllable index) pairs from the index without picking the same word twice.
+    Picked words are at least `min_spacing` words apart, i.e. 1 lets butts land in neighbouring words
+    and 2 always leaves a word between them. Fewer are returned if there aren't enough words to go around.
+    """
+    words = list(index)
+    chosen = []
+    blocked: set[int] = set()
+
+    # Shuffle as we go (Fisher-Yates), stopping as soon as enough words have been picked
+    for i, _ in enumerate(words):
+        j = random.randint(i, len(words) - 1)
+        words[i], words[j] = words[j], words[i]
+
+        word_index, syllables = words[i]
+        if word_index in blocked:
+            continue
+
+        chosen.append((word_index, random.choice(syllables)))
+        if len(chosen) == count:
+            break
+
+        blocked.update(range(word_index - min_spacing + 1, word_index + min_spacing))
+
+    return chosen
@@ -0,0 +1,238 @@
+import asyncio
+import time
+from collections import deque
+from typing import NamedTuple
+from logging_funcs import get_logger_for_channel
+from metrics_funcs import Histogram
+
+# Command replies always go before buttified messages
+COMMAND_PRIORITY = 0
+BUTT_PRIORITY = 1
+
+# Twitch's limits for an account that isn't a moderator: 20 messages per 30 seconds over all channels,
+# and about 1 message per second in each channel
+DEFAULT_GLOBAL_LIMIT = 20
+DEFAULT_GLOBAL_PERIOD = 30.0
+DEFAULT_CHANNEL_LIMIT = 1
+DEFAULT_CHANNEL_PERIOD = 1.0
+# Seconds a buttified message can wait to be sent before it's too late to make sense in chat
+DEFAULT_BUTT_DEADLINE = 10.0
+# Messages allowed to wait at once, new buttified messages are dropped past this
+DEFAULT_MAX_QUEUED = 200
+
+
+class TokenBucket:
+    """Allows `capacity` sends per `period` seconds, refilling continuously"""
+
+    def __init__(self, capacity: int, period: float):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def has_token(self, now: float) -> bool:
+        self.refill(now)
+        return self.tokens >= 1
+
+    def take(self):
+        self.tokens -= 1
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until there is a token to take"""
+        self.refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def is_full(self, now: float) -> bool:
+        self.refill(now)
+        return self.tokens >= self.capacity
+
+
+class QueuedMessage(NamedTuple):
+    channel: object
+    content: str
+    queued_at: float
+    # time.monotonic() after which the message is dropped instead of sent, None to always send
+    deadline: float | None
+    # Set to True once sent, or False if it was dropped or failed
+    sent: asyncio.Future
+
+
+class SendScheduler:
+    """
+    The one place messages are sent from, so every channel shares Twitch's account-wide rate limit.
+
+    Messages wait in a queue per priority and are sent when both the global and the channel's token bucket
+    allow it. Command replies go first, and buttified messages that waited past their deadline are dropped
+    rather than sent late.
+    """
+
+    def __init__(self, global_limit: int = DEFAULT_GLOBAL_LIMIT, global_period: float = DEFAULT_GLOBAL_PERIOD,
+                 channel_limit: int = DEFAULT_CHANNEL_LIMIT, channel_period: float = DEFAULT_CHANNEL_PERIOD,
+                 max_queued: int = DEFAULT_MAX_QUEUED):
+        self.global_bucket = TokenBucket(global_limit, global_period)
+        self.channel_limit = channel_limit
+        self.channel_period = channel_period
+        self.channel_buckets: dict[str, TokenBucket] = {}
+        self.max_queued = max_queued
+
+        self.queues: dict[int, deque[QueuedMessage]] = {COMMAND_PRIORITY: deque(), BUTT_PRIORITY: deque()}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+        self.stats = {
+            "queued": 0,
+            "sent": 0,
+            "dropped_stale": 0,
+            "dropped_full": 0,
+            # Messages nobody was waiting for any more (their future was cancelled) before they were sent
+            "cancelled": 0,
+            "errors": 0,
+            "send_latency_seconds_total": 0.0,
+            "send_latency_seconds_max": 0.0,
+        }
+        # Seconds from queueing to sending for every sent message
+        self.latency = Histogram()
+
+    @property
+    def depth(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    def enqueue(self, channel, content: str, priority: int = COMMAND_PRIORITY,
+                max_wait: float | None = None) -> asyncio.Future:
+        """
+        Queue a message to be sent to the channel (anything with a `name` and an async `send`).
+        `max_wait` is how many seconds it may wait before it's dropped.
+        Returns a future that is set to True once the message is sent, or False if it was dropped.
+        """
+        sent = asyncio.get_running_loop().create_future()
+        if priority != COMMAND_PRIORITY and self.depth >= self.max_queued:
+            self.stats["dropped_full"] += 1
+            sent.set_result(False)
+            return sent
+
+        now = time.monotonic()
+        deadline = now + max_wait if max_wait is not None else None
+        self.queues[priority].append(QueuedMessage(channel, content, now, deadline, sent))
+        self.stats["queued"] += 1
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+        return sent
+
+    def _drop_stale(self, now: float):
+        # Also drops messages whose future was cancelled (whoever was waiting on them gave up), so they don't
+        # use up a token
+        for queue in self.queues.values():
+            if any(message.sent.done() or (message.deadline is not None and message.deadline < now)
+                   for message in queue):
+                fresh = []
+                for message in queue:
+                    if message.sent.done():
+                        self.stats["cancelled"] += 1
+                    elif message.deadline is None or message.deadline >= now:
+                        fresh.append(message)
+                    else:
+                        self.stats["dropped_stale"] += 1
+                        message.sent.set_result(False)
+                queue.clear()
+                queue.extend(fresh)
+
+    def _next_deadline(self) -> float | None:
+        deadlines = [message.deadline for queue in self.queues.values() for message in queue
+                     if message.deadline is not None]
+        return min(deadlines) if deadlines else None
+
+    def _channel_bucket(self, name: str) -> TokenBucket:
+        bucket = self.channel_buckets.get(name)
+        if bucket is None:
+            bucket = self.channel_buckets[name] = TokenBucket(self.channel_limit, self.channel_period)
+        return bucket
+
+    def _next_message(self, now: float) -> tuple[QueuedMessage | None, float]:
+        """The next message allowed to be sent, or None and how long to wait before checking again"""
+        if not self.global_bucket.has_token(now):
+            return None, self.global_bucket.wait_time(now)
+
+        wait = None
+        for priority in sorted(self.queues):
+            queue = self.queues[priority]
+            for i, message in enumerate(queue):
+                bucket = self._channel_bucket(message.channel.name)
+                if bucket.has_token(now):
+                    del queue[i]
+                    return message, 0.0
+
+                channel_wait = bucket.wait_time(now)
+                wait = channel_wait if wait is None else min(wait, channel_wait)
+
+        return None, wait if wait is not None else 0.0
+
+    def _forget_idle_channels(self, now: float):
+        # Buckets that have fully refilled are the same as new ones, so don't keep them around
+        for name in [name for name, bucket in self.channel_buckets.items() if bucket.is_full(now)]:
+            del self.channel_buckets[name]
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            self._drop_stale(now)
+
+            if self.depth == 0:
+                self._forget_idle_channels(now)
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            message, wait = self._next_message(now)
+            if message is None:
+                # Sleep until a token is free, a new message (maybe for another channel) comes in or a message
+                # runs out of time, so it's dropped then instead of taking up room in the queue until a send
+                deadline = self._next_deadline()
+                if deadline is not None:
+                    wait = min(wait, max(deadline - now, 0.0))
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self.global_bucket.take()
+            self._channel_bucket(message.channel.name).take()
+
+            try:
+                await message.channel.send(message.content)
+            except Exception as e:
+                self.stats["errors"] += 1
+                get_logger_for_channel("bot").error("Errored sending a message to %s: %s", message.channel.name, e)
+                if not message.sent.done():
+                    message.sent.set_result(False)
+                continue
+
+            if not message.sent.done():
+                message.sent.set_result(True)
+            latency = time.monotonic() - message.queued_at
+            self.stats["sent"] += 1
+            self.stats["send_latency_seconds_total"] += latency
+            self.stats["send_latency_seconds_max"] = max(self.stats["send_latency_seconds_max"], latency)
+            self.latency.observe(latency)
+
+    async def close(self):
+        # Anything still waiting won't be sent now
+        for queue in self.queues.values():
+            for message in queue:
+                if not message.sent.done():
+                    message.sent.set_result(False)
+            queue.clear()
+
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
@@ -0,0 +1,459 @@
+import asyncio
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from channel_state import ChannelState
+from json_funcs import atomic_write, open_file, load_ignore_list, add_ignore_list, remove_ignore_list, \
+    run_in_background
+from logging_funcs import get_logger_for_channel
+
+# Seconds to wait after the first change before writing, so a burst of commands becomes one write
+DEFAULT_FLUSH_DELAY = 2.0
+# Seconds between checks for changes made to the saved settings by something other than the bot
+DEFAULT_RELOAD_INTERVAL = 5.0
+
+# Settings with their own column in the SQLite channels table, anything else goes in `extra` as JSON
+CHANNEL_COLUMNS = ("rate", "word", "random_words_enabled")
+
+
+def snapshot_settings(channel_settings: dict[str, ChannelState]) -> dict:
+    """Copies the settings deep enough that they can be written on another thread while the bot keeps changing them"""
+    return {channel: state.to_dict() for channel, state in channel_settings.items()}
+
+
+class SettingsStore(ABC):
+    """
+    Write-behind storage for the streamer settings and the ignore list.
+
+    `channel_settings` (the bot's dict) is the source of truth. Commands change it in memory and call
+    `mark_dirty`, then all the changes made within `flush_delay` seconds are written out together on a
+    background thread. `close` (or exiting the process) always writes anything still pending.
+
+    Changes made to the saved settings by anything else (edited by hand, a backup put back) are picked up by
+    `reload`, which the bot polls.
+
+    Subclasses decide how a batch of changes is saved, see `JsonSettingsStore` and `SqliteSettingsStore`.
+    """
+
+    def __init__(self, flush_delay: float = DEFAULT_FLUSH_DELAY):
+        self.channel_settings: dict[str, ChannelState] = {}
+        self.flush_delay = flush_delay
+
+        # Channels changed since the last write, with the fields that changed (None if the whole channel did)
+        self.dirty: dict[str, set[str] | None] = {}
+        self._timer: asyncio.TimerHandle | None = None
+        self._flush_task: asyncio.Task | None = None
+        # Only one write at a time (background thread or the exit handler)
+        self._write_lock = threading.Lock()
+
+        # The settings as last read, to tell what a reload changed
+        self.saved: dict[str, dict] = {}
+        # What _disk_version was when the settings were last read or written here
+        self.known_version = None
+
+        self.stats = {
+            "changes": 0,
+            "flushes": 0,
+            "channels_flushed": 0,
+            "bytes_written": 0,
+            "load_seconds": 0.0,
+            "last_flush_seconds": 0.0,
+            "reloads": 0,
+        }
+
+        atexit.register(self.flush_now)
+
+    def load(self) -> dict[str, ChannelState]:
+        """Load the settings for every channel, these become the store's `channel_settings`"""
+        start = time.perf_counter()
+        self.known_version = self._disk_version()
+        self.saved = self._load()
+        self.channel_settings = {name: ChannelState.from_dict(name, values) for name, values in self.saved.items()}
+        self.stats["load_seconds"] = time.perf_counter() - start
+        return self.channel_settings
+
+    def reload(self) -> tuple[dict[str, dict], list[str]] | None:
+        """
+        Read the saved settings again if something other than this store changed them. Returns the channels
+        added or changed since they were last read (as saved dicts) and the channels removed, None if nothing was
+        changed. Doesn't touch `channel_settings`, the bot decides what to do with the changes
+        """
+        # Taken before reading, so a change made while reading is picked up next time
+        version = self._disk_version()
+        if version == self.known_version:
+            return None
+
+        settings = self._load()
+        self.known_version = version
+        changed = {name: values for name, values in settings.items() if self.saved.get(name) != values}
+        removed = [name for name in self.saved if name not in settings]
+        self.saved = settings
+        self.stats["reloads"] += 1
+        return changed, removed
+
+    @property
+    def writing(self) -> bool:
+        """Whether there are changes waiting to be written or being written"""
+        return bool(self.dirty) or self._timer is not None or (
+            self._flush_task is not None and not self._flush_task.done())
+
+    @abstractmethod
+    def _load(self) -> dict:
+        """The saved settings of every channel, as dicts in the streamer_settings.json format"""
+
+    @abstractmethod
+    def _disk_version(self):
+        """Something that changes whenever anything but this store changes the saved settings"""
+
+    @abstractmethod
+    def load_ignored(self) -> set[str]:
+        """Load the set of ignored users"""
+
+    @abstractmethod
+    def add_ignored(self, ignored: set[str], user: str) -> bool:
+        """Add a user to the ignore list and save it in the background, False if they were already ignored"""
+
+    @abstractmethod
+    def remove_ignored(self, ignored: set[str], user: str) -> bool:
+        """Remove a user from the ignore list and save it in the background, False if they weren't ignored"""
+
+    def mark_dirty(self, channel_name: str, field: str | None = None):
+        """Record that a channel was added or changed. `field` is the changed setting, if only one was"""
+        if field is None:
+            self.dirty[channel_name] = None
+        elif channel_name not in self.dirty:
+            self.dirty[channel_name] = {field}
+        elif self.dirty[channel_name] is not None:
+            self.dirty[channel_name].add(field)
+
+        self.stats["changes"] += 1
+        self._schedule_flush()
+
+    def mark_removed(self, channel_name: str):
+        """Record that a channel was removed from the settings"""
+        self.mark_dirty(channel_name)
+
+    def _schedule_flush(self):
+        if self._timer is not None:
+            # A write is already coming, this change will go along with it
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Not running inside the bot (e.g. a script), just write straight away
+            self.flush_now()
+            return
+
+        self._timer = loop.call_later(self.flush_delay, self._start_flush)
+
+    def _start_flush(self):
+        self._timer = None
+        self._flush_task = asyncio.create_task(self._background_flush())
+
+    async def _background_flush(self):
+        try:
+            await self.flush()
+        except (OSError, sqlite3.Error) as e:
+            # The changes are still marked dirty, so they will be written with the next change or on close
+            get_logger_for_channel("bot").error("Failed to save settings: %s", e)
+
+    async def flush(self):
+        """Write all pending changes without blocking the event loop"""
+        if not self.dirty:
+            return
+
+        # Take the snapshot on the event loop so nothing changes underneath it
+        changed = self.dirty
+        self.dirty = {}
+        snapshot = self._snapshot(changed)
+
+        try:
+            await asyncio.to_thread(self._timed_write, snapshot, changed)
+        except Exception:
+            # Try again with the next flush rather than losing the changes, along with any made during the write
+            for channel_name, fields in changed.items():
+                if channel_name not in self.dirty:
+                    self.dirty[channel_name] = fields
+                elif fields is None or self.dirty[channel_name] is None:
+                    self.dirty[channel_name] = None
+                else:
+                    self.dirty[channel_name] |= fields
+            raise
+
+    def flush_now(self):
+        """Write all pending changes, blocking until they are saved"""
+        if not self.dirty:
+            return
+
+        changed = self.dirty
+        self.dirty = {}
+        self._timed_write(self._snapshot(changed), changed)
+
+    @abstractmethod
+    def _snapshot(self, changed: dict[str, set[str] | None]) -> dict:
+        """Copy what needs to be written for the changed channels"""
+
+    @abstractmethod
+    def _write(self, snapshot: dict, changed: dict[str, set[str] | None]) -> int:
+        """Save the snapshot, returning the number of bytes written"""
+
+    def _timed_write(self, snapshot: dict, changed: dict[str, set[str] | None]):
+        start = time.perf_counter()
+
+        with self._write_lock:
+            written = self._write(snapshot, changed)
+        # So the store's own writes don't look like someone else changed the settings
+        self.known_version = self._disk_version()
+        for channel in changed:
+            if channel in snapshot:
+                self.saved[channel] = snapshot[channel]
+            else:
+                self.saved.pop(channel, None)
+
+        self.stats["flushes"] += 1
+        self.stats["channels_flushed"] += len(changed)
+        self.stats["bytes_written"] += written
+        self.stats["last_flush_seconds"] = time.perf_counter() - start
+
+    async def close(self):
+        """Stop waiting on the timer and write whatever is still pending"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+
+        await self.flush()
+
+
+class JsonSettingsStore(SettingsStore):
+    """Keeps the settings in streamer_settings.json, the whole file is rewritten on each flush"""
+
+    def __init__(self, path: str, ignored_path: str, flush_delay: float = DEFAULT_FLUSH_DELAY):
+        super().__init__(flush_delay)
+        self.path = path
+        self.ignored_path = ignored_path
+
+    def _load(self) -> dict:
+        return open_file(self.path, {})
+
+    def _disk_version(self):
+        # Every write replaces the file, so a new inode or mtime means it was written again. Changes made to the
+        # file while the bot has its own waiting to be written are lost, the whole file is written from memory
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def load_ignored(self) -> set[str]:
+        return load_ignore_list(self.ignored_path)
+
+    def add_ignored(self, ignored: set[str], user: str) -> bool:
+        return add_ignore_list(self.ignored_path, ignored, user)
+
+    def remove_ignored(self, ignored: set[str], user: str) -> bool:
+        return remove_ignore_list(self.ignored_path, ignored, user)
+
+    def _snapshot(self, changed: dict[str, set[str] | None]) -> dict:
+        return snapshot_settings(self.channel_settings)
+
+    def _write(self, snapshot: dict, changed: dict[str, set[str] | None]) -> int:
+        data = json.dumps(snapshot, indent=4).encode("utf8")
+        atomic_write(self.path, data)
+        return len(data)
+
+
+class SqliteSettingsStore(SettingsStore):
+    """
+    Keeps the settings in a SQLite database with a row per channel, so a flush only writes the channels
+    (and where possible, the single fields) that changed.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS channels (
+            name TEXT PRIMARY KEY,
+            rate INTEGER NOT NULL,
+            word TEXT NOT NULL,
+            random_words_enabled INTEGER NOT NULL,
+            extra TEXT
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS random_words (
+            channel TEXT NOT NULL REFERENCES channels (name) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            word TEXT NOT NULL,
+            weight INTEGER NOT NULL DEFAULT 1,
+            PRIMARY KEY (channel, position)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS ignored_users (
+            name TEXT PRIMARY KEY
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path: str, flush_delay: float = DEFAULT_FLUSH_DELAY):
+        super().__init__(flush_delay)
+        self.path = path
+        self.is_new = not os.path.exists(path)
+
+        # Used from the event loop (loading) and the writer thread, the write lock keeps them apart
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(self.SCHEMA)
+        # Databases from before words had weights
+        if "weight" not in {column[1] for column in self.connection.execute("PRAGMA table_info(random_words)")}:
+            self.connection.execute("ALTER TABLE random_words ADD COLUMN weight INTEGER NOT NULL DEFAULT 1")
+
+    def _load(self) -> dict:
+        settings = {}
+        with self._write_lock:
+            for name, rate, word, random_words_enabled, extra in self.connection.execute(
+                    "SELECT name, rate, word, random_words_enabled, extra FROM channels"):
+                settings[name] = {"rate": rate, "word": word, "random_words_enabled": bool(random_words_enabled),
+                                  "random_words_list": []}
+                if extra:
+                    settings[name].update(json.loads(extra))
+
+            for channel, word, weight in self.connection.execute(
+                    "SELECT channel, word, weight FROM random_words ORDER BY channel, position"):
+                settings[channel]["random_words_list"].append(word)
+                if weight != 1:
+                    settings[channel].setdefault("random_words_weights", {})[word] = weight
+
+        return settings
+
+    def _disk_version(self):
+        # Only goes up when another connection (another shard, the sqlite3 shell...) commits, never for this one
+        with self._write_lock:
+            return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def load_ignored(self) -> set[str]:
+        with self._write_lock:
+            return {name for (name,) in self.connection.execute("SELECT name FROM ignored_users")}
+
+    def add_ignored(self, ignored: set[str], user: str) -> bool:
+        if user in ignored:
+            return False
+
+        ignored.add(user)
+        self._write_in_background("INSERT OR IGNORE INTO ignored_users (name) VALUES (?)", user)
+        return True
+
+    def remove_ignored(self, ignored: set[str], user: str) -> bool:
+        if user not in ignored:
+            return False
+
+        ignored.discard(user)
+        self._write_in_background("DELETE FROM ignored_users WHERE name = ?", user)
+        return True
+
+    def _write_in_background(self, sql: str, *params):
+        def write():
+            with self._write_lock, self.connection:
+                self.connection.execute(sql, params)
+
+        # Same background thread as the JSON saves, so ignoring and unignoring can't land out of order
+        run_in_background(write)
+
+    def _snapshot(self, changed: dict[str, set[str] | None]) -> dict:
+        # Only the changed channels are needed, a missing channel means it was removed
+        return {
+            channel: self.channel_settings[channel].to_dict()
+            for channel in changed if channel in self.channel_settings
+        }
+
+    def _write(self, snapshot: dict, changed: dict[str, set[str] | None]) -> int:
+        # Counts the size of the values written, SQLite's own page writes aren't visible from here
+        written = 0
+        with self.connection:
+            for channel, fields in changed.items():
+                values = snapshot.get(channel)
+                if values is None:
+                    self.connection.execute("DELETE FROM channels WHERE name = ?", (channel,))
+                    continue
+
+                if fields is None:
+                    written += self._write_channel(channel, values)
+                    written += self._write_random_words(channel, values.get("random_words_list", []),
+                                                        values.get("random_words_weights"))
+                    continue
+
+                for field in fields:
+                    if field in CHANNEL_COLUMNS:
+                        # A single field changed, so update just that column of the channel's row
+                        self.connection.execute(
+                            f"UPDATE channels SET {field} = ? WHERE name = ?", (values[field], channel))
+                        written += len(str(values[field]))
+                    elif field == "random_words_list":
+                        written += self._write_random_words(channel, values["random_words_list"],
+                                                            values.get("random_words_weights"))
+                    else:
+                        written += self._write_channel(channel, values)
+
+        return written
+
+    def _write_channel(self, channel: str, values: dict) -> int:
+        extra = {field: value for field, value in values.items()
+                 if field not in CHANNEL_COLUMNS and field not in ("random_words_list", "random_words_weights")}
+        row = (channel, values["rate"], values["word"], int(values["random_words_enabled"]),
+               json.dumps(extra) if extra else None)
+        self.connection.execute(
+            "INSERT INTO channels (name, rate, word, random_words_enabled, extra) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET rate = excluded.rate, word = excluded.word, "
+            "random_words_enabled = excluded.random_words_enabled, extra = excluded.extra", row)
+        return sum(len(str(value)) for value in row)
+
+    def _write_random_words(self, channel: str, words: list[str], weights: dict[str, int] | None = None) -> int:
+        weights = weights or {}
+        self.connection.execute("DELETE FROM random_words WHERE channel = ?", (channel,))
+        self.connection.executemany(
+            "INSERT INTO random_words (channel, position, word, weight) VALUES (?, ?, ?, ?)",
+            [(channel, position, word, weights.get(word, 1)) for position, word in enumerate(words)])
+        return sum(len(word) for word in words)
+
+    def migrate_from_json(self, json_path: str, ignored_path: str) -> tuple[int, int]:
+        """One-shot import of the JSON settings and ignore list, returns the number of channels and users"""
+        settings = open_file(json_path, {})
+        ignored = open_file(ignored_path, [])
+
+        with self._write_lock, self.connection:
+            for channel, values in settings.items():
+                self._write_channel(channel, values)
+                self._write_random_words(channel, values.get("random_words_list", []),
+                                         values.get("random_words_weights"))
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO ignored_users (name) VALUES (?)", [(user,) for user in ignored])
+
+        return len(settings), len(ignored)
+
+    async def close(self):
+        await super().close()
+        # Let any ignore list writes still queued finish before the connection goes away
+        await asyncio.wrap_future(run_in_background(lambda: None))
+        with self._write_lock:
+            self.connection.close()
+
+
+def create_settings_store(backend: str, json_path: str, ignored_path: str, db_path: str,
+                          flush_delay: float = DEFAULT_FLUSH_DELAY) -> SettingsStore:
+    """Create the store for the chosen backend ("json" or "sqlite")"""
+    if backend == "sqlite":
+        store = SqliteSettingsStore(db_path, flush_delay)
+        # The first time the database is used, bring over everything from the JSON files
+        if store.is_new and (os.path.exists(json_path) or os.path.exists(ignored_path)):
+            channels, users = store.migrate_from_json(json_path, ignored_path)
+            get_logger_for_channel("bot").info("Migrated %d channels and %d ignored users from JSON to %s",
+                                               channels, users, db_path)
+        return store
+
+    if backend == "json":
+        return JsonSettingsStore(json_path, ignored_path, flush_delay)
+
+    raise ValueError(f"Unknown settings backend '{backend}', use 'json' or 'sqlite'")
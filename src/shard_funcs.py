@@ -0,0 +1,173 @@
+import asyncio
+import itertools
+import multiprocessing
+import queue
+import zlib
+from abc import ABC, abstractmethod
+from typing import Callable
+from logging_funcs import get_logger_for_channel
+
+# Seconds to wait for another shard to answer a join/leave before giving up on it
+DEFAULT_REQUEST_TIMEOUT = 10.0
+
+
+def shard_for_channel(channel_name: str, shard_count: int) -> int:
+    """
+    The shard a channel belongs to. Uses crc32 instead of hash() since that changes between runs,
+    so a channel always ends up on the same shard
+    """
+    return zlib.crc32(channel_name.lower().encode("utf-8")) % shard_count
+
+
+class ShardRouter(ABC):
+    """
+    Sends !join/!leave to the shard that owns the channel, and lets the other shards know about ignore list changes.
+
+    The bot hands requests to the router with `request` and runs the ones routed to it in `handle_shard_request`.
+    """
+    # Whether every shard sees the same channel_settings and ignore list (only true inside one process)
+    shares_state = True
+
+    def __init__(self, shard_count: int):
+        self.shard_count = shard_count
+
+    def owner_of(self, channel_name: str) -> int:
+        return shard_for_channel(channel_name, self.shard_count)
+
+    def start(self, bot):
+        """Called once the bot is connected, start handling requests from the other shards"""
+
+    @abstractmethod
+    async def request(self, op: str, channel_name: str) -> bool:
+        """Run a join/leave on the shard that owns the channel, returns what that shard's bot returned"""
+
+    def broadcast(self, op: str, name: str):
+        """Let every other shard know about a change they keep their own copy of"""
+
+    async def close(self):
+        pass
+
+
+class ConnectionShardRouter(ShardRouter):
+    """Every shard is a separate IRC connection in this process, so a request is just a call on the other bot"""
+
+    def __init__(self, shard_count: int):
+        super().__init__(shard_count)
+        # Bots by shard id, filled in once they're all created
+        self.bots: list = []
+
+    async def request(self, op: str, channel_name: str) -> bool:
+        return await self.bots[self.owner_of(channel_name)].handle_shard_request(op, channel_name)
+
+
+class ProcessShardRouter(ShardRouter):
+    """
+    Every shard is its own process with its own slice of the settings, requests go through the supervisor
+    (see `run_shard_processes`) which passes them on to the right shard's inbox.
+    """
+    shares_state = False
+
+    def __init__(self, shard_id: int, shard_count: int, inbox: multiprocessing.Queue, outbox: multiprocessing.Queue,
+                 timeout: float = DEFAULT_REQUEST_TIMEOUT):
+        super().__init__(shard_count)
+        self.shard_id = shard_id
+        self.inbox = inbox
+        self.outbox = outbox
+        self.timeout = timeout
+        self.request_ids = itertools.count()
+        # Requests sent to other shards that haven't been answered yet, by request id
+        self.pending: dict[int, asyncio.Future] = {}
+        self._task: asyncio.Task | None = None
+
+    def start(self, bot):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen(bot))
+
+    async def request(self, op: str, channel_name: str) -> bool:
+        request_id = next(self.request_ids)
+        answer = self.pending[request_id] = asyncio.get_running_loop().create_future()
+        self.outbox.put({"op": op, "channel": channel_name, "id": request_id,
+                         "from": self.shard_id, "to": self.owner_of(channel_name)})
+        try:
+            return await asyncio.wait_for(answer, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            get_logger_for_channel("bot").warning("Shard %d didn't answer %s for %s in time",
+                                                  self.owner_of(channel_name), op, channel_name)
+            return False
+        finally:
+            self.pending.pop(request_id, None)
+
+    def broadcast(self, op: str, name: str):
+        self.outbox.put({"op": op, "channel": name, "id": None, "from": self.shard_id, "to": None})
+
+    async def _listen(self, bot):
+        loop = asyncio.get_running_loop()
+        while True:
+            # The inbox is a multiprocessing queue, so wait for it on a thread instead of blocking the bot
+            message = await loop.run_in_executor(None, self.inbox.get)
+            if message is None:
+                return
+
+            if message["op"] == "result":
+                answer = self.pending.get(message["id"])
+                if answer is not None and not answer.done():
+                    answer.set_result(message["ok"])
+                continue
+
+            try:
+                ok = await bot.handle_shard_request(message["op"], message["channel"])
+            except Exception as e:
+                get_logger_for_channel("bot").error("Errored handling %s for %s from shard %d: %s",
+                                                    message["op"], message["channel"], message["from"], e)
+                ok = False
+
+            if message["id"] is not None:
+                self.outbox.put({"op": "result", "id": message["id"], "ok": ok,
+                                 "from": self.shard_id, "to": message["from"]})
+
+    async def close(self):
+        for answer in self.pending.values():
+            if not answer.done():
+                answer.set_result(False)
+
+        if self._task is not None and not self._task.done():
+            # Wakes the listener thread up so it can stop
+            self.inbox.put(None)
+            await self._task
+
+
+def run_shard_processes(shard_count: int, target: Callable):
+    """
+    Start a process per shard running target(shard_id, shard_count, inbox, outbox), and pass messages between
+    them until they have all stopped. Each shard puts messages for the others on the shared outbox,
+    addressed to a shard id in "to" (or None for every other shard).
+    """
+    outbox = multiprocessing.Queue()
+    inboxes = [multiprocessing.Queue() for _ in range(shard_count)]
+    processes = [multiprocessing.Process(target=target, args=(shard_id, shard_count, inboxes[shard_id], outbox),
+                                         name=f"shard-{shard_id}")
+                 for shard_id in range(shard_count)]
+    for process in processes:
+        process.start()
+
+    try:
+        while any(process.is_alive() for process in processes):
+            try:
+                message = outbox.get(timeout=1.0)
+            except queue.Empty:
+                continue
+
+            if message["to"] is None:
+                for shard_id, inbox in enumerate(inboxes):
+                    if shard_id != message["from"]:
+                        inbox.put(message)
+            else:
+                inboxes[message["to"]].put(message)
+    except KeyboardInterrupt:
+        # Ctrl+C reaches the shards as well, they disconnect and save on their own
+        pass
+    finally:
+        for process in processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
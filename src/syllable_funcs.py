@@ -1,38 +1,53 @@
-import re
-import pyphen
-from regex_funcs import LETTERS_REGEX, PUNCTUATION_REGEX, fix_re_escape
-
-s = pyphen.Pyphen(lang='en')
-
-
-REGEX = PUNCTUATION_REGEX + r"|" + LETTERS_REGEX + r"+"
-
-
-def syllables_split(sentence: str) -> list[list[str]]:
-    words = sentence.split()
+import threading
+from cache_funcs import MISSING, LRUCache
+from regex_funcs import SYLLABLE_TOKEN_REGEX
+
+# Created on first use by get_pyphen, loading the dictionary is slow
+s = None
+pyphen_lock = threading.Lock()
+
+# Number of words to remember the hyphenation of, chat repeats the same words (emotes, names, copypastas) a lot
+HYPHENATION_CACHE_SIZE = 4096
+hyphenation_cache = LRUCache(HYPHENATION_CACHE_SIZE)
+
+
+def get_pyphen():
+    global s  # pylint: disable=global-statement
+    if s is None:
+        with pyphen_lock:
+            if s is None:
+                import pyphen  # pylint: disable=import-outside-toplevel
+                s = pyphen.Pyphen(lang='en')
+    return s
+
+
+def split_word(word: str) -> tuple[str, ...]:
+    """
+    Splits a word into syllables, with punctuation split off into its own parts (e.g. "hel", "lo", "!!").
+    Recent words are remembered so they aren't hyphenated again.
+    """
+    parts = hyphenation_cache.get(word)
+    if parts is MISSING:
+        # Make sure dashes in words don't just disappear (pyphen's hyphens are then the only syllable breaks)
+        hyphenated = get_pyphen().inserted(word.replace("-", " "))
+        parts = tuple(part.replace(" ", "-") for part in SYLLABLE_TOKEN_REGEX.findall(hyphenated))
+        hyphenation_cache.put(word, parts)
+    return parts
+
+
+def syllables_split(sentence: str, emotes: frozenset[str] = frozenset()) -> list[list[str]]:
     syllable_list = []
-    for word in words:
-        # Make sure dashes in words don't just disappear
-        syllables = [x.replace(" ", "-") for x in s.inserted(word.replace("-", " ")).split('-')]
-        if word == '\U000e0000' or all(len(ele) == 0 for ele in syllables):
+    for word in sentence.split():
+        if word == '\U000e0000':
+            continue
+
+        # Emotes are kept whole, hyphenating them is wasted work since they're never replaced
+        if word in emotes:
+            syllable_list.append([word])
             continue
 
-        # Separate punctuation to be separate grammatically
-        syllables_punctuation: list[str] = []
-        for syllable in syllables:
-            # Make sure syllable isn't empty
-            if syllables == '':
-                continue
-
-            # Splits words and punctuation
-            split = re.findall(REGEX, re.escape(syllable))
-            # Fixes the \\ being messed up from re.escape
-            for i, e in enumerate(split):
-                split[i] = fix_re_escape(e)
-            # Adds the split array to the syllables and punctuation array
-            syllables_punctuation = syllables_punctuation + split
-
-        syllable_list.append(syllables_punctuation)
+        # Copied into a list since the syllables get replaced with butts later
+        syllable_list.append(list(split_word(word)))
     return syllable_list
 
 
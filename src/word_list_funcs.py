@@ -0,0 +1,130 @@
+import random
+from typing import Iterable
+
+# Most random words a channel can have
+MAX_RANDOM_WORDS = 200
+# Longest random word allowed
+MAX_WORD_LENGTH = 25
+# Highest weight a word can have, "!addword greg 5" makes greg come up 5 times as often as a word with weight 1
+MAX_WORD_WEIGHT = 100
+
+
+class AliasTable:
+    """
+    Picks a word at random in proportion to its weight in constant time (Vose's alias method).
+
+    Never changed once built, so the buttify jobs can all share the same one, and sent to a worker process as is.
+    """
+    __slots__ = ("words", "probabilities", "aliases")
+
+    def __init__(self, words: list[str], weights: list[float]):
+        self.words = tuple(words)
+        count = len(words)
+        self.probabilities = [1.0] * count
+        self.aliases = list(range(count))
+        if count == 0:
+            return
+
+        total = sum(weights)
+        scaled = [weight * count / total for weight in weights]
+        small = [i for i, value in enumerate(scaled) if value < 1.0]
+        large = [i for i, value in enumerate(scaled) if value >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.probabilities[less] = scaled[less]
+            self.aliases[less] = more
+            # The large word gives up what it filled in the small word's column
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Anything left over is 1 give or take rounding
+        for i in small + large:
+            self.probabilities[i] = 1.0
+
+    def __len__(self):
+        return len(self.words)
+
+    def choose(self, rng: random.Random | None = None) -> str:
+        rng = rng or random
+        column = rng.randrange(len(self.words))
+        if rng.random() < self.probabilities[column]:
+            return self.words[column]
+        return self.words[self.aliases[column]]
+
+
+# Shared by every channel without random words
+EMPTY_TABLE = AliasTable([], [])
+
+
+class WeightedWordList:
+    """
+    A channel's random words and their weights.
+
+    Membership, adding and removing are constant time (a dict of each word's position, removing swaps the last
+    word into the gap), and the alias table for picking a word is only rebuilt when the list changed since the
+    last pick.
+    """
+    __slots__ = ("words", "weights", "positions", "_table")
+
+    def __init__(self, words: Iterable[str] = (), weights: dict[str, int] | None = None):
+        self.words: list[str] = []
+        self.weights: list[int] = []
+        self.positions: dict[str, int] = {}
+        self._table: AliasTable | None = EMPTY_TABLE
+        weights = weights or {}
+        for word in words:
+            self.add(word, weights.get(word, 1))
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.positions
+
+    def __len__(self):
+        return len(self.words)
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def weight(self, word: str) -> int:
+        return self.weights[self.positions[word]]
+
+    def add(self, word: str, weight: int = 1) -> bool:
+        """Add the word, or change its weight if it's already there. False if neither changed anything"""
+        position = self.positions.get(word)
+        if position is not None:
+            if self.weights[position] == weight:
+                return False
+            self.weights[position] = weight
+        else:
+            self.positions[word] = len(self.words)
+            self.words.append(word)
+            self.weights.append(weight)
+        self._table = None
+        return True
+
+    def remove(self, word: str) -> bool:
+        position = self.positions.pop(word, None)
+        if position is None:
+            return False
+
+        last_word = self.words.pop()
+        last_weight = self.weights.pop()
+        if last_word != word:
+            self.words[position] = last_word
+            self.weights[position] = last_weight
+            self.positions[last_word] = position
+        self._table = None
+        return True
+
+    @property
+    def table(self) -> AliasTable:
+        """The alias table for the words as they are now, rebuilt only after a change"""
+        if self._table is None:
+            self._table = AliasTable(self.words, self.weights) if self.words else EMPTY_TABLE
+        return self._table
+
+    def weight_dict(self) -> dict[str, int]:
+        """The weights that aren't 1, which is all that needs saving next to the word list"""
+        return {word: weight for word, weight in zip(self.words, self.weights) if weight != 1}
+
+    def describe(self) -> list[str]:
+        # For showing in chat, e.g. ['butt', 'greg (x5)']
+        return [word if weight == 1 else f"{word} (x{weight})" for word, weight in zip(self.words, self.weights)]
@@ -0,0 +1,108 @@
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Awaitable, Callable
+from buttify_funcs import ButtJob, ButtResult, run_job
+from logging_funcs import get_logger_for_channel
+
+# Jobs allowed to be waiting or running at once before new messages are dropped
+DEFAULT_MAX_PENDING = 100
+
+
+class ButtWorkerPool:
+    """
+    Runs buttify jobs on a thread or process pool so the event loop is free to keep reading chat.
+
+    Jobs from the same channel are delivered in the order they were submitted, even if a later one finishes first.
+    When `max_pending` jobs are already waiting, new jobs are dropped instead of letting the bot fall behind.
+    """
+
+    def __init__(self, mode: str, workers: int | None = None, max_pending: int = DEFAULT_MAX_PENDING):
+        if mode == "process":
+            self.executor: Executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+        elif mode == "thread":
+            # pyphen and inflect hold the GIL, so more than one thread rarely helps
+            self.executor = ThreadPoolExecutor(max_workers=workers or 1, thread_name_prefix="buttify")
+        else:
+            raise ValueError(f"Unknown worker mode '{mode}', use 'thread' or 'process'")
+
+        self.mode = mode
+        self.max_pending = max_pending
+        self.pending = 0
+        # Last delivery task for each channel, the next job from the channel waits on it
+        self.channel_tails: dict[str, asyncio.Task] = {}
+
+        self.stats = {
+            "submitted": 0,
+            "completed": 0,
+            "dropped": 0,
+            "errors": 0,
+            "queue_seconds_total": 0.0,
+            "queue_seconds_max": 0.0,
+            "compute_seconds_total": 0.0,
+            "compute_seconds_max": 0.0,
+        }
+
+    def submit(self, job: ButtJob, on_result: Callable[[ButtResult], Awaitable[None]]) -> bool:
+        """
+        Start buttifying the job in the pool, `on_result` is awaited with the result in channel order.
+        Returns False if the job was dropped because the pool is full.
+        """
+        if self.pending >= self.max_pending:
+            self.stats["dropped"] += 1
+            return False
+
+        self.pending += 1
+        self.stats["submitted"] += 1
+
+        future = asyncio.get_running_loop().run_in_executor(self.executor, run_job, job)
+        previous = self.channel_tails.get(job.channel)
+        task = asyncio.create_task(self._deliver(job.channel, future, previous, on_result))
+        self.channel_tails[job.channel] = task
+        return True
+
+    async def _deliver(self, channel: str, future: asyncio.Future, previous: asyncio.Task | None,
+                       on_result: Callable[[ButtResult], Awaitable[None]]):
+        try:
+            try:
+                result = await future
+            except Exception as e:
+                self.stats["errors"] += 1
+                get_logger_for_channel(channel).error("Errored buttifying a message: %s", e)
+                return
+            finally:
+                # Don't deliver before the channel's earlier messages, whether this one worked or not
+                if previous is not None and not previous.done():
+                    await asyncio.wait([previous])
+
+            self.stats["completed"] += 1
+            self.stats["queue_seconds_total"] += result.queue_seconds
+            self.stats["queue_seconds_max"] = max(self.stats["queue_seconds_max"], result.queue_seconds)
+            self.stats["compute_seconds_total"] += result.compute_seconds
+            self.stats["compute_seconds_max"] = max(self.stats["compute_seconds_max"], result.compute_seconds)
+
+            try:
+                await on_result(result)
+            except Exception as e:
+                self.stats["errors"] += 1
+                get_logger_for_channel(channel).error("Errored sending a buttified message: %s", e)
+        finally:
+            self.pending -= 1
+            if self.channel_tails.get(channel) is asyncio.current_task():
+                del self.channel_tails[channel]
+
+    @property
+    def timing(self) -> dict:
+        """Average time jobs spent waiting for a worker vs being buttified"""
+        completed = self.stats["completed"]
+        return {
+            "queue_seconds_avg": self.stats["queue_seconds_total"] / completed if completed else 0.0,
+            "compute_seconds_avg": self.stats["compute_seconds_total"] / completed if completed else 0.0,
+        }
+
+    async def close(self):
+        # Let the jobs already submitted finish
+        tails = list(self.channel_tails.values())
+        if tails:
+            await asyncio.wait(tails)
+        await asyncio.to_thread(self.executor.shutdown)
@@ -0,0 +1,21 @@
+import pytest
+from buttify_cli import buttify_chunk, make_job
+
+DEFAULTS = {"channel": "cli", "word": "butt", "random_words_enabled": False, "random_words_list": [],
+            "per_sentence": 10, "min_spacing": 2}
+
+
+@pytest.mark.parametrize("line", ['{"content": 5}', '{"content": null}', '{"content": ["hi"]}',
+                                  '{"content": "hi", "word": 3}', '{"content": "hi", "channel": {}}'])
+def test_non_string_fields_are_a_value_error(line):
+    with pytest.raises(ValueError):
+        make_job(line, DEFAULTS)
+
+
+def test_bad_lines_are_reported_without_stopping_the_chunk():
+    chunk = list(enumerate(['{"content": 5}', "", "not json {", '{"content": "absolutely wonderful"}',
+                            '{"content": "hi", "word": 3}', "{broken"], start=1))
+    results = buttify_chunk(chunk, DEFAULTS, seed=1)
+    assert [result["line"] for result in results] == [1, 3, 4, 5, 6]
+    assert ["error" in result for result in results] == [True, False, False, True, True]
+    assert results[2]["input"] == "absolutely wonderful"
@@ -0,0 +1,39 @@
+import pytest
+from buttify_funcs import get_emote_names
+
+MESSAGE = "Kappa hi Kappa PogChamp"
+
+
+@pytest.mark.parametrize("tag, names", [
+    (None, set()),
+    ("", set()),
+    ("25:0-4", {"Kappa"}),
+    # Only the first range of each emote is read, every use is the same word
+    ("25:0-4,9-13/88:15-22", {"Kappa", "PogChamp"}),
+    ("25:0-4/", {"Kappa"}),
+])
+def test_emote_names_come_from_the_tag(tag, names):
+    assert get_emote_names(MESSAGE, tag) == names
+
+
+@pytest.mark.parametrize("tag", [
+    "25",
+    "25:",
+    "25:abc",
+    "25:5",
+    "25:-4",
+    "25:a-4",
+    "25:4-a",
+    "25:10-4",
+    "/",
+    "//",
+    # Past the end of the message, e.g. a tag for different text
+    "25:0-100",
+    "25:23-27",
+])
+def test_malformed_emote_tags_are_skipped(tag):
+    assert get_emote_names(MESSAGE, tag) == frozenset()
+
+
+def test_only_the_malformed_emote_is_skipped():
+    assert get_emote_names(MESSAGE, "25:a-4/88:15-22/1902:15-99") == {"PogChamp"}
@@ -0,0 +1,58 @@
+from copypasta_funcs import REPEAT_BYPASS_CHARACTER, RepeatWindow, normalize_message
+
+
+def test_normalized_copies_are_the_same_message():
+    assert normalize_message(f" GREG greg {REPEAT_BYPASS_CHARACTER}") == "greg greg"
+    assert normalize_message("greg  greg") != normalize_message("greg greg")
+
+
+def test_wave_starts_at_the_threshold():
+    window = RepeatWindow(size=10, seconds=30, threshold=3)
+    assert window.seen("greg", 0.0) is None
+    assert window.seen("GREG", 1.0) is None
+    key = window.seen(f"greg {REPEAT_BYPASS_CHARACTER}", 2.0)
+    assert key is not None
+    assert window.seen("greg", 3.0) == key
+    assert window.seen("something else", 4.0) is None
+
+
+def test_messages_older_than_the_window_expire():
+    window = RepeatWindow(size=10, seconds=30, threshold=3)
+    window.seen("greg", 0.0)
+    window.seen("greg", 10.0)
+    # The first copy is more than 30 seconds old by now, so this is only the second that counts
+    assert window.seen("greg", 35.0) is None
+    assert window.counts[hash("greg")] == 2
+    assert window.seen("greg", 36.0) is not None
+
+    # Everything has gone quiet for longer than the window
+    window.seen("other", 100.0)
+    assert window.counts == {hash("other"): 1}
+    assert len(window.entries) == 1
+
+
+def test_full_window_forgets_the_oldest_message():
+    window = RepeatWindow(size=3, seconds=30, threshold=2)
+    window.seen("greg", 0.0)
+    window.seen("a", 1.0)
+    window.seen("b", 2.0)
+    # The first greg made way for c, so this greg is the only one
+    window.seen("c", 3.0)
+    assert window.seen("greg", 4.0) is None
+    assert len(window.entries) == 3
+    assert sum(window.counts.values()) == 3
+
+
+def test_syllables_are_split_once_per_wave_and_forgotten_with_it():
+    window = RepeatWindow(size=10, seconds=30, threshold=2)
+    window.seen("absolutely wonderful", 0.0)
+    key = window.seen("absolutely wonderful", 1.0)
+    syllables = window.syllables_for(key, "absolutely wonderful", frozenset())
+    assert syllables == (("ab", "so", "lutely"), ("won", "der", "ful"))
+    assert window.syllables_for(key, "absolutely wonderful", frozenset()) is syllables
+    # A copy that only matches once normalized is split again
+    assert window.syllables_for(key, "Absolutely wonderful", frozenset())[0][0] == "Ab"
+
+    # Once the last copy expires the wave is over
+    window.seen("other", 100.0)
+    assert key not in window.syllables
@@ -0,0 +1,42 @@
+import json
+import os
+import pytest
+import json_funcs
+from json_funcs import add_ignore_list, load_ignore_list, remove_ignore_list, run_in_background
+
+
+def wait_for_saves():
+    run_in_background(lambda: None).result()
+
+
+def test_ignore_list_is_saved_in_the_background(tmp_path):
+    path = str(tmp_path / "ignored.json")
+    ignored = set()
+    assert add_ignore_list(path, ignored, "greg")
+    assert add_ignore_list(path, ignored, "alli")
+    assert not add_ignore_list(path, ignored, "greg")
+    assert remove_ignore_list(path, ignored, "alli")
+    wait_for_saves()
+
+    assert load_ignore_list(path) == {"greg"}
+    assert os.listdir(tmp_path) == ["ignored.json"]
+
+
+def test_failed_ignore_list_save_keeps_the_old_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "ignored.json")
+    ignored = set()
+    add_ignore_list(path, ignored, "greg")
+    wait_for_saves()
+
+    def crash(_):
+        raise OSError("disk full")
+
+    # Fails part way through writing the new list
+    monkeypatch.setattr(json_funcs.os, "fsync", crash)
+    future = json_funcs.save_to_file_in_background(path, ["greg", "alli"])
+    with pytest.raises(OSError):
+        future.result()
+
+    with open(path, "r", encoding="utf8") as ignored_file:
+        assert json.load(ignored_file) == ["greg"]
+    assert os.listdir(tmp_path) == ["ignored.json"]
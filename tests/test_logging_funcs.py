@@ -0,0 +1,59 @@
+import logging
+from logging.handlers import QueueHandler
+import pytest
+import logging_funcs
+from logging_funcs import ChannelFileHandler, get_logger_for_channel, start_background_logging, \
+    stop_background_logging
+
+
+@pytest.fixture
+def log_dir(tmp_path, monkeypatch):
+    # A handler and loggers of their own, so nothing is written to the real streamer_logs
+    monkeypatch.setattr(logging_funcs, "channel_file_handler", ChannelFileHandler(str(tmp_path)))
+    monkeypatch.setattr(logging_funcs, "channel_loggers", {})
+    yield tmp_path
+    stop_background_logging()
+    for logger in logging_funcs.channel_loggers.values():
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+    logging_funcs.channel_file_handler.close()
+
+
+def channel_logger(name: str, monkeypatch) -> logging.Logger:
+    # pytest puts its own handlers on the root logger, which would stop the channel logger getting one
+    monkeypatch.setattr(logging.getLogger(name), "propagate", False)
+    return get_logger_for_channel(name)
+
+
+def read_log(log_dir, channel_name: str) -> str:
+    return (log_dir / f"{channel_name}.log").read_text(encoding="utf8")
+
+
+def test_loggers_write_directly_after_background_logging_stops(log_dir, monkeypatch):
+    start_background_logging()
+    logger = channel_logger("gregtest_stop", monkeypatch)
+    assert isinstance(logger.handlers[0], QueueHandler)
+    logger.info("before stopping")
+
+    stop_background_logging()
+    assert logging_funcs.log_queue is None
+    assert logger.handlers == [logging_funcs.channel_file_handler]
+    logger.info("after stopping")
+    channel_logger("gregtest_new", monkeypatch).info("new logger")
+
+    assert "before stopping" in read_log(log_dir, "gregtest_stop")
+    assert "after stopping" in read_log(log_dir, "gregtest_stop")
+    assert "new logger" in read_log(log_dir, "gregtest_new")
+
+
+def test_loggers_move_to_the_queue_when_background_logging_starts(log_dir, monkeypatch):
+    logger = channel_logger("gregtest_start", monkeypatch)
+    logger.setLevel(logging.INFO)
+    logger.info("written directly")
+
+    start_background_logging()
+    assert len(logger.handlers) == 1 and isinstance(logger.handlers[0], QueueHandler)
+    logger.info("written from the queue")
+    stop_background_logging()
+
+    assert read_log(log_dir, "gregtest_start").count("written") == 2
@@ -0,0 +1,118 @@
+import asyncio
+import time
+import pytest
+from send_funcs import BUTT_PRIORITY, COMMAND_PRIORITY, SendScheduler, TokenBucket
+
+
+class FakeChannel:
+    def __init__(self, name: str, sent: list):
+        self.name = name
+        self.sent = sent
+
+    async def send(self, content: str):
+        self.sent.append((self.name, content, time.monotonic()))
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, timeout=5))
+
+
+def test_token_bucket_refills_over_the_period():
+    bucket = TokenBucket(2, 1.0)
+    now = bucket.updated
+    assert bucket.has_token(now)
+    bucket.take()
+    bucket.take()
+    assert not bucket.has_token(now)
+    assert bucket.wait_time(now) == pytest.approx(0.5)
+    assert bucket.has_token(now + 0.5)
+    assert not bucket.is_full(now + 0.5)
+    # Never more than the capacity however long it's left
+    assert bucket.is_full(now + 100)
+    assert bucket.tokens == 2
+
+
+def test_command_replies_go_before_buttified_messages():
+    async def main():
+        sent = []
+        scheduler = SendScheduler()
+        butt = scheduler.enqueue(FakeChannel("a", sent), "butt", BUTT_PRIORITY, 10)
+        reply = scheduler.enqueue(FakeChannel("b", sent), "reply", COMMAND_PRIORITY)
+        assert await reply and await butt
+        await scheduler.close()
+        return sent
+
+    assert [content for _, content, _ in run(main())] == ["reply", "butt"]
+
+
+def test_channel_limit_spaces_out_a_channels_messages():
+    async def main():
+        sent = []
+        channel = FakeChannel("a", sent)
+        scheduler = SendScheduler(channel_limit=1, channel_period=0.2)
+        first = scheduler.enqueue(channel, "first")
+        second = scheduler.enqueue(channel, "second")
+        other = scheduler.enqueue(FakeChannel("b", sent), "other")
+        await asyncio.gather(first, second, other)
+        await scheduler.close()
+        return sent
+
+    sent = run(main())
+    # The other channel doesn't wait behind the first one's limit
+    assert [content for _, content, _ in sent] == ["first", "other", "second"]
+    assert sent[2][2] - sent[0][2] >= 0.15
+
+
+def test_buttified_messages_past_their_deadline_are_dropped():
+    async def main():
+        sent = []
+        channel = FakeChannel("a", sent)
+        # One message per minute, so only the first goes out
+        scheduler = SendScheduler(global_limit=1, global_period=60)
+        first = scheduler.enqueue(channel, "first")
+        late = scheduler.enqueue(FakeChannel("b", sent), "late", BUTT_PRIORITY, 0.05)
+        waiting = scheduler.enqueue(FakeChannel("c", sent), "waiting")
+        assert await first
+        assert not await late
+        assert scheduler.stats["dropped_stale"] == 1
+        # No deadline, so it waits until the scheduler is closed
+        assert not waiting.done()
+        await scheduler.close()
+        assert not await waiting
+        return sent
+
+    assert [content for _, content, _ in run(main())] == ["first"]
+
+
+def test_buttified_messages_are_dropped_once_max_queued_are_waiting():
+    async def main():
+        sent = []
+        scheduler = SendScheduler(global_limit=1, global_period=60, max_queued=2)
+        queued = [scheduler.enqueue(FakeChannel(name, sent), name, BUTT_PRIORITY, 10) for name in "ab"]
+        full = scheduler.enqueue(FakeChannel("c", sent), "c", BUTT_PRIORITY, 10)
+        assert full.done() and not full.result()
+        assert scheduler.stats["dropped_full"] == 1
+        # Command replies are queued however full it is
+        reply = scheduler.enqueue(FakeChannel("d", sent), "reply")
+        assert scheduler.depth == 3
+        assert await reply
+        await scheduler.close()
+        assert [future.result() for future in queued] == [False, False]
+        return sent
+
+    assert [content for _, content, _ in run(main())] == ["reply"]
+
+
+def test_cancelled_messages_are_skipped_without_using_a_token():
+    async def main():
+        sent = []
+        scheduler = SendScheduler(global_limit=1, global_period=60)
+        cancelled = scheduler.enqueue(FakeChannel("a", sent), "cancelled")
+        cancelled.cancel()
+        kept = scheduler.enqueue(FakeChannel("b", sent), "kept")
+        assert await kept
+        assert scheduler.stats["cancelled"] == 1
+        await scheduler.close()
+        return sent
+
+    assert [content for _, content, _ in run(main())] == ["kept"]
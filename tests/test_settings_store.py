@@ -0,0 +1,199 @@
+import asyncio
+import json
+import sqlite3
+import pytest
+from channel_state import ChannelState
+from settings_store import SettingsStore, SqliteSettingsStore, create_settings_store
+
+
+@pytest.fixture
+def sqlite_store(tmp_path):
+    store = SqliteSettingsStore(str(tmp_path / "settings.db"), flush_delay=0)
+    yield store
+    asyncio.run(store.close())
+
+
+def saved_row(store: SqliteSettingsStore, channel: str) -> tuple:
+    return store.connection.execute("SELECT rate, word FROM channels WHERE name = ?", (channel,)).fetchone()
+
+
+def test_failed_flush_keeps_fields_changed_during_the_write(sqlite_store, monkeypatch):
+    state = sqlite_store.channel_settings["greg"] = ChannelState("greg")
+    # Outside an event loop this is written straight away
+    sqlite_store.mark_dirty("greg")
+
+    write = sqlite_store._write
+
+    def fail_after_a_change(snapshot, changed):
+        # Another command changes the channel while the write is on its thread, then the write fails
+        sqlite_store.dirty["greg"] = {"word"}
+        raise sqlite3.OperationalError("database is locked")
+
+    state.rate = 50
+    sqlite_store.dirty["greg"] = {"rate"}
+    monkeypatch.setattr(sqlite_store, "_write", fail_after_a_change)
+    with pytest.raises(sqlite3.OperationalError):
+        asyncio.run(sqlite_store.flush())
+    assert sqlite_store.dirty == {"greg": {"rate", "word"}}
+
+    state.word = "greg"
+    monkeypatch.setattr(sqlite_store, "_write", write)
+    sqlite_store.flush_now()
+    assert saved_row(sqlite_store, "greg") == (50, "greg")
+
+
+def test_failed_flush_of_a_whole_channel_stays_whole(sqlite_store, monkeypatch):
+    sqlite_store.channel_settings["greg"] = ChannelState("greg")
+    sqlite_store.dirty["greg"] = None
+
+    def fail_after_a_change(snapshot, changed):
+        sqlite_store.dirty["greg"] = {"word"}
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(sqlite_store, "_write", fail_after_a_change)
+    with pytest.raises(sqlite3.OperationalError):
+        asyncio.run(sqlite_store.flush())
+    assert sqlite_store.dirty == {"greg": None}
+
+
+def test_incomplete_backend_fails_when_created():
+    class NoWrites(SettingsStore):
+        def _load(self) -> dict:
+            return {}
+
+    with pytest.raises(TypeError):
+        NoWrites()
+
+
+def test_single_field_changes_only_update_that_column(sqlite_store, tmp_path):
+    state = sqlite_store.channel_settings["greg"] = ChannelState("greg", random_words_list=["bum"])
+    sqlite_store.mark_dirty("greg")
+
+    # Changed by something else, the store's single-field write must leave it alone
+    other = sqlite3.connect(str(tmp_path / "settings.db"))
+    with other:
+        other.execute("UPDATE channels SET word = 'toot' WHERE name = 'greg'")
+    other.close()
+
+    state.rate = 99
+    sqlite_store.mark_dirty("greg", "rate")
+    assert saved_row(sqlite_store, "greg") == (99, "toot")
+
+    state.random_words.add("greg", 4)
+    sqlite_store.mark_dirty("greg", "random_words_list")
+    assert saved_row(sqlite_store, "greg") == (99, "toot")
+    assert sqlite_store.connection.execute(
+        "SELECT word, weight FROM random_words WHERE channel = 'greg' ORDER BY position").fetchall() == \
+        [("bum", 1), ("greg", 4)]
+
+    # The whole channel is written again when no single field is given
+    sqlite_store.mark_dirty("greg")
+    assert saved_row(sqlite_store, "greg") == (99, "butt")
+
+
+def test_removed_channels_are_deleted_with_their_words(sqlite_store):
+    sqlite_store.channel_settings["greg"] = ChannelState("greg", random_words_list=["bum", "toot"])
+    sqlite_store.mark_dirty("greg")
+
+    del sqlite_store.channel_settings["greg"]
+    sqlite_store.mark_removed("greg")
+    assert saved_row(sqlite_store, "greg") is None
+    assert sqlite_store.connection.execute("SELECT COUNT(*) FROM random_words").fetchone() == (0,)
+
+
+def test_settings_load_back_as_saved(sqlite_store, tmp_path):
+    sqlite_store.channel_settings["greg"] = ChannelState("greg", 50, "bum", True, ["butt", "greg"], {"greg": 3},
+                                                         extra={"colour": "pink"})
+    sqlite_store.mark_dirty("greg")
+
+    again = SqliteSettingsStore(str(tmp_path / "settings.db"))
+    try:
+        loaded = again.load()
+        assert loaded["greg"].to_dict() == {"rate": 50, "word": "bum", "random_words_enabled": True,
+                                            "random_words_list": ["butt", "greg"],
+                                            "random_words_weights": {"greg": 3}, "colour": "pink"}
+    finally:
+        asyncio.run(again.close())
+
+
+def test_databases_from_before_weights_get_a_weight_column(tmp_path):
+    path = str(tmp_path / "old.db")
+    old = sqlite3.connect(path)
+    with old:
+        old.executescript("""
+            CREATE TABLE channels (name TEXT PRIMARY KEY, rate INTEGER NOT NULL, word TEXT NOT NULL,
+                                   random_words_enabled INTEGER NOT NULL, extra TEXT) WITHOUT ROWID;
+            CREATE TABLE random_words (channel TEXT NOT NULL REFERENCES channels (name) ON DELETE CASCADE,
+                                       position INTEGER NOT NULL, word TEXT NOT NULL,
+                                       PRIMARY KEY (channel, position)) WITHOUT ROWID;
+            INSERT INTO channels VALUES ('greg', 30, 'butt', 1, NULL);
+            INSERT INTO random_words VALUES ('greg', 0, 'bum'), ('greg', 1, 'toot');
+        """)
+    old.close()
+
+    store = SqliteSettingsStore(path)
+    try:
+        columns = {column[1] for column in store.connection.execute("PRAGMA table_info(random_words)")}
+        assert "weight" in columns
+        state = store.load()["greg"]
+        assert list(state.random_words) == ["bum", "toot"]
+        assert state.random_words.weight_dict() == {}
+
+        state.random_words.add("toot", 2)
+        store.mark_dirty("greg", "random_words_list")
+        assert store.load()["greg"].random_words.weight_dict() == {"toot": 2}
+    finally:
+        asyncio.run(store.close())
+
+
+def test_reload_returns_only_what_something_else_changed(sqlite_store, tmp_path):
+    for name in ("greg", "alli", "bum"):
+        sqlite_store.channel_settings[name] = ChannelState(name)
+        sqlite_store.mark_dirty(name)
+    sqlite_store.load()
+    assert sqlite_store.reload() is None
+
+    # The store's own writes aren't picked up as changes
+    sqlite_store.channel_settings["greg"].rate = 40
+    sqlite_store.mark_dirty("greg", "rate")
+    assert sqlite_store.reload() is None
+
+    other = sqlite3.connect(str(tmp_path / "settings.db"))
+    with other:
+        other.execute("UPDATE channels SET word = 'toot' WHERE name = 'alli'")
+        other.execute("DELETE FROM channels WHERE name = 'bum'")
+        other.execute("INSERT INTO channels VALUES ('new', 30, 'butt', 0, NULL)")
+    other.close()
+
+    changed, removed = sqlite_store.reload()
+    assert set(changed) == {"alli", "new"}
+    assert changed["alli"]["word"] == "toot"
+    assert removed == ["bum"]
+    assert sqlite_store.reload() is None
+
+
+def test_json_settings_are_migrated_to_a_new_database(tmp_path):
+    json_path, ignored_path, db_path = (str(tmp_path / name) for name in ("s.json", "i.json", "s.db"))
+    settings = {"greg": {"rate": 50, "word": "bum", "random_words_enabled": True,
+                         "random_words_list": ["butt", "greg"], "random_words_weights": {"greg": 3}},
+                "alli": {"rate": 30, "word": "butt", "random_words_enabled": False, "random_words_list": []}}
+    with open(json_path, "w", encoding="utf8") as json_file:
+        json.dump(settings, json_file)
+    with open(ignored_path, "w", encoding="utf8") as ignored_file:
+        json.dump(["spammer"], ignored_file)
+
+    store = create_settings_store("sqlite", json_path, ignored_path, db_path)
+    try:
+        assert {name: state.to_dict() for name, state in store.load().items()} == settings
+        assert store.load_ignored() == {"spammer"}
+    finally:
+        asyncio.run(store.close())
+
+    # Only the first time, after that the database is what's kept up to date
+    with open(ignored_path, "w", encoding="utf8") as ignored_file:
+        json.dump(["spammer", "someone"], ignored_file)
+    store = create_settings_store("sqlite", json_path, ignored_path, db_path)
+    try:
+        assert store.load_ignored() == {"spammer"}
+    finally:
+        asyncio.run(store.close())
@@ -0,0 +1,40 @@
+"""
+Pins syllables_split and syllables_to_sentence to the output of the tokenizer from before the single regex pass.
+golden_syllables.json holds that tokenizer's output for every message in benchmarks/chat_corpus.jsonl plus edge
+cases (dashes, backslashes, regex metacharacters, the repeat bypass character, only punctuation, empty messages).
+"""
+import json
+import os
+import pytest
+from syllable_funcs import hyphenation_cache, syllables_split, syllables_to_sentence
+
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), "golden_syllables.json")
+
+with open(GOLDEN_PATH, "r", encoding="utf8") as golden_file:
+    GOLDEN = json.load(golden_file)
+
+
+@pytest.mark.parametrize("case", GOLDEN, ids=lambda case: repr(case["input"])[:40])
+def test_syllables_split_matches_baseline(case):
+    assert syllables_split(case["input"]) == case["syllables"]
+
+
+@pytest.mark.parametrize("case", GOLDEN, ids=lambda case: repr(case["input"])[:40])
+def test_syllables_to_sentence_matches_baseline(case):
+    assert syllables_to_sentence(syllables_split(case["input"])) == case["sentence"]
+
+
+def test_cached_words_match_baseline():
+    # The second time through every word comes from the hyphenation cache
+    hyphenation_cache.clear()
+    for case in GOLDEN:
+        syllables_split(case["input"])
+    for case in GOLDEN:
+        assert syllables_split(case["input"]) == case["syllables"]
+
+
+def test_split_syllables_can_be_changed():
+    # Each call gets its own lists, replacing a syllable must not change the cached ones
+    first = syllables_split("absolutely wonderful")
+    first[0][0] = "butt"
+    assert syllables_split("absolutely wonderful") == [["ab", "so", "lutely"], ["won", "der", "ful"]]
@@ -0,0 +1,86 @@
+import random
+from collections import Counter
+import pytest
+from word_list_funcs import AliasTable, EMPTY_TABLE, WeightedWordList
+
+DRAWS = 100_000
+
+
+def proportions(table: AliasTable, draws: int = DRAWS) -> dict[str, float]:
+    rng = random.Random(1234)
+    counts = Counter(table.choose(rng) for _ in range(draws))
+    return {word: count / draws for word, count in counts.items()}
+
+
+@pytest.mark.parametrize("weights", [[1, 1, 1], [1, 5], [3, 1, 10, 6], [1, 100], [7]])
+def test_alias_table_picks_in_proportion_to_weight(weights):
+    words = [f"word{i}" for i in range(len(weights))]
+    picked = proportions(AliasTable(words, weights))
+    total = sum(weights)
+    for word, weight in zip(words, weights):
+        assert picked.get(word, 0.0) == pytest.approx(weight / total, abs=0.01)
+
+
+def test_alias_table_columns_are_valid_probabilities():
+    table = AliasTable(["a", "b", "c", "d"], [1, 2, 3, 94])
+    assert all(0.0 <= probability <= 1.0 for probability in table.probabilities)
+    assert all(0 <= alias < len(table) for alias in table.aliases)
+
+
+def test_empty_word_list_uses_the_shared_empty_table():
+    words = WeightedWordList()
+    assert len(words) == 0
+    assert words.table is EMPTY_TABLE
+
+
+def test_add_and_remove_keep_positions_in_step():
+    words = WeightedWordList(["butt", "greg", "bum", "toot"])
+    assert words.remove("greg")
+    assert not words.remove("greg")
+    # The last word was swapped into the gap
+    assert words.words == ["butt", "toot", "bum"]
+    assert all(words.words[position] == word for word, position in words.positions.items())
+    assert "greg" not in words
+    assert words.add("greg")
+    assert not words.add("greg")
+    assert list(words) == ["butt", "toot", "bum", "greg"]
+
+    assert words.remove("greg")
+    assert words.remove("butt")
+    assert words.remove("bum")
+    assert words.remove("toot")
+    assert len(words) == 0 and words.positions == {}
+    assert words.table is EMPTY_TABLE
+
+
+def test_table_is_only_rebuilt_after_a_change():
+    words = WeightedWordList(["butt", "greg"])
+    table = words.table
+    assert words.table is table
+    assert not words.add("butt")
+    assert words.table is table
+
+    assert words.add("bum")
+    assert words.table is not table
+    assert set(words.table.words) == {"butt", "greg", "bum"}
+
+
+def test_reweighting_changes_the_proportions():
+    words = WeightedWordList(["butt", "greg"])
+    assert words.add("greg", 9)
+    assert words.weight("greg") == 9
+    # Same weight again changes nothing
+    assert not words.add("greg", 9)
+    picked = proportions(words.table)
+    assert picked["greg"] == pytest.approx(0.9, abs=0.01)
+
+    words.remove("butt")
+    assert proportions(words.table) == {"greg": 1.0}
+
+
+def test_weights_round_trip_through_the_saved_dict():
+    words = WeightedWordList(["butt", "greg", "bum"], {"greg": 5})
+    assert words.weight_dict() == {"greg": 5}
+    assert words.describe() == ["butt", "greg (x5)", "bum"]
+    again = WeightedWordList(words.words, words.weight_dict())
+    assert again.words == words.words and again.weights == words.weights